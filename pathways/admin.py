@@ -1,46 +1,176 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.contrib.admin.widgets import AdminFileWidget
+from django.db.models import Count, Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.html import format_html
 from simple_history.admin import SimpleHistoryAdmin
 
 from pathways.models import Application, Document, ForgivenessApplication, EmailCommunication
+from pathways.models import ThresholdSchedule, IncomeThreshold
+from pathways.transitions import transitionStatus
+from pathways import eligibility
+from pathways import exports
+from pathways import helpers
+from pathways import images
+from pathways import tasks
+from pathways import uploads
 
 # Register your models here.
 
+def exportCsvResponse(queryset):
+    """Streams the selected applications as a CSV attachment
+
+    The changelist's aggregate annotations are dropped by selecting the rows again by id.
+    """
+    model = queryset.model
+    rows = model.objects.filter(pk__in=queryset.values('pk'))
+    response = StreamingHttpResponse(exports.iterCsvLines(rows), content_type='text/csv')
+    filename = f'{model._meta.model_name}-{timezone.localdate():%Y-%m-%d}.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @admin.register(Document)
 class DocumentAdmin(SimpleHistoryAdmin):
     pass
 
 
+class SignedFile:
+    """A stored file name with a URL signed ahead of time, as rendered by SignedFileWidget"""
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+    def __str__(self):
+        return self.name
+
+
+class SignedFileWidget(AdminFileWidget):
+    """Links to the current file with a URL from signed_urls instead of signing it again"""
+    def __init__(self, signed_urls, attrs=None):
+        super().__init__(attrs)
+        self.signed_urls = signed_urls
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        if self.is_initial(value) and value.name in self.signed_urls:
+            context['widget']['value'] = SignedFile(value.name, self.signed_urls[value.name])
+        return context
+
+
 class DocumentInline(admin.TabularInline):
     model = Document
     extra = 0
+    readonly_fields = ['preview']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # URLs of the documents and thumbnails shown, signed once per page by get_formset()
+        self.signed_urls = {}
+        self.signed_application_id = None
+
+    def get_formset(self, request, obj=None, **kwargs):
+        # get_formset() also runs while building the form's fieldsets
+        if obj is not None and obj.pk != self.signed_application_id:
+            self.signed_application_id = obj.pk
+            docs = list(Document.objects.filter(application=obj).values_list('id', 'doc_file', 'thumbnail'))
+            self.signed_urls.update(uploads.getSignedUrls(
+                [doc_file for _, doc_file, _ in docs]
+                + [thumbnail for _, _, thumbnail in docs if thumbnail != images.NO_THUMBNAIL]
+            ))
+            # Thumbnails are made lazily for documents uploaded before they existed,
+            # without re-encoding the documents themselves. Images that could not be
+            # decoded have NO_THUMBNAIL and are not queued again.
+            missing = [doc_id for doc_id, doc_file, thumbnail in docs
+                       if doc_file and not thumbnail and images.isImageName(doc_file)]
+            if missing:
+                tasks.queue_thumbnails(missing)
+        return super().get_formset(request, obj, **kwargs)
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'doc_file':
+            kwargs['widget'] = SignedFileWidget(self.signed_urls)
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
+    def preview(self, obj):
+        if not obj.thumbnail or obj.thumbnail.name == images.NO_THUMBNAIL:
+            return '-'
+        return format_html(
+            '<a href="{}" target="_blank"><img src="{}" alt="{}" loading="lazy"></a>',
+            self.signed_urls.get(obj.doc_file.name) or obj.doc_file.url,
+            self.signed_urls.get(obj.thumbnail.name) or obj.thumbnail.url,
+            obj.doc_type
+        )
+    preview.short_description = 'Preview'
+
+
+class DiscountTierFilter(admin.SimpleListFilter):
+    """Filters applications by the discount_tier annotated in ApplicationAdmin.get_queryset()"""
+    title = 'discount amount'
+    parameter_name = 'discount_tier'
+
+    def lookups(self, request, model_admin):
+        return [
+            (str(eligibility.VERY_LOW_INCOME_DISCOUNT), f'{eligibility.VERY_LOW_INCOME_DISCOUNT}%'),
+            (str(eligibility.LOW_INCOME_DISCOUNT), f'{eligibility.LOW_INCOME_DISCOUNT}%'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        if self.value() not in dict(self.lookup_choices):
+            raise IncorrectLookupParameters(f'Unknown discount tier {self.value()!r}')
+        return queryset.filter(discount_tier=int(self.value()))
 
 
 @admin.register(Application)
 class ApplicationAdmin(SimpleHistoryAdmin):
     inlines = [DocumentInline,]
-    actions = ['make_enrolled', 'make_denied']
+    actions = ['make_enrolled', 'make_denied', 'export_csv']
     list_display = [
         '__str__', 'date_created', 'full_name', 'account_name', 
         'rent_or_own', 'street_address', 'apt_unit', 'zip_code',
-        'phone_number', 'discount_amount', 'status'
+        'phone_number', 'discount_amount', 'has_residence_docs', 'has_eligible_docs', 'status'
     ]
     list_editable = ['status']
-    list_filter = ['status']
+    list_filter = ['status', DiscountTierFilter, 'created_at']
+    date_hierarchy = 'created_at'
+    search_fields = ['first_name', 'last_name', 'street_address', 'phone_number', 'email_address']
+
+    def get_queryset(self, request):
+        return eligibility.annotateDiscountTier(super().get_queryset(request)).annotate(
+            residence_doc_count=Count('document', filter=Q(document__doc_type='residence')),
+            eligible_doc_count=Count('document', filter=Q(document__doc_type__in=['income', 'benefits'])),
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        """Opens the application straight away when a search matches only one"""
+        query = request.GET.get(SEARCH_VAR, '')
+        if query and set(request.GET) == {SEARCH_VAR} and self.has_view_or_change_permission(request):
+            queryset, _ = self.get_search_results(request, Application.objects.all(), query)
+            match_count, app_id = helpers.matchApplications(queryset)
+            if match_count == 1:
+                return redirect('admin:pathways_application_change', app_id)
+        return super().changelist_view(request, extra_context)
 
     def make_enrolled(self, request, queryset):
-        for app in queryset:
-            app.status = 'enrolled'
-            app.save()
+        transitionStatus(queryset, 'enrolled', user=request.user)
     make_enrolled.short_description = "Enroll selected Discount Applications"
     make_enrolled.allowed_permissions = ('change',)
 
-    def make_denied(modeladmin, request, queryset):
-        for app in queryset:
-            app.status = 'denied'
-            app.save()
+    def make_denied(self, request, queryset):
+        transitionStatus(queryset, 'denied', user=request.user)
     make_denied.short_description = "Deny selected Discount Applications"
     make_denied.allowed_permissions = ('change',)
 
+    def export_csv(self, request, queryset):
+        return exportCsvResponse(queryset)
+    export_csv.short_description = "Export selected Discount Applications as CSV"
+    export_csv.allowed_permissions = ('view',)
+
     def apt_unit(self, obj):
         return obj.apartment_unit
 
@@ -53,54 +183,60 @@ class ApplicationAdmin(SimpleHistoryAdmin):
         return obj.account_first + ' ' + obj.account_middle + ' ' + obj.account_last
 
     def date_created(self, obj):
-        return obj.history.all()[0].history_date
+        return obj.created_at
+    date_created.admin_order_field = 'created_at'
+
+    def discount_amount(self, obj):
+        return obj.discount_tier
+    discount_amount.admin_order_field = 'discount_tier'
 
     def has_residence_docs(self, obj):
-        residence_count = Document.objects.filter(application=obj, doc_type='residence').count()
-        return residence_count > 0
+        return obj.residence_doc_count > 0
     has_residence_docs.boolean = True
-    has_residence_docs.description = 'Residence documents'
+    has_residence_docs.short_description = 'Residence documents'
 
     def has_eligible_docs(self, obj):
-        income_count = Document.objects.filter(application=obj, doc_type='income').count()
-        benefits_count = Document.objects.filter(application=obj, doc_type='benefits').count()
-        return income_count + benefits_count > 0
+        return obj.eligible_doc_count > 0
     has_eligible_docs.boolean = True
-    has_eligible_docs.description = 'Income or benefits documents'
+    has_eligible_docs.short_description = 'Income or benefits documents'
 
 
 @admin.register(ForgivenessApplication)
 class ForgivenessApplicationAdmin(SimpleHistoryAdmin):
-    actions = ['make_enrolled', 'make_denied']
+    actions = ['make_enrolled', 'make_denied', 'export_csv']
     list_display = [
         '__str__', 'date_created', 'full_name', 'street_address', 'apt_unit',
         'zip_code', 'phone_number', 'email_address', 'status'
     ]
     list_editable = ['status']
-    list_filter = ['status']
+    list_filter = ['status', 'created_at']
     list_per_page = 12
+    date_hierarchy = 'created_at'
 
-    def make_enrolled(modeladmin, request, queryset):
-        for app in queryset:
-            app.status = 'enrolled'
-            app.save()
+    def make_enrolled(self, request, queryset):
+        transitionStatus(queryset, 'enrolled', user=request.user)
 
     make_enrolled.short_description = "Enroll selected Amnesty Applications"
     make_enrolled.allowed_permissions = ('change',)
 
-    def make_denied(modeladmin, request, queryset):
-        for app in queryset:
-            app.status = 'denied'
-            app.save()
+    def make_denied(self, request, queryset):
+        transitionStatus(queryset, 'denied', user=request.user)
 
     make_denied.short_description = "Deny selected Amnesty Applications"
     make_denied.allowed_permissions = ('change',)
 
+    def export_csv(self, request, queryset):
+        return exportCsvResponse(queryset)
+
+    export_csv.short_description = "Export selected Amnesty Applications as CSV"
+    export_csv.allowed_permissions = ('view',)
+
     def apt_unit(self, obj):
         return obj.apartment_unit
 
     def date_created(self, obj):
-        return obj.history.all()[0].history_date
+        return obj.created_at
+    date_created.admin_order_field = 'created_at'
 
     def full_name(self, obj):
         if obj.middle_initial == '':
@@ -135,4 +271,17 @@ class EmailCommunicationAdmin(SimpleHistoryAdmin):
     ]
 
 
-admin.site.site_header = "GetWaterWiseBuffalo Admin"
\ No newline at end of file
+admin.site.site_header = "GetWaterWiseBuffalo Admin"
+
+
+class IncomeThresholdInline(admin.TabularInline):
+    model = IncomeThreshold
+    extra = 0
+    ordering = ['household_size']
+
+
+@admin.register(ThresholdSchedule)
+class ThresholdScheduleAdmin(admin.ModelAdmin):
+    inlines = [IncomeThresholdInline,]
+    list_display = ['version', 'effective_date']
+    ordering = ['-effective_date']
@@ -0,0 +1,148 @@
+import logging
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger('django')
+
+# A ThresholdSchedule's limits by household size, as kept in the process cache
+ThresholdTable = namedtuple('ThresholdTable', ['version', 'effective_date', 'income', 'very_low_income'])
+
+# Seconds a process keeps the schedules it loaded. Saving a schedule clears the cache
+# of the process that saved it, other processes reload it when it expires.
+THRESHOLD_CACHE_SECONDS = 300
+
+# Discount percentages, applicants at or under the very low income limit get the larger one
+VERY_LOW_INCOME_DISCOUNT = 90
+LOW_INCOME_DISCOUNT = 60
+
+class LoadedTables:
+    """Complete threshold schedules loaded from the database, oldest first"""
+    def __init__(self, tables):
+        self.tables = tables
+        self.effective_dates = [table.effective_date for table in tables]
+        self.expires = time.monotonic() + THRESHOLD_CACHE_SECONDS
+        # Table of each date looked up so far
+        self.tables_by_date = {}
+
+_loaded_tables = None
+
+def loadThresholdTables():
+    """Reads every ThresholdSchedule with limits for all household sizes
+
+    Schedules still missing a household size are left out until they are complete.
+
+    Returns
+    -------
+    tuple
+        ThresholdTables, oldest first
+    """
+    ThresholdSchedule = apps.get_model('pathways', 'ThresholdSchedule')
+    Application = apps.get_model('pathways', 'Application')
+    household_sizes = {size for size, _ in Application.HOUSEHOLD_SIZE_CHOICES}
+
+    tables = []
+    for schedule in ThresholdSchedule.objects.prefetch_related('thresholds').order_by('effective_date'):
+        thresholds = list(schedule.thresholds.all())
+        if {threshold.household_size for threshold in thresholds} != household_sizes:
+            logger.warning('Income threshold schedule %s is incomplete and was skipped', schedule.version)
+            continue
+        tables.append(ThresholdTable(
+            version=schedule.version,
+            effective_date=schedule.effective_date,
+            income={threshold.household_size: threshold.income_limit for threshold in thresholds},
+            very_low_income={threshold.household_size: threshold.very_low_income_limit for threshold in thresholds},
+        ))
+    if not tables:
+        raise ImproperlyConfigured('No complete ThresholdSchedule exists')
+    return tuple(tables)
+
+def getThresholdTables():
+    """Returns the cached threshold schedules, loading them if they expired
+
+    Returns
+    -------
+    LoadedTables
+    """
+    global _loaded_tables # pylint:disable=global-statement
+    loaded = _loaded_tables
+    if loaded is None or loaded.expires < time.monotonic():
+        loaded = LoadedTables(loadThresholdTables())
+        _loaded_tables = loaded
+    return loaded
+
+def clearThresholdCache():
+    """Makes the next lookup reload the threshold schedules"""
+    global _loaded_tables # pylint:disable=global-statement
+    _loaded_tables = None
+
+def getThresholdTable(on_date=None):
+    """Returns the ThresholdTable in force on a date
+
+    Dates before the first schedule use the first schedule.
+    Each date is looked up once per cache, later lookups are a dict hit.
+
+    Parameters
+    ----------
+    on_date : datetime.date
+        defaults to today
+    """
+    if on_date is None:
+        on_date = timezone.localdate()
+    loaded = getThresholdTables()
+    table = loaded.tables_by_date.get(on_date)
+    if table is None:
+        table = loaded.tables[max(bisect_right(loaded.effective_dates, on_date) - 1, 0)]
+        loaded.tables_by_date[on_date] = table
+    return table
+
+def getApplicationDate(application):
+    """Returns the local date an application was made, today if it is not saved yet"""
+    if application.created_at is None:
+        return timezone.localdate()
+    return timezone.localdate(application.created_at)
+
+def isIncomeEligible(household_size, annual_income, on_date=None):
+    """Returns whether an annual income is at or under the income limit for a household"""
+    return annual_income <= getThresholdTable(on_date).income[household_size]
+
+def getDiscountTier(household_size, annual_income, on_date=None):
+    """Returns the discount percentage for a household's annual income"""
+    if annual_income <= getThresholdTable(on_date).very_low_income[household_size]:
+        return VERY_LOW_INCOME_DISCOUNT
+    return LOW_INCOME_DISCOUNT
+
+def getDiscountTierExpression():
+    """Builds the SQL equivalent of getDiscountTier() for Application querysets
+
+    Each application is compared with the table in force on the date it was made,
+    so whole querysets can be annotated, filtered and sorted by tier in the database.
+
+    Returns
+    -------
+    Case
+        expression evaluating to VERY_LOW_INCOME_DISCOUNT or LOW_INCOME_DISCOUNT
+    """
+    tables = getThresholdTables().tables
+    whens = []
+    for index, table in enumerate(tables):
+        in_force = Q()
+        if index > 0:
+            in_force &= Q(created_at__date__gte=table.effective_date)
+        if index + 1 < len(tables):
+            in_force &= Q(created_at__date__lt=tables[index + 1].effective_date)
+        for household_size, max_income in table.very_low_income.items():
+            whens.append(When(
+                in_force & Q(household_size=household_size, annual_income__lte=max_income),
+                then=Value(VERY_LOW_INCOME_DISCOUNT),
+            ))
+    return Case(*whens, default=Value(LOW_INCOME_DISCOUNT), output_field=IntegerField())
+
+def annotateDiscountTier(queryset):
+    """Adds the discount_tier of each application to an Application queryset"""
+    return queryset.annotate(discount_tier=getDiscountTierExpression())
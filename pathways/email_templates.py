@@ -0,0 +1,54 @@
+import os
+
+from django.template import engines
+from django.template.loader import get_template
+from django.utils.html import escape, strip_tags
+from django.utils.translation import get_language
+
+# Rendered in place of the recipient's first name, then substituted per recipient
+FIRST_NAME_PLACEHOLDER = 'EMAILFIRSTNAMEPLACEHOLDER'
+
+# (template_name, language) -> (path, mtime, html_skeleton, text_skeleton), per worker process
+_skeleton_cache = {}
+
+def getEmailSkeletons(template_name):
+    """Returns the HTML and plain text versions of an email template
+
+    Both are rendered once with FIRST_NAME_PLACEHOLDER as first_name and cached
+    by template name and active language. The template file is compiled again
+    when its modification time changes.
+
+    Returns
+    -------
+    tuple
+        (html_skeleton, text_skeleton)
+    """
+    key = (template_name, get_language())
+    cached = _skeleton_cache.get(key)
+    if cached is not None:
+        path, mtime, html_skeleton, text_skeleton = cached
+        if os.path.getmtime(path) == mtime:
+            return html_skeleton, text_skeleton
+    else:
+        path = get_template(template_name).origin.name
+
+    # Compile from the file itself, the template loader may hold a stale copy
+    mtime = os.path.getmtime(path)
+    with open(path, encoding='utf-8') as template_file:
+        template = engines['django'].from_string(template_file.read())
+    html_skeleton = template.render({'first_name': FIRST_NAME_PLACEHOLDER})
+    text_skeleton = strip_tags(html_skeleton)
+
+    _skeleton_cache[key] = (path, mtime, html_skeleton, text_skeleton)
+    return html_skeleton, text_skeleton
+
+def renderEmail(template_name, first_name):
+    """Returns (text_content, html_content) of an email template for one recipient"""
+    html_skeleton, text_skeleton = getEmailSkeletons(template_name)
+    first_name = escape(first_name)
+    return (text_skeleton.replace(FIRST_NAME_PLACEHOLDER, first_name),
+            html_skeleton.replace(FIRST_NAME_PLACEHOLDER, first_name))
+
+def clearEmailCache():
+    """Empties the per-process email template cache"""
+    _skeleton_cache.clear()
@@ -0,0 +1,169 @@
+import csv
+
+from django.apps import apps
+
+from pathways import eligibility
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columns exported for each program, income_sources and the lookup fields are left out
+EXPORT_FIELDS = {
+    'Application': [
+        'id', 'household_size', 'has_household_benefits', 'annual_income', 'first_name', 'last_name',
+        'middle_initial', 'rent_or_own', 'street_address', 'apartment_unit', 'zip_code', 'phone_number',
+        'email_address', 'account_holder', 'account_first', 'account_last', 'account_middle',
+        'account_number', 'legal_agreement', 'signature', 'status', 'notes', 'created_at', 'updated_at',
+    ],
+    'ForgivenessApplication': [
+        'id', 'first_name', 'last_name', 'middle_initial', 'street_address', 'apartment_unit', 'zip_code',
+        'phone_number', 'email_address', 'status', 'notes', 'created_at', 'updated_at',
+    ],
+}
+
+# Metadata of its documents added after each discount application's fields
+DOCUMENT_COLUMNS = ['discount_tier', 'document_count', 'document_types', 'document_files']
+
+# Separates the documents listed in one cell
+DOCUMENT_SEPARATOR = ';'
+
+# Rows fetched per query while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+def hasDocuments(model):
+    """Returns whether exports of a model include document metadata"""
+    return model._meta.object_name == 'Application'
+
+def getExportColumns(model):
+    """Returns the header of an export of Application or ForgivenessApplication rows"""
+    columns = list(EXPORT_FIELDS[model._meta.object_name])
+    if hasDocuments(model):
+        columns += DOCUMENT_COLUMNS
+    return columns
+
+def iterExportRows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the export row of each application in a queryset, in id order
+
+    Applications and their documents are read with two iterators sorted by
+    application id and merged as they stream, so memory use stays the same
+    however many rows are exported.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Application or ForgivenessApplication queryset, without aggregate annotations
+    chunk_size : int
+        rows fetched per query
+
+    Yields
+    ------
+    tuple
+        values in getExportColumns() order
+    """
+    model = queryset.model
+    fields = EXPORT_FIELDS[model._meta.object_name]
+    if not hasDocuments(model):
+        yield from queryset.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size)
+        return
+
+    rows = (eligibility.annotateDiscountTier(queryset).order_by('id')
+            .values_list(*fields, 'discount_tier').iterator(chunk_size=chunk_size))
+    Document = apps.get_model('pathways', 'Document')
+    documents = (Document.objects.filter(application__in=queryset.values('id'))
+                 .order_by('application_id', 'id')
+                 .values_list('application_id', 'doc_type', 'doc_file').iterator(chunk_size=chunk_size))
+    doc = next(documents, None)
+    for row in rows:
+        doc_types, doc_files = [], []
+        while doc is not None and doc[0] <= row[0]:
+            if doc[0] == row[0]:
+                doc_types.append(doc[1])
+                doc_files.append(doc[2])
+            doc = next(documents, None)
+        yield row + (len(doc_types), DOCUMENT_SEPARATOR.join(doc_types), DOCUMENT_SEPARATOR.join(doc_files))
+
+# Spreadsheets read cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def escapeFormula(value):
+    """Makes a text cell start with ' if a spreadsheet would otherwise run it as a formula
+
+    Applicants fill in most exported fields, and the exports are opened in Excel.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+class Echo:
+    """File-like object returning what is written to it, so csv.writer can build lines one at a time"""
+    def write(self, value):
+        return value
+
+def iterCsvLines(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields an export of a queryset as CSV lines, starting with the header
+
+    Suits a StreamingHttpResponse, or writing to a file line by line.
+    Text that a spreadsheet would run as a formula is escaped with escapeFormula().
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(getExportColumns(queryset.model))
+    for row in iterExportRows(queryset, chunk_size):
+        yield writer.writerow([escapeFormula(value) for value in row])
+
+def getParquetType(model, column):
+    """Returns the pyarrow type a column is written as"""
+    if column == 'document_count' or column == 'discount_tier':
+        return pyarrow.int64()
+    if column in DOCUMENT_COLUMNS:
+        return pyarrow.string()
+    field = model._meta.get_field(column)
+    internal_type = field.get_internal_type()
+    if internal_type == 'BooleanField':
+        return pyarrow.bool_()
+    if internal_type in ('AutoField', 'IntegerField', 'PositiveIntegerField', 'PositiveSmallIntegerField'):
+        return pyarrow.int64()
+    if internal_type == 'DecimalField':
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if internal_type == 'DateTimeField':
+        return pyarrow.timestamp('us', tz='UTC')
+    return pyarrow.string()
+
+def writeParquet(queryset, path, chunk_size=EXPORT_CHUNK_SIZE):
+    """Writes an export of a queryset to a Parquet file, one row group per chunk
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Application or ForgivenessApplication queryset
+    path : str
+        file written
+    chunk_size : int
+        rows fetched per query and written per row group
+
+    Raises
+    ------
+    ImportError
+        if pyarrow is not installed
+    """
+    if pyarrow is None:
+        raise ImportError('Parquet exports need pyarrow, which is not installed')
+    columns = getExportColumns(queryset.model)
+    schema = pyarrow.schema([(column, getParquetType(queryset.model, column)) for column in columns])
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in iterExportRows(queryset, chunk_size):
+            batch.append(row)
+            if len(batch) == chunk_size:
+                writer.write_table(_makeTable(schema, batch))
+                batch = []
+        if batch:
+            writer.write_table(_makeTable(schema, batch))
+
+def _makeTable(schema, rows):
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array(values, type=field.type) for field, values in zip(schema, zip(*rows))],
+        schema=schema,
+    )
@@ -371,6 +371,22 @@ class DocumentForm(forms.Form):
         validators=[ACCEPTED_FILE_VALIDATOR], 
         required=False)
 
+    # Set instead of doc when the browser uploaded the file straight to storage
+    uploaded_name = forms.CharField(required=False, widget=forms.HiddenInput)
+    uploaded_filename = forms.CharField(required=False, max_length=255, widget=forms.HiddenInput)
+
+    def clean_doc(self):
+        """Validates every file posted for doc, since a FileField only cleans the last one"""
+        return [self.fields['doc'].clean(upload) for upload in self.files.getlist(self.add_prefix('doc'))]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # (name, filename) of each file uploaded straight to storage
+        uploads = zip(self.data.getlist(self.add_prefix('uploaded_name')),
+                      self.data.getlist(self.add_prefix('uploaded_filename')))
+        cleaned_data['uploads'] = [(name, filename) for name, filename in uploads if name]
+        return cleaned_data
+
 class LaterDocumentsForm(forms.Form):
     first_name = forms.CharField(
         label=_("What is your first name?"),
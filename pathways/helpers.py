@@ -1,13 +1,130 @@
-def getIncomeThresholds():
-    income_thresholds = {
-        1: 41850, 2: 47800, 3: 53800, 4: 59750, 
-        5: 64550, 6: 69350, 7: 74100, 8: 78900,
-    }
-    return income_thresholds
-
-def getVeryLowIncomeThresholds():
-    income_thresholds = {
-        1: 26150, 2: 29900, 3: 33650, 4: 37350, 
-        5: 40350, 6: 43350, 7: 46350, 8: 49350,
-    }
-    return income_thresholds
\ No newline at end of file
+import hashlib
+
+from django.conf import settings
+from django.utils import translation
+from django.utils.formats import get_format
+
+def normalizeName(name):
+    """Lowercases a name and collapses its whitespace"""
+    return ' '.join(name.split()).lower()
+
+def normalizeDigits(value):
+    """Keeps only the digits of a phone number or ZIP code"""
+    return ''.join(character for character in value if character.isdigit())
+
+def getLookupKey(first_name, last_name, zip_code, phone_number):
+    """Builds the normalized key returning applicants are matched on
+
+    Parameters
+    ----------
+    first_name : str
+    last_name : str
+    zip_code : str
+    phone_number : str
+        in any format, such as 716-555-5555, (716) 555-5555 or 7165555555
+
+    Returns
+    -------
+    str
+        key stored in Application.lookup_key
+    """
+    phone = normalizeDigits(phone_number)
+    if len(phone) == 11 and phone.startswith('1'):
+        phone = phone[1:]
+    return '|'.join([
+        normalizeName(last_name),
+        normalizeName(first_name),
+        normalizeDigits(zip_code)[:5],
+        phone,
+    ])
+
+# Match count returned by matchApplications() when several applications match
+MANY_MATCHES = 2
+
+def matchApplications(queryset):
+    """Tells apart zero, one and several matching applications
+
+    At most two primary keys are fetched, whatever the number of matching rows.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        applications matching the applicant's answers
+
+    Returns
+    -------
+    tuple
+        (match_count, app_id) where match_count is 0, 1 or MANY_MATCHES
+        and app_id is the id of the only match, otherwise None
+    """
+    ids = list(queryset.order_by().values_list('pk', flat=True)[:MANY_MATCHES])
+    if len(ids) == 1:
+        return 1, ids[0]
+    return len(ids), None
+
+def getFingerprint(instance, field_names):
+    """Hashes the answers an application is deduplicated on
+
+    Values go through each field's to_python() first, so answers read from
+    the session and values loaded from the database hash the same.
+
+    Parameters
+    ----------
+    instance : model instance
+        saved or unsaved application
+    field_names : tuple
+        names of the fields to hash, in order
+
+    Returns
+    -------
+    str
+        64 character SHA-256 hex digest
+    """
+    values = []
+    for name in field_names:
+        field = instance._meta.get_field(name) # pylint:disable=protected-access
+        values.append(str(field.to_python(getattr(instance, name))))
+    return hashlib.sha256('\x1f'.join(values).encode()).hexdigest()
+
+# Where the currency symbol goes in each language, {} being the grouped whole dollar amount
+CURRENCY_PATTERNS = {
+    'en': '${}',
+}
+DEFAULT_CURRENCY_PATTERN = '${}'
+
+_currency_formats = {}
+
+def getCurrencyFormat(language):
+    """Returns the pattern and thousand separator currency is written with in a language
+
+    They are looked up once per language and process. Unlike locale.setlocale(),
+    nothing process-wide is changed, so concurrent threads are unaffected.
+
+    Returns
+    -------
+    tuple
+        (pattern, thousand separator)
+    """
+    currency_format = _currency_formats.get(language)
+    if currency_format is None:
+        pattern = CURRENCY_PATTERNS.get(language, CURRENCY_PATTERNS.get(language.split('-')[0], DEFAULT_CURRENCY_PATTERN))
+        currency_format = (pattern, get_format('THOUSAND_SEPARATOR', lang=language, use_l10n=True))
+        _currency_formats[language] = currency_format
+    return currency_format
+
+def formatCurrency(amount, language=None):
+    """Writes an amount as whole dollars, such as $41,850
+
+    Parameters
+    ----------
+    amount : int or float
+        None or '' for an unanswered question, written as $0
+    language : str
+        language code, defaults to the active language
+
+    Returns
+    -------
+    str
+    """
+    pattern, separator = getCurrencyFormat(language or translation.get_language() or settings.LANGUAGE_CODE)
+    return pattern.format('{:,.0f}'.format(amount or 0).replace(',', separator))
@@ -0,0 +1,181 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, ImageSequence
+
+# Longest side, in pixels, of document images kept in storage
+MAX_DOCUMENT_DIMENSION = 2000
+
+# Bounding box, in pixels, of the thumbnails shown in the admin
+THUMBNAIL_SIZE = (200, 200)
+
+# Extensions of documents processDocument() can make thumbnails for
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'tif', 'tiff')
+
+# Thumbnail name recorded for an image document Pillow cannot decode, so it is not tried again.
+# No file is stored under it.
+NO_THUMBNAIL = 'thumbnails/none'
+
+DOCUMENT_JPEG_QUALITY = 80
+THUMBNAIL_JPEG_QUALITY = 70
+
+def openImage(file):
+    """Opens a document with Pillow
+
+    Returns
+    -------
+    PIL.Image.Image or None
+        the image, or None for PDFs and anything else Pillow cannot read
+    """
+    try:
+        return Image.open(file)
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+def fitImage(image, size, mode=None):
+    """Returns a copy of an image frame rotated upright and shrunk to fit within size
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        image, or current frame of a multi-page image
+    size : tuple
+        (width, height) bounding box
+    mode : str
+        optional mode to convert to, such as 'RGB' for JPEG and PDF output
+    """
+    image = ImageOps.exif_transpose(image)
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    else:
+        image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+def normalizeImage(image):
+    """Re-encodes a document image at a bounded resolution
+
+    Multi-page TIFFs become a PDF with one page per frame, other TIFFs and JPEGs
+    become JPEGs, and PNGs stay PNGs.
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        image opened with openImage()
+
+    Returns
+    -------
+    tuple
+        (ContentFile, extension) of the re-encoded document
+    """
+    bounds = (MAX_DOCUMENT_DIMENSION, MAX_DOCUMENT_DIMENSION)
+    buffer = BytesIO()
+
+    if image.format == 'PNG':
+        fitImage(image, bounds).save(buffer, 'PNG', optimize=True)
+        extension = 'png'
+    elif image.format == 'TIFF' and getattr(image, 'n_frames', 1) > 1:
+        pages = [fitImage(frame, bounds, mode='RGB') for frame in ImageSequence.Iterator(image)]
+        pages[0].save(buffer, 'PDF', save_all=True, append_images=pages[1:])
+        extension = 'pdf'
+    else:
+        if image.format == 'JPEG':
+            # Lets the decoder skip detail that would be thrown away by the resize
+            image.draft('RGB', bounds)
+        fitImage(image, bounds, mode='RGB').save(
+            buffer, 'JPEG', quality=DOCUMENT_JPEG_QUALITY, optimize=True
+        )
+        extension = 'jpg'
+
+    return ContentFile(buffer.getvalue()), extension
+
+def makeThumbnail(image):
+    """Renders the first page of a document image as a small JPEG
+
+    Returns
+    -------
+    ContentFile
+        JPEG thumbnail fitting within THUMBNAIL_SIZE
+    """
+    image.seek(0)
+    if image.format == 'JPEG':
+        image.draft('RGB', THUMBNAIL_SIZE)
+    buffer = BytesIO()
+    fitImage(image, THUMBNAIL_SIZE, mode='RGB').save(
+        buffer, 'JPEG', quality=THUMBNAIL_JPEG_QUALITY, optimize=True
+    )
+    return ContentFile(buffer.getvalue())
+
+def processDocument(doc):
+    """Downscales a document's image in storage and saves its thumbnail
+
+    The re-encoded image replaces the original when it is a TIFF or when it is smaller.
+    PDFs and other files Pillow cannot read are left as they are.
+
+    Parameters
+    ----------
+    doc : Document instance
+        document with a doc_file
+
+    Returns
+    -------
+    bool
+        True if the document was an image and now has a thumbnail
+    """
+    with doc.doc_file.open('rb') as f:
+        image = openImage(f)
+        if image is None:
+            return False
+        normalized, extension = normalizeImage(image)
+        thumbnail = makeThumbnail(image)
+        original_size = doc.doc_file.size
+        is_tiff = image.format == 'TIFF'
+
+    update_fields = ['thumbnail']
+    original_name = None
+    if is_tiff or normalized.size < original_size:
+        original_name = doc.doc_file.name
+        doc.doc_file.save(f'{doc.pk}.{extension}', normalized, save=False)
+        update_fields.append('doc_file')
+    doc.thumbnail.save(f'{doc.pk}.jpg', thumbnail, save=False)
+    doc.save(update_fields=update_fields)
+
+    if original_name is not None:
+        doc.doc_file.storage.delete(original_name)
+    return True
+
+def saveThumbnail(doc):
+    """Saves the thumbnail of a document's image, leaving the document itself as it is
+
+    Used for documents uploaded before they were processed, which must not be
+    replaced just because staff viewed them.
+
+    Parameters
+    ----------
+    doc : Document instance
+        document with a doc_file
+
+    Returns
+    -------
+    bool
+        True if the document was an image and now has a thumbnail,
+        False if it could not be decoded and its thumbnail is now NO_THUMBNAIL
+    """
+    with doc.doc_file.open('rb') as f:
+        image = openImage(f)
+        try:
+            thumbnail = None if image is None else makeThumbnail(image)
+        except (OSError, Image.DecompressionBombError):
+            # Pillow only decodes the image here, so truncated files fail now
+            thumbnail = None
+    if thumbnail is None:
+        doc.thumbnail.name = NO_THUMBNAIL
+        doc.save(update_fields=['thumbnail'])
+        return False
+    doc.thumbnail.save(f'{doc.pk}.jpg', thumbnail, save=False)
+    doc.save(update_fields=['thumbnail'])
+    return True
+
+def isImageName(name):
+    """Returns whether a stored file name has one of the IMAGE_EXTENSIONS"""
+    return name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
@@ -0,0 +1,121 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from simple_history.utils import bulk_update_with_history
+
+# Pay periods in a year for each pay_period choice of the income forms
+PAY_PERIODS_PER_YEAR = {
+    'weekly': 52,
+    'biweekly': 26,
+    'semimonthly': 24,
+    'monthly': 12,
+    'annually': 1,
+}
+WEEKS_PER_YEAR = 52
+MONTHS_PER_YEAR = 12
+
+CENT = Decimal('0.01')
+
+def makeIncomeSource(income_method, income, pay_period):
+    """Describes the job income entered on the income page
+
+    Parameters
+    ----------
+    income_method : str
+        'exact', 'hourly' or 'estimate'
+    income : float
+        pay per pay period, or hourly wage
+    pay_period : str or int
+        a PAY_PERIODS_PER_YEAR key, or hours per week for hourly income
+
+    Returns
+    -------
+    dict
+        JSON-serializable income source, with the amount as a string
+    """
+    source = {'type': income_method, 'amount': str(income)}
+    if income_method == 'hourly':
+        source['hours_per_week'] = int(pay_period)
+    else:
+        source['pay_period'] = pay_period
+    return source
+
+def makeNonJobIncomeSource(monthly_income):
+    """Describes the monthly income from other sources entered on the non-job income page"""
+    return {'type': 'non_job', 'amount': str(monthly_income)}
+
+def getAnnualAmount(source):
+    """Returns what one income source comes to in a year
+
+    Parameters
+    ----------
+    source : dict
+        from makeIncomeSource() or makeNonJobIncomeSource()
+
+    Returns
+    -------
+    Decimal
+    """
+    amount = Decimal(source['amount'])
+    if source['type'] == 'hourly':
+        return amount * source['hours_per_week'] * WEEKS_PER_YEAR
+    if source['type'] == 'non_job':
+        return amount * MONTHS_PER_YEAR
+    return amount * PAY_PERIODS_PER_YEAR[source['pay_period']]
+
+def getAnnualIncome(sources):
+    """Adds up a household's income sources in a year, rounded to the cent
+
+    Parameters
+    ----------
+    sources : list
+        income source dicts
+
+    Returns
+    -------
+    Decimal
+    """
+    return sum((getAnnualAmount(source) for source in sources), Decimal(0)).quantize(CENT, ROUND_HALF_UP)
+
+def recomputeAnnualIncomes(queryset, batch_size=500, save=True):
+    """Recomputes the annual_income of applications from their stored income_sources
+
+    Applications made before income sources were stored are left alone.
+    Changed incomes are written in batches, each with its historical records.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Application queryset
+    batch_size : int
+        applications updated per query
+    save : bool
+        False to only count the applications whose income would change
+
+    Returns
+    -------
+    int
+        number of applications whose annual_income changed
+    """
+    changed_count = 0
+    batch = []
+    applications = queryset.exclude(income_sources=[]).order_by('id').iterator(chunk_size=batch_size)
+    for app in applications:
+        annual_income = getAnnualIncome(app.income_sources)
+        if annual_income == app.annual_income:
+            continue
+        changed_count += 1
+        app.annual_income = annual_income
+        batch.append(app)
+        if len(batch) == batch_size:
+            if save:
+                _saveAnnualIncomes(queryset.model, batch)
+            batch = []
+    if batch and save:
+        _saveAnnualIncomes(queryset.model, batch)
+    return changed_count
+
+def _saveAnnualIncomes(model, apps):
+    bulk_update_with_history(
+        apps, model, ['annual_income'],
+        default_change_reason='Recomputed annual income from income sources',
+    )
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+
+# One applicant's path through the discount wizard, as (url name, answers posted).
+# Every page is loaded before it is posted, like a browser would.
+WIZARD_STEPS = [
+    ('pathways-apply-discount-overview', None),
+    ('pathways-apply-city-resident', {'city_resident': 'True'}),
+    ('pathways-apply-household-size', {'household_size': 2}),
+    ('pathways-apply-household-benefits', {'has_household_benefits': 'False'}),
+    ('pathways-apply-household-contributors', {'household_contributors': 1}),
+    ('pathways-apply-job-status', {'has_job': 'True'}),
+    ('pathways-apply-self-employment', {'is_self_employed': 'False'}),
+    ('pathways-apply-number-of-jobs', {'number_of_jobs': 1}),
+    ('pathways-apply-income-methods', {'income_method': 'exact'}),
+    ('pathways-apply-income', {'income': 500, 'pay_period': 'weekly'}),
+    ('pathways-apply-other-income-sources', {'has_other_income': 'False'}),
+    ('pathways-apply-review-eligibility', None),
+    ('pathways-apply-eligibility', None),
+    ('pathways-apply-additional-questions', None),
+    ('pathways-apply-resident-info', {
+        'first_name': 'Benchmark', 'last_name': 'Applicant', 'middle_initial': '',
+        'rent_or_own': 'rent', 'account_holder': 'me',
+    }),
+    ('pathways-apply-address', {'street_address': '123 Main St', 'apartment_unit': '', 'zip_code': '14202'}),
+    ('pathways-apply-contact-info', {'phone_number': '716-555-5555', 'email_address': ''}),
+    ('pathways-apply-review-application', None),
+    ('pathways-apply-legal', {'legal_agreement': True}),
+    ('pathways-apply-refer', {'word_of_mouth': True}),
+    ('pathways-apply-signature', {'signature': 'Benchmark Applicant'}),
+    ('pathways-apply-documents-overview', None),
+]
+
+class Command(BaseCommand):
+    help = "Count the database queries one completed discount application costs with each session store"
+
+    def add_arguments(self, parser):
+        # Session stores that can be set with SESSION_STORE
+        parser.add_argument('--store', choices=list(settings.SESSION_ENGINES), action='append',
+                            help="Session store to measure, can be repeated (default: all of them)")
+
+    def handle(self, *args, **options):
+        for store in options['store'] or list(settings.SESSION_ENGINES):
+            session_queries, total_queries = self.run_wizard(settings.SESSION_ENGINES[store])
+            self.stdout.write(f'{store}: {session_queries} session queries, '
+                              f'{total_queries} queries in total per completed application')
+
+    @staticmethod
+    def run_wizard(engine):
+        """Completes the wizard once and counts the queries it made
+
+        Everything the wizard writes is rolled back, including the application,
+        so the command can be run against any database.
+
+        Returns
+        -------
+        tuple
+            (queries on django_session, all queries)
+        """
+        hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+        with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=hosts), \
+                translation.override(settings.LANGUAGES[0][0]), \
+                CaptureQueriesContext(connection) as queries, \
+                transaction.atomic():
+            client = Client()
+            for url_name, answers in WIZARD_STEPS:
+                url = reverse(url_name)
+                response = client.get(url, secure=True)
+                if answers is not None:
+                    response = client.post(url, data=answers, secure=True)
+                if response.status_code not in (200, 302):
+                    raise CommandError(f'{url} returned {response.status_code}')
+                if answers is not None and response.status_code != 302:
+                    raise CommandError(f'{url} did not accept the benchmark answers')
+            transaction.set_rollback(True)
+
+        session_queries = [query for query in queries.captured_queries if 'django_session' in query['sql']]
+        return len(session_queries), len(queries.captured_queries)
@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand, CommandError
+
+from pathways.models import Application, ForgivenessApplication
+from pathways import exports
+
+# Models exported for each --program
+PROGRAMS = {
+    'discount': Application,
+    'amnesty': ForgivenessApplication,
+}
+
+class Command(BaseCommand):
+    help = "Export every application of a program, with its documents' metadata, as CSV or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--program', choices=list(PROGRAMS), default='discount',
+                            help="Applications exported (default: discount)")
+        parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                            help="File format (default: csv)")
+        parser.add_argument('--output',
+                            help="File written, CSV exports are written to stdout without it")
+        parser.add_argument('--chunk-size', type=int, default=exports.EXPORT_CHUNK_SIZE,
+                            help="Rows fetched per query")
+
+    def handle(self, *args, **options):
+        queryset = PROGRAMS[options['program']].objects.all()
+        if options['format'] == 'parquet':
+            if not options['output']:
+                raise CommandError('Parquet exports need --output')
+            if exports.pyarrow is None:
+                raise CommandError('Parquet exports need pyarrow, which is not installed')
+            exports.writeParquet(queryset, options['output'], options['chunk_size'])
+            return
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(exports.iterCsvLines(queryset, options['chunk_size']))
+        else:
+            for line in exports.iterCsvLines(queryset, options['chunk_size']):
+                self.stdout.write(line, ending='')
@@ -1,27 +1,137 @@
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from django.core.files.storage import default_storage
 from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models.deletion import Collector
+from storages.backends.s3boto3 import S3Boto3Storage
 
-from pathways.models import Application, Document
+from pathways.models import Document
 
 logger = logging.getLogger('django')
 
+# S3 DeleteObjects accepts at most 1000 keys per request
+MAX_S3_DELETE_KEYS = 1000
+
+def delete_stored_files(storage, names):
+    """Removes files from storage, using multi-object deletes of up to 1000 keys on S3
+
+    Returns
+    -------
+    set
+        names of the files that could not be deleted
+    """
+    failed = set()
+    if not names:
+        return failed
+    if isinstance(storage, S3Boto3Storage):
+        # pylint:disable=protected-access
+        names_by_key = {storage._normalize_name(storage._clean_name(name)): name for name in names}
+        # pylint:enable=protected-access
+        keys = [{'Key': key} for key in names_by_key]
+        # boto3 clients are thread-safe, unlike the storage's bucket resource
+        client = storage.connection.meta.client
+        for start in range(0, len(keys), MAX_S3_DELETE_KEYS):
+            response = client.delete_objects(
+                Bucket=storage.bucket_name,
+                Delete={'Objects': keys[start:start + MAX_S3_DELETE_KEYS], 'Quiet': True}
+            )
+            # Quiet mode only lists the keys that failed
+            for error in response.get('Errors', []):
+                logger.error('Could not delete %s from S3: %s %s', error['Key'], error.get('Code'), error.get('Message'))
+                failed.add(names_by_key.get(error['Key'], error['Key']))
+    else:
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception: # pylint:disable=broad-except
+                logger.exception('Could not delete %s', name)
+                failed.add(name)
+    return failed
+
 class Command(BaseCommand):
     def __init__(self, *args, **kwargs):
         super(Command, self).__init__(*args, **kwargs)
 
     help = "Purge an applicant's documents once they are enrolled"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report how many documents would be purged without deleting anything")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Documents deleted per batch (at most 1000)")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Threads deleting files from storage in parallel")
+
     def handle(self, *args, **options):
-        apps = Application.objects.exclude(status='new')
-        apps = apps.exclude(status='in_progress')
+        chunk_size = min(options['chunk_size'], MAX_S3_DELETE_KEYS)
+
+        # Documents of applications that are no longer being reviewed, selected with one join
+        docs = Document.objects.exclude(application__status__in=['new', 'in_progress']).order_by('id')
+        total = docs.count()
+
+        if options['dry_run']:
+            self.stdout.write(f'{total} documents would be purged')
+            return
 
+        # Files are deleted on a bounded thread pool, one storage request per chunk.
+        # A chunk's rows are deleted only once its files are gone.
         doc_count = 0
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for chunk in self.iter_chunks(docs, chunk_size):
+                names = [doc.doc_file.name for doc in chunk if doc.doc_file]
+                names += [doc.thumbnail.name for doc in chunk if doc.thumbnail]
+                pending.append((chunk, executor.submit(delete_stored_files, default_storage, names)))
+                if len(pending) >= options['workers']:
+                    doc_count = doc_count + self.finish_chunk(*pending.popleft())
+                    self.stdout.write(f'Purged {doc_count} of {total} documents')
+            while pending:
+                doc_count = doc_count + self.finish_chunk(*pending.popleft())
+                self.stdout.write(f'Purged {doc_count} of {total} documents')
+
+        logger.info('Purged %s unnecessary documents', doc_count)
+
+    @staticmethod
+    def iter_chunks(docs, chunk_size):
+        """Yields lists of documents in primary key order
+
+        Each chunk is its own keyset query rather than one long-lived cursor,
+        because rows are deleted while the purge is iterating.
+        """
+        last_id = 0
+        while True:
+            chunk = list(docs.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+            yield chunk
+
+    def finish_chunk(self, docs, future):
+        """Deletes the rows of the chunk's documents whose files are gone
+
+        Documents with a file that could not be deleted are kept, so the next purge tries again.
+        """
+        failed = future.result()
+        deleted = [doc for doc in docs if doc.doc_file.name not in failed and doc.thumbnail.name not in failed]
+        if len(deleted) < len(docs):
+            logger.error('Kept %s documents whose files could not be deleted', len(docs) - len(deleted))
+        self.delete_documents(deleted)
+        return len(deleted)
 
-        for app in apps:
-            docs = Document.objects.filter(application=app)
-            for doc in docs:
-                doc_count = doc_count + 1
-                doc.delete()
+    @staticmethod
+    def delete_documents(docs):
+        """Deletes document rows in one batch, keeping their historical records
 
-        logger.info('Purged %s unnecessary documents', doc_count)
\ No newline at end of file
+        The files were already removed, so remove_file_from_s3 is told to skip them.
+        """
+        if not docs:
+            return
+        for doc in docs:
+            doc.skip_file_delete = True
+        with transaction.atomic():
+            collector = Collector(using=Document.objects.db)
+            collector.collect(docs)
+            collector.delete()
@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from pathways import metrics
+
+class Command(BaseCommand):
+    help = "Rebuild program metrics snapshots from applications and referrals"
+
+    def handle(self, *args, **options):
+        metrics.rebuildSnapshots()
+        for program, counts in metrics.getSnapshotCounts().items():
+            self.stdout.write(f"{program}: {counts['application_total']} applications, "
+                              f"{counts['referral_total']} referrals")
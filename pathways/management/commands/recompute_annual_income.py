@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from pathways.models import Application
+from pathways import income
+
+class Command(BaseCommand):
+    help = "Recompute the annual income of discount applications from their stored income sources"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report how many applications would change without saving them")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Applications updated per query")
+
+    def handle(self, *args, **options):
+        changed_count = income.recomputeAnnualIncomes(
+            Application.objects.all(), batch_size=options['batch_size'], save=not options['dry_run']
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{changed_count} applications would change')
+        else:
+            self.stdout.write(f'Recomputed the annual income of {changed_count} applications')
@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from pathways.models import Application, ForgivenessApplication, ProgramMetricsSnapshot, Referral
+
+# Boolean referral channels on the Referral model, in the order shown on /metrics/
+REFERRAL_CHANNELS = [
+    'facebook', 'google', 'twitter', 'linkedin',
+    'bill', 'ad', 'pamphlet', 'word_of_mouth',
+]
+
+# Programs recorded in Referral.program
+REFERRAL_PROGRAMS = ['Discount', 'Amnesty']
+
+# Application model counted in ProgramMetricsSnapshot.application_total for each program
+PROGRAM_APPLICATION_MODELS = {
+    'Discount': Application,
+    'Amnesty': ForgivenessApplication,
+}
+
+# ProgramMetricsSnapshot count fields
+SNAPSHOT_FIELDS = ['application_total', 'referral_total'] + REFERRAL_CHANNELS + ['custom_referral_total']
+
+def getReferralCounts():
+    """Counts referrals for every program and channel in one grouped query
+
+    Returns
+    -------
+    dict
+        maps program name to a dict of channel counts, plus 'referral_total'
+        and 'custom_referral_total' for referrals with a free text answer. Programs without referrals map to zeros.
+    """
+    aggregates = {
+        channel: Count('id', filter=Q(**{channel: True}))
+        for channel in REFERRAL_CHANNELS
+    }
+    aggregates['referral_total'] = Count('id')
+    aggregates['custom_referral_total'] = Count('id', filter=~Q(custom_referral=''))
+
+    rows = Referral.objects.order_by().values('program').annotate(**aggregates)
+
+    counts = {
+        program: {key: 0 for key in aggregates}
+        for program in REFERRAL_PROGRAMS
+    }
+    for row in rows:
+        program = row.pop('program')
+        counts[program] = row
+    return counts
+
+def iterCustomReferrals(program):
+    """Yields (custom_referral, count) pairs for a program, most frequent first
+
+    Rows are grouped in the database and streamed with iterator(),
+    so the free text answers are never loaded into memory all at once.
+    """
+    rows = (Referral.objects
+            .filter(program=program)
+            .exclude(custom_referral='')
+            .order_by()
+            .values_list('custom_referral')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'custom_referral'))
+    for custom_referral, count in rows.iterator():
+        yield custom_referral, count
+
+def getReferralDeltas(referral):
+    """Returns the ProgramMetricsSnapshot fields a single referral counts towards"""
+    deltas = {'referral_total': 1}
+    for channel in REFERRAL_CHANNELS:
+        if getattr(referral, channel):
+            deltas[channel] = 1
+    if referral.custom_referral != '':
+        deltas['custom_referral_total'] = 1
+    return deltas
+
+def adjustSnapshot(program, deltas, sign=1):
+    """Atomically adds (or with sign=-1 subtracts) deltas to a program's snapshot row"""
+    ProgramMetricsSnapshot.objects.get_or_create(program=program)
+    ProgramMetricsSnapshot.objects.filter(program=program).update(
+        **{field: F(field) + sign * delta for field, delta in deltas.items()}
+    )
+
+def bulkCreateReferrals(referrals):
+    """Saves many Referral objects at once and adds them to the snapshot in one update per program
+
+    bulk_create() does not send post_save, so the snapshot is adjusted here instead.
+    """
+    with transaction.atomic():
+        created = Referral.objects.bulk_create(referrals)
+        program_deltas = {}
+        for referral in created:
+            deltas = program_deltas.setdefault(referral.program, {})
+            for field, delta in getReferralDeltas(referral).items():
+                deltas[field] = deltas.get(field, 0) + delta
+        for program, deltas in program_deltas.items():
+            adjustSnapshot(program, deltas)
+    return created
+
+def rebuildSnapshots():
+    """Recomputes every ProgramMetricsSnapshot row from the source tables"""
+    referral_counts = getReferralCounts()
+    with transaction.atomic():
+        for program, model in PROGRAM_APPLICATION_MODELS.items():
+            ProgramMetricsSnapshot.objects.update_or_create(
+                program=program,
+                defaults=dict(referral_counts[program], application_total=model.objects.count())
+            )
+
+def getSnapshotCounts():
+    """Reads precomputed totals for every program from ProgramMetricsSnapshot
+
+    Returns
+    -------
+    dict
+        maps program name to a dict of SNAPSHOT_FIELDS counts.
+        Programs without a snapshot row map to zeros.
+    """
+    counts = {
+        program: {field: 0 for field in SNAPSHOT_FIELDS}
+        for program in PROGRAM_APPLICATION_MODELS
+    }
+    for row in ProgramMetricsSnapshot.objects.values('program', *SNAPSHOT_FIELDS):
+        program = row.pop('program')
+        counts[program] = row
+    return counts
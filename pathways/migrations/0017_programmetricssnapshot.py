@@ -0,0 +1,53 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:06
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+REFERRAL_CHANNELS = ['facebook', 'google', 'twitter', 'linkedin', 'bill', 'ad', 'pamphlet', 'word_of_mouth']
+
+
+def populate_snapshots(apps, schema_editor):
+    del schema_editor # unused
+    ProgramMetricsSnapshot = apps.get_model('pathways', 'ProgramMetricsSnapshot')
+    Referral = apps.get_model('pathways', 'Referral')
+    application_models = {
+        'Discount': apps.get_model('pathways', 'Application'),
+        'Amnesty': apps.get_model('pathways', 'ForgivenessApplication'),
+    }
+    for program, model in application_models.items():
+        referrals = Referral.objects.filter(program=program)
+        counts = referrals.aggregate(
+            referral_total=Count('id'),
+            custom_referral_total=Count('id', filter=~Q(custom_referral='')),
+            **{channel: Count('id', filter=Q(**{channel: True})) for channel in REFERRAL_CHANNELS}
+        )
+        ProgramMetricsSnapshot.objects.create(program=program, application_total=model.objects.count(), **counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0016_referral'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramMetricsSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('program', models.CharField(max_length=60, unique=True)),
+                ('application_total', models.IntegerField(default=0)),
+                ('referral_total', models.IntegerField(default=0)),
+                ('facebook', models.IntegerField(default=0)),
+                ('google', models.IntegerField(default=0)),
+                ('twitter', models.IntegerField(default=0)),
+                ('linkedin', models.IntegerField(default=0)),
+                ('bill', models.IntegerField(default=0)),
+                ('ad', models.IntegerField(default=0)),
+                ('pamphlet', models.IntegerField(default=0)),
+                ('word_of_mouth', models.IntegerField(default=0)),
+                ('custom_referral_total', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0017_programmetricssnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='forgivenessapplication',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='forgivenessapplication',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='historicalapplication',
+            name='created_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalapplication',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalforgivenessapplication',
+            name='created_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalforgivenessapplication',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+    ]
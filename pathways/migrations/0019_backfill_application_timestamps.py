@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_timestamps(apps, schema_editor):
+    del schema_editor # unused
+    history_models = {
+        'Application': 'HistoricalApplication',
+        'ForgivenessApplication': 'HistoricalForgivenessApplication',
+    }
+    for model_name, history_model_name in history_models.items():
+        model = apps.get_model('pathways', model_name)
+        history = apps.get_model('pathways', history_model_name).objects.filter(id=OuterRef('pk'))
+        earliest = history.order_by('history_date').values('history_date')[:1]
+        latest = history.order_by('-history_date').values('history_date')[:1]
+        model.objects.update(
+            created_at=Coalesce(Subquery(earliest), F('created_at')),
+            updated_at=Coalesce(Subquery(latest), F('updated_at')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0018_application_timestamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timestamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:21
+
+from django.db import migrations, models
+import pathways.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0020_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, upload_to=pathways.models.thumbnail_path),
+        ),
+        migrations.AddField(
+            model_name='historicaldocument',
+            name='thumbnail',
+            field=models.TextField(blank=True, editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:24
+
+from django.db import migrations, models
+
+
+# Copy of pathways.helpers.getLookupKey() when this migration was written,
+# so later changes to it do not change what the migration computes
+def normalize_name(name):
+    return ' '.join(name.split()).lower()
+
+def normalize_digits(value):
+    return ''.join(character for character in value if character.isdigit())
+
+def get_lookup_key(first_name, last_name, zip_code, phone_number):
+    phone = normalize_digits(phone_number)
+    if len(phone) == 11 and phone.startswith('1'):
+        phone = phone[1:]
+    return '|'.join([
+        normalize_name(last_name),
+        normalize_name(first_name),
+        normalize_digits(zip_code)[:5],
+        phone,
+    ])
+
+def populate_lookup_keys(apps, schema_editor):
+    del schema_editor # unused
+    Application = apps.get_model('pathways', 'Application')
+    batch = []
+    fields = ['id', 'first_name', 'last_name', 'zip_code', 'phone_number']
+    for app in Application.objects.only(*fields).order_by('id').iterator():
+        app.lookup_key = get_lookup_key(app.first_name, app.last_name, app.zip_code, app.phone_number)
+        batch.append(app)
+        if len(batch) == 500:
+            Application.objects.bulk_update(batch, ['lookup_key'])
+            batch = []
+    Application.objects.bulk_update(batch, ['lookup_key'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0021_document_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='lookup_key',
+            field=models.CharField(default='', editable=False, max_length=230),
+        ),
+        migrations.AddField(
+            model_name='historicalapplication',
+            name='lookup_key',
+            field=models.CharField(default='', editable=False, max_length=230),
+        ),
+        migrations.RunPython(populate_lookup_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['lookup_key', 'rent_or_own', 'household_size'], name='application_lookup_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:26
+
+import hashlib
+
+from django.db import migrations, models
+
+# Model FINGERPRINT_FIELDS when this migration was written
+FINGERPRINT_FIELDS = {
+    'Application': (
+        'household_size', 'has_household_benefits', 'first_name', 'last_name',
+        'rent_or_own', 'street_address', 'zip_code', 'phone_number',
+        'account_holder', 'account_first', 'account_last', 'legal_agreement',
+    ),
+    'ForgivenessApplication': ('first_name', 'last_name', 'street_address', 'zip_code', 'phone_number'),
+}
+
+
+# Copy of pathways.helpers.getFingerprint() when this migration was written,
+# so later changes to it do not change what the migration computes
+def get_fingerprint(instance, field_names):
+    values = []
+    for name in field_names:
+        field = instance._meta.get_field(name) # pylint:disable=protected-access
+        values.append(str(field.to_python(getattr(instance, name))))
+    return hashlib.sha256('\x1f'.join(values).encode()).hexdigest()
+
+def populate_fingerprints(apps, schema_editor):
+    del schema_editor # unused
+    for model_name, field_names in FINGERPRINT_FIELDS.items():
+        model = apps.get_model('pathways', model_name)
+        batch = []
+        for app in model.objects.only('id', *field_names).order_by('id').iterator():
+            app.fingerprint = get_fingerprint(app, field_names)
+            batch.append(app)
+            if len(batch) == 500:
+                model.objects.bulk_update(batch, ['fingerprint'])
+                batch = []
+        model.objects.bulk_update(batch, ['fingerprint'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0022_application_lookup_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='fingerprint',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='forgivenessapplication',
+            name='fingerprint',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='historicalapplication',
+            name='fingerprint',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='historicalforgivenessapplication',
+            name='fingerprint',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(populate_fingerprints, migrations.RunPython.noop),
+    ]
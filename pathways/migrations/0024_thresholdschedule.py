@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:36
+
+from django.db import migrations, models
+import datetime
+import django.db.models.deletion
+
+# The limits that were hard-coded in pathways/helpers.py. Applications made
+# before the first schedule's effective date are tiered by it as well.
+INITIAL_INCOME_LIMITS = {
+    1: 41850, 2: 47800, 3: 53800, 4: 59750,
+    5: 64550, 6: 69350, 7: 74100, 8: 78900,
+}
+INITIAL_VERY_LOW_INCOME_LIMITS = {
+    1: 26150, 2: 29900, 3: 33650, 4: 37350,
+    5: 40350, 6: 43350, 7: 46350, 8: 49350,
+}
+
+def create_initial_schedule(apps, schema_editor):
+    del schema_editor # unused
+    ThresholdSchedule = apps.get_model('pathways', 'ThresholdSchedule')
+    IncomeThreshold = apps.get_model('pathways', 'IncomeThreshold')
+    schedule = ThresholdSchedule.objects.create(version='1', effective_date=datetime.date(2019, 1, 1))
+    IncomeThreshold.objects.bulk_create([
+        IncomeThreshold(
+            schedule=schedule, household_size=household_size, income_limit=income_limit,
+            very_low_income_limit=INITIAL_VERY_LOW_INCOME_LIMITS[household_size],
+        )
+        for household_size, income_limit in INITIAL_INCOME_LIMITS.items()
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0023_application_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThresholdSchedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(help_text='Such as the HUD fiscal year, e.g. FY2021', max_length=20, unique=True)),
+                ('effective_date', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IncomeThreshold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('household_size', models.IntegerField(choices=[(1, 'Just me'), (2, '2 people'), (3, '3 people'), (4, '4 people'), (5, '5 people'), (6, '6 people'), (7, '7 people'), (8, '8 people')])),
+                ('income_limit', models.IntegerField(help_text='Highest annual income eligible for a discount')),
+                ('very_low_income_limit', models.IntegerField(help_text='Highest annual income eligible for the larger discount')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thresholds', to='pathways.ThresholdSchedule')),
+            ],
+            options={
+                'unique_together': {('schedule', 'household_size')},
+            },
+        ),
+        migrations.RunPython(create_initial_schedule, migrations.RunPython.noop),
+    ]
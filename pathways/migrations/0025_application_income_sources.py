@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:38
+
+from django.db import migrations
+import pathways.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathways', '0024_thresholdschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='income_sources',
+            field=pathways.models.JSONTextField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='historicalapplication',
+            name='income_sources',
+            field=pathways.models.JSONTextField(default=list, editable=False),
+        ),
+    ]
@@ -1,14 +1,36 @@
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.core.validators import RegexValidator, ValidationError
 from django.utils.translation import ugettext_lazy as _
 from django.utils.deconstruct import deconstructible
 from django.template.defaultfilters import filesizeformat
-from datetime import datetime
+import json
+import uuid
 from simple_history.models import HistoricalRecords
 import magic
 
+from pathways import eligibility
 from pathways import helpers
 
+class JSONTextField(models.TextField):
+    """Keeps a JSON-serializable value as text, since SQLite has no JSON column type"""
+    def from_db_value(self, value, expression, connection):
+        del expression, connection # unused
+        if value is None:
+            return value
+        return json.loads(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def get_prep_value(self, value):
+        return json.dumps(value)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
+
 class Application(models.Model):
     # Metadata
     history = HistoricalRecords()
@@ -41,6 +63,8 @@ class Application(models.Model):
         default=0,
         help_text=_("Must specify annual income if applicant does not have other household benefits (HEAP, SNAP, etc.)")
     )
+    # What annual_income was computed from, see pathways/income.py
+    income_sources = JSONTextField(default=list, editable=False)
 
     # ResidentInfoForm
     first_name = models.CharField(max_length=100)
@@ -134,18 +158,45 @@ class Application(models.Model):
         default=''
     )
 
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Normalized names, ZIP code and phone number that returning applicants are matched on
+    lookup_key = models.CharField(max_length=230, editable=False, default='')
+
+    # Answers that identify a resubmission of the same application in SignatureView
+    FINGERPRINT_FIELDS = (
+        'household_size', 'has_household_benefits', 'first_name', 'last_name',
+        'rent_or_own', 'street_address', 'zip_code', 'phone_number',
+        'account_holder', 'account_first', 'account_last', 'legal_agreement',
+    )
+    fingerprint = models.CharField(max_length=64, editable=False, default='', db_index=True)
+
     def __str__(self):
         return f'{self.id} - {self.last_name} at {self.street_address}'
 
+    def save(self, *args, **kwargs):
+        self.lookup_key = helpers.getLookupKey(self.first_name, self.last_name, self.zip_code, self.phone_number)
+        self.fingerprint = helpers.getFingerprint(self, self.FINGERPRINT_FIELDS)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'lookup_key', 'fingerprint'}
+        super().save(*args, **kwargs)
+
     @property
     def discount_amount(self):
-        very_low_income_thresholds = helpers.getVeryLowIncomeThresholds()
-        max_income = very_low_income_thresholds[self.household_size]
-        return 90 if self.annual_income <= max_income else 60
+        """Discount percentage under the income limits in force when the application was made"""
+        return eligibility.getDiscountTier(
+            self.household_size, self.annual_income, eligibility.getApplicationDate(self)
+        )
 
     class Meta:
         verbose_name = 'Discount Application'
         verbose_name_plural = 'Discount Applications'
+        indexes = [
+            # LaterDocumentsView matches on lookup_key alone,
+            # MoreDocumentInfoRequiredView narrows it down further
+            models.Index(fields=['lookup_key', 'rent_or_own', 'household_size'], name='application_lookup_idx'),
+        ]
 
 class EmailCommunication(models.Model):
     email_address = models.EmailField(primary_key=True, blank=False, null=False)
@@ -161,6 +212,26 @@ class EmailCommunication(models.Model):
         return f'{self.email_address}'
 
 
+class EmailOutbox(models.Model):
+    """An automatic email waiting to be sent
+
+    Rows are written in the same transaction as the application that triggered them
+    and removed by the send_outbox_emails task once the email was sent.
+    """
+    email_type = models.CharField(max_length=20)
+    first_name = models.CharField(max_length=100)
+    email_address = models.EmailField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set while a send_outbox_emails run is sending the email
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.email_type} to {self.email_address}'
+
+
+# Bytes of a file's header read to detect its MIME type
+MIME_SNIFF_BYTES = 2048
+
 @deconstructible
 class FileValidator():
     """A class to validate a file with size and contents constraints
@@ -214,14 +285,32 @@ class FileValidator():
                                    code='min_size', params=params)
 
         if self.content_types:
-            content_type = magic.from_buffer(data.read(), mime=True)
-            data.seek(0)
+            content_type = self.sniff_content_type(data)
 
             if content_type not in self.content_types:
                 params = { 'content_type': content_type }
                 raise ValidationError(self.error_messages['content_type'],
                                    code='content_type', params=params)
 
+    @staticmethod
+    def sniff_content_type(data):
+        """Detects the MIME type of a file from its header bytes
+
+        Only the first MIME_SNIFF_BYTES are read, so a TemporaryUploadedFile is never
+        loaded into memory. The result is cached on the uploaded file, so the form and
+        the model field validating the same upload only sniff it once.
+        """
+        # Model field validation receives a FieldFile wrapping the uploaded file
+        upload = data.file if isinstance(data, FieldFile) else data
+        content_type = getattr(upload, 'sniffed_content_type', None)
+        if content_type is None:
+            position = upload.tell()
+            upload.seek(0)
+            content_type = magic.from_buffer(upload.read(MIME_SNIFF_BYTES), mime=True)
+            upload.seek(position)
+            upload.sniffed_content_type = content_type
+        return content_type
+
     def __eq__(self, other):
         return (
             isinstance(other, FileValidator) and
@@ -235,7 +324,9 @@ def path_and_rename(instance, filename):
     """Renames and paths document file on upload
 
     The filename is based on the primary key of the document object.
-    If the primary key does not exist, the filename is the current datetime.
+    If the primary key does not exist yet, the filename is a random UUID,
+    so a new document's storage key is reserved before its row is inserted
+    and the document can be created with a single write.
 
     When this function is called, the document's content type 
     has already gone through 2 checks
@@ -262,11 +353,29 @@ def path_and_rename(instance, filename):
     if instance.pk:
         filename = f'{instance.pk}'
     else:
-        t = datetime.now()
-        filename = f'{t.year}-{t.month}-{t.day}-{t.hour}-{t.minute}-{t.second}-{t.microsecond}'
+        filename = uuid.uuid4().hex
     return f'{upload_to}/{filename}.{ext}'
 
 
+def thumbnail_path(instance, filename):
+    """Paths a document's admin thumbnail by the primary key of the document
+
+    Parameters
+    ----------
+    instance : Document instance
+        instance of Document object
+    filename : str
+        unused, thumbnails are always JPEGs
+
+    Returns
+    -------
+    str
+        Constructed path and name for thumbnail to upload to S3
+    """
+    del filename # unused
+    return f'thumbnails/{instance.pk}.jpg'
+
+
 # Validator for acceptable file uploads, used by both Document model and in forms.py
 ACCEPTED_FILE_VALIDATOR = FileValidator(
     max_size=1024 * 4000, content_types=(
@@ -285,6 +394,8 @@ class Document(models.Model):
         ('residence', _('Residence'))
     ])
     doc_file = models.FileField(upload_to=path_and_rename, blank=True, validators=[ACCEPTED_FILE_VALIDATOR])
+    # Small JPEG of the first page, saved by the process_documents task
+    thumbnail = models.FileField(upload_to=thumbnail_path, blank=True, editable=False)
     
     # Metadata
     history = HistoricalRecords()
@@ -356,9 +467,22 @@ class ForgivenessApplication(models.Model):
         default=''
     )
 
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Answers that identify a resubmission of the same application in ForgiveReviewApplicationView
+    FINGERPRINT_FIELDS = ('first_name', 'last_name', 'street_address', 'zip_code', 'phone_number')
+    fingerprint = models.CharField(max_length=64, editable=False, default='', db_index=True)
+
     def __str__(self):
         return f'{self.id} - {self.last_name} at {self.street_address}'
 
+    def save(self, *args, **kwargs):
+        self.fingerprint = helpers.getFingerprint(self, self.FINGERPRINT_FIELDS)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'fingerprint'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Amnesty Application'
         verbose_name_plural = 'Amnesty Applications'
@@ -373,4 +497,49 @@ class Referral(models.Model):
     ad = models.BooleanField(default=False)
     pamphlet = models.BooleanField(default=False)
     word_of_mouth = models.BooleanField(default=False)
-    custom_referral = models.CharField(default='', max_length=60)
\ No newline at end of file
+    custom_referral = models.CharField(default='', max_length=60)
+
+class ProgramMetricsSnapshot(models.Model):
+    """Precomputed application and referral totals for a program
+
+    Rows are kept up to date by signal handlers in pathways/signals.py
+    and can be rebuilt from scratch with the rebuild_metrics_snapshot command.
+    """
+    program = models.CharField(max_length=60, unique=True)
+    application_total = models.IntegerField(default=0)
+    referral_total = models.IntegerField(default=0)
+    facebook = models.IntegerField(default=0)
+    google = models.IntegerField(default=0)
+    twitter = models.IntegerField(default=0)
+    linkedin = models.IntegerField(default=0)
+    bill = models.IntegerField(default=0)
+    ad = models.IntegerField(default=0)
+    pamphlet = models.IntegerField(default=0)
+    word_of_mouth = models.IntegerField(default=0)
+    custom_referral_total = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.program} metrics'
+
+class ThresholdSchedule(models.Model):
+    """HUD income limits in force from effective_date until the next schedule's
+
+    Applications are tiered by the schedule in force on the day they were made,
+    so a new schedule is added for each HUD update rather than editing the last one.
+    Schedules are cached in each process by pathways/eligibility.py.
+    """
+    version = models.CharField(max_length=20, unique=True, help_text="Such as the HUD fiscal year, e.g. FY2021")
+    effective_date = models.DateField(unique=True)
+
+    def __str__(self):
+        return f'{self.version} (from {self.effective_date})'
+
+class IncomeThreshold(models.Model):
+    """Income limits for one household size in a ThresholdSchedule"""
+    schedule = models.ForeignKey(ThresholdSchedule, on_delete=models.CASCADE, related_name='thresholds')
+    household_size = models.IntegerField(choices=Application.HOUSEHOLD_SIZE_CHOICES)
+    income_limit = models.IntegerField(help_text="Highest annual income eligible for a discount")
+    very_low_income_limit = models.IntegerField(help_text="Highest annual income eligible for the larger discount")
+
+    class Meta:
+        unique_together = ['schedule', 'household_size']
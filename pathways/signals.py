@@ -1,8 +1,12 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
-from pathways.models import Application, ForgivenessApplication, Document
-from pathways.tasks import send_automatic_email
+from pathways.models import Application, ForgivenessApplication, Document, Referral
+from pathways.models import ThresholdSchedule, IncomeThreshold
+from pathways.tasks import queue_automatic_email
+from pathways import eligibility
+from pathways import metrics
 
 @receiver(post_save, sender=Application, dispatch_uid="confirmation_email_discount")
 def send_email_for_discount_application(sender, instance, created, **kwargs):
@@ -11,26 +15,10 @@ def send_email_for_discount_application(sender, instance, created, **kwargs):
     if instance.email_address == '':
         return
 
-    recipient_list = [(instance.first_name, instance.email_address)]
-
     if created:
-        subject = 'We received your application for the Buffalo Water Affordability Program'
-        template_name = 'pathways/emails/discount_confirmation_no_docs_now.html'
-        send_automatic_email(email_address=instance.email_address, 
-                                    email_type='discount_receive',
-                                    subject=subject,
-                                    template_name=template_name,
-                                    recipient_list=recipient_list
-                                    )
+        queue_automatic_email('discount_receive', instance.first_name, instance.email_address)
     elif instance.status == 'enrolled':
-        subject = 'You have been successfully enrolled in the Buffalo Water Affordability Program'
-        template_name = 'pathways/emails/discount_enrolled.html'
-        send_automatic_email(email_address=instance.email_address, 
-                                    email_type='discount_enroll',
-                                    subject=subject,
-                                    template_name=template_name,
-                                    recipient_list=recipient_list
-                                    )
+        queue_automatic_email('discount_enroll', instance.first_name, instance.email_address)
 
 @receiver(post_save, sender=ForgivenessApplication, dispatch_uid="confirmation_email_amnesty")
 def send_email_for_amnesty_application(sender, instance, created, **kwargs):
@@ -39,29 +27,81 @@ def send_email_for_amnesty_application(sender, instance, created, **kwargs):
     if instance.email_address == '':
         return
 
-    recipient_list = [(instance.first_name, instance.email_address)]
-
     if created:
-        subject = 'We received your application for the Buffalo Water Amnesty Program'
-        template_name = 'pathways/emails/amnesty_confirmation.html'
-        send_automatic_email(email_address=instance.email_address, 
-                                    email_type='amnesty_receive',
-                                    subject=subject,
-                                    template_name=template_name,
-                                    recipient_list=recipient_list
-                                    )
+        queue_automatic_email('amnesty_receive', instance.first_name, instance.email_address)
     elif instance.status == 'enrolled':
-        subject = 'You have been successfully enrolled in the Buffalo Water Amnesty Program'
-        template_name = 'pathways/emails/amnesty_enrolled.html'
-        send_automatic_email(email_address=instance.email_address, 
-                                    email_type='amnesty_enroll',
-                                    subject=subject,
-                                    template_name=template_name,
-                                    recipient_list=recipient_list
-                                    )
+        queue_automatic_email('amnesty_enroll', instance.first_name, instance.email_address)
 
 
 @receiver(post_delete, sender=Document)
 def remove_file_from_s3(sender, instance, using, **kwargs):
     del sender, using, kwargs # unused
-    instance.doc_file.delete(save=False)
\ No newline at end of file
+    # purge_unused_docs removes files in batches before deleting the rows
+    if getattr(instance, 'skip_file_delete', False):
+        return
+    instance.doc_file.delete(save=False)
+    instance.thumbnail.delete(save=False)
+
+
+@receiver(post_save, sender=Application, dispatch_uid="metrics_discount_saved")
+@receiver(post_save, sender=ForgivenessApplication, dispatch_uid="metrics_amnesty_saved")
+def add_application_to_metrics(sender, instance, created, **kwargs):
+    del instance, kwargs # unused
+    if created:
+        program = 'Discount' if sender is Application else 'Amnesty'
+        metrics.adjustSnapshot(program, {'application_total': 1})
+
+
+@receiver(post_delete, sender=Application, dispatch_uid="metrics_discount_deleted")
+@receiver(post_delete, sender=ForgivenessApplication, dispatch_uid="metrics_amnesty_deleted")
+def remove_application_from_metrics(sender, instance, **kwargs):
+    del instance, kwargs # unused
+    program = 'Discount' if sender is Application else 'Amnesty'
+    metrics.adjustSnapshot(program, {'application_total': 1}, sign=-1)
+
+
+@receiver(pre_save, sender=Referral, dispatch_uid="metrics_referral_saving")
+def remember_referral_metrics(sender, instance, **kwargs):
+    del sender, kwargs # unused
+    # An edited referral is taken out of the counts it was in before the save
+    instance.previous_metrics = None
+    if instance.pk is not None:
+        previous = Referral.objects.filter(pk=instance.pk).first()
+        if previous is not None:
+            instance.previous_metrics = (previous.program, metrics.getReferralDeltas(previous))
+
+
+@receiver(post_save, sender=Referral, dispatch_uid="metrics_referral_saved")
+def add_referral_to_metrics(sender, instance, created, **kwargs):
+    del sender, created, kwargs # unused
+    deltas = metrics.getReferralDeltas(instance)
+    previous = getattr(instance, 'previous_metrics', None)
+    if previous is not None:
+        previous_program, previous_deltas = previous
+        if previous_program != instance.program:
+            metrics.adjustSnapshot(previous_program, previous_deltas, sign=-1)
+        else:
+            deltas = {
+                field: deltas.get(field, 0) - previous_deltas.get(field, 0)
+                for field in set(deltas) | set(previous_deltas)
+            }
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        metrics.adjustSnapshot(instance.program, deltas)
+
+
+@receiver(post_delete, sender=Referral, dispatch_uid="metrics_referral_deleted")
+def remove_referral_from_metrics(sender, instance, **kwargs):
+    del sender, kwargs # unused
+    metrics.adjustSnapshot(instance.program, metrics.getReferralDeltas(instance), sign=-1)
+
+
+@receiver(post_save, sender=ThresholdSchedule, dispatch_uid="thresholds_schedule_saved")
+@receiver(post_delete, sender=ThresholdSchedule, dispatch_uid="thresholds_schedule_deleted")
+@receiver(post_save, sender=IncomeThreshold, dispatch_uid="thresholds_limit_saved")
+@receiver(post_delete, sender=IncomeThreshold, dispatch_uid="thresholds_limit_deleted")
+def clear_threshold_cache(sender, **kwargs):
+    del sender, kwargs # unused
+    eligibility.clearThresholdCache()
+    # Schedules loaded again before the change committed would not include it
+    transaction.on_commit(eligibility.clearThresholdCache)
@@ -1,70 +1,267 @@
 from __future__ import absolute_import
+import datetime
+import logging
+from importlib import import_module
 
+from django.conf import settings
 from django.core import mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
 from celery import shared_task
 
-from pathways.models import EmailCommunication
+from pathways.models import Document, EmailCommunication, EmailOutbox
+from pathways import email_templates
+from pathways import images
+
+logger = logging.getLogger('django')
+
+# EmailCommunication flag recording that an applicant received each email type
+EMAIL_TYPE_FLAGS = {
+    'discount_receive': 'discount_application_received',
+    'discount_enroll': 'enrolled_in_discount_program',
+    'amnesty_receive': 'amnesty_application_received',
+    'amnesty_enroll': 'enrolled_in_amnesty_program',
+}
+
+# Subject and template for each email type
+AUTOMATIC_EMAILS = {
+    'discount_receive': {
+        'subject': 'We received your application for the Buffalo Water Affordability Program',
+        'template_name': 'pathways/emails/discount_confirmation_no_docs_now.html',
+    },
+    'discount_enroll': {
+        'subject': 'You have been successfully enrolled in the Buffalo Water Affordability Program',
+        'template_name': 'pathways/emails/discount_enrolled.html',
+    },
+    'amnesty_receive': {
+        'subject': 'We received your application for the Buffalo Water Amnesty Program',
+        'template_name': 'pathways/emails/amnesty_confirmation.html',
+    },
+    'amnesty_enroll': {
+        'subject': 'You have been successfully enrolled in the Buffalo Water Amnesty Program',
+        'template_name': 'pathways/emails/amnesty_enrolled.html',
+    },
+}
 
 @shared_task  # Use this decorator to make this an asyncronous function
 def send_email(subject, recipient_list, template_name, **kwargs):
+    """Sends a templated email to each (first_name, email_address) in recipient_list
+
+    The template comes from the per-worker email template cache, and up to
+    EMAIL_BATCH_SIZE messages are sent over a single connection. Remaining recipients are queued as another
+    task EMAIL_BATCH_INTERVAL seconds later to stay under provider rate limits.
+    """
     del kwargs # unused
-    for recipient in recipient_list:
-        # Build context
-        context = {'first_name' : recipient[0] }
+    batch = recipient_list[:settings.EMAIL_BATCH_SIZE]
+    remaining = recipient_list[settings.EMAIL_BATCH_SIZE:]
 
-        # Render HTML content to string
-        html_content = render_to_string(template_name=template_name, context=context)
+    messages = [
+        build_email(first_name, email_address, subject, template_name)
+        for first_name, email_address in batch
+    ]
 
-        # Build EmailMessage with stripped HTML tags
-        msg = mail.message.EmailMultiAlternatives(subject=subject, body=strip_tags(html_content), to=[recipient[1]])
+    # Send the whole batch over one connection
+    with mail.get_connection() as connection:
+        connection.send_messages(messages)
 
-        # Attach alternative with HTML content
-        msg.attach_alternative(html_content, "text/html")
+    if remaining:
+        send_email.apply_async(
+            kwargs={'subject': subject, 'recipient_list': remaining, 'template_name': template_name},
+            countdown=settings.EMAIL_BATCH_INTERVAL
+        )
 
-        # Add msg to messages list
-        msg.send()
+def build_email(first_name, email_address, subject, template_name):
+    """Builds a templated email with its HTML alternative
 
-def send_automatic_email(email_address, email_type, subject, template_name, recipient_list):
-    # Filter to applicant's email address
-    email_coms = EmailCommunication.objects.filter(email_address=email_address)
+    The template comes from the per-worker email template cache.
+    """
+    # Only first_name is substituted, the rest of the template is cached per worker
+    text_content, html_content = email_templates.renderEmail(template_name, first_name)
 
-    # Maps to True if applicant's email address has received this email type before
-    has_received_email_type_before = {
-        'discount_receive': email_coms.filter(discount_application_received=True).exists(),
-        'discount_enroll': email_coms.filter(enrolled_in_discount_program=True).exists(),
-        'amnesty_receive': email_coms.filter(amnesty_application_received=True).exists(),
-        'amnesty_enroll': email_coms.filter(enrolled_in_amnesty_program=True).exists(),
-    }
+    # Build EmailMessage with stripped HTML tags and attach alternative with HTML content
+    msg = mail.message.EmailMultiAlternatives(subject=subject, body=text_content, to=[email_address])
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+def mark_email_sent(email_address, email_type):
+    """Sets the EmailCommunication flag for email_type and reports whether it was newly set
+
+    Addresses are matched case-insensitively, as applicants type them differently.
+    A conditional UPDATE sets the flag only if it is still False, so concurrent
+    saves for the same applicant cannot both claim the email. If no row matched,
+    the row is inserted. An IntegrityError means another transaction inserted it
+    first, possibly for a different email type, so the UPDATE is tried again.
+
+    Returns
+    -------
+    bool
+        True if this call set the flag, False if the email type was already sent
+    """
+    updated = _set_email_flag(email_address, email_type)
+    if updated is not None:
+        return updated
+
+    try:
+        with transaction.atomic():
+            EmailCommunication.objects.create(email_address=email_address, **{EMAIL_TYPE_FLAGS[email_type]: True})
+    except IntegrityError:
+        return bool(_set_email_flag(email_address, email_type))
+    return True
+
+def _set_email_flag(email_address, email_type):
+    # Returns None when the applicant has no EmailCommunication row yet
+    flag = EMAIL_TYPE_FLAGS[email_type]
+    matching = EmailCommunication.objects.filter(email_address__iexact=email_address)
+    if matching.filter(**{flag: False}).update(**{flag: True}):
+        # update() skips simple_history, record the change like save() would
+        EmailCommunication.history.bulk_history_create(matching, update=True)
+        return True
+    return False if matching.exists() else None
+
+def queue_automatic_email(email_type, first_name, email_address):
+    """Adds an email to the outbox in the current transaction
+
+    Dispatch is deferred until the transaction commits, and send_outbox_emails
+    also runs on a schedule, so nothing is lost if the broker is unavailable.
+    """
+    queue_automatic_emails(email_type, [(first_name, email_address)])
+
+def queue_automatic_emails(email_type, recipient_list):
+    """Adds an email type for many applicants to the outbox with one insert
+
+    Parameters
+    ----------
+    email_type : str
+        key of AUTOMATIC_EMAILS
+    recipient_list : list
+        list of (first_name, email_address) tuples, blank addresses are ignored
+    """
+    entries = [
+        EmailOutbox(email_type=email_type, first_name=first_name, email_address=email_address)
+        for first_name, email_address in recipient_list if email_address != ''
+    ]
+    if not entries:
+        return
+    EmailOutbox.objects.bulk_create(entries)
+    # The scheduled send_outbox_emails run picks the emails up if the broker is unavailable
+    queue_on_commit(send_outbox_emails)
 
-    # If they haven't received the email before
-    if not has_received_email_type_before[email_type]:
-        # Send email task
-        send_email.delay(subject=subject, recipient_list=recipient_list, template_name=template_name)
-        
-        defaults_for_create = {
-            'discount_receive': {'email_address': email_address, 'discount_application_received': True},
-            'discount_enroll': {'email_address': email_address, 'enrolled_in_discount_program': True},
-            'amnesty_receive': {'email_address': email_address, 'amnesty_application_received': True},
-            'amnesty_enroll': {'email_address': email_address, 'enrolled_in_amnesty_program': True},
-        }
-
-        # Get or create EmailCommunication object
-        email_com, created = EmailCommunication.objects.get_or_create(
-            email_address__iexact=email_address,
-            defaults=defaults_for_create[email_type]
+def queue_on_commit(task, *args):
+    """Queues a task once the current transaction commits
+
+    A broker that is unavailable is logged rather than raised, since the
+    transaction has already committed by then. Callers make sure the work is
+    picked up later, or that nothing is lost without it.
+    """
+    def dispatch():
+        try:
+            task.delay(*args)
+        except Exception: # pylint:disable=broad-except
+            logger.exception('Could not queue %s', task.name)
+    transaction.on_commit(dispatch)
+
+@shared_task
+def send_outbox_emails():
+    """Sends emails waiting in the outbox, once per applicant and email type
+
+    Up to EMAIL_BATCH_SIZE rows are claimed and committed before sending, so other
+    workers skip them. Only once the messages were accepted by the mail server are
+    the EmailCommunication flags set and the rows deleted. If sending fails the
+    claims are released for the next run, and claims of a worker that died are
+    taken over after EMAIL_OUTBOX_CLAIM_SECONDS. A failure partway through a batch
+    can send some emails twice, but none are lost.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_SECONDS)
+    with transaction.atomic():
+        outbox = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale))
+            .order_by('id')[:settings.EMAIL_BATCH_SIZE]
         )
-        # Change and save EmailCommunication object if it already existed
-        if not created:
-            if email_type == 'discount_receive':
-                email_com.discount_application_received = True
-            elif email_type == 'discount_enroll':
-                email_com.enrolled_in_discount_program = True
-            elif email_type == 'amnesty_receive':
-                email_com.amnesty_application_received = True
-            elif email_type == 'amnesty_enroll':
-                email_com.enrolled_in_amnesty_program = True
-            else:
-                raise ValueError("Invalid email_type")
-            email_com.save()
\ No newline at end of file
+        if not outbox:
+            return
+        claimed_ids = [entry.id for entry in outbox]
+        EmailOutbox.objects.filter(id__in=claimed_ids).update(claimed_at=now)
+
+    # Skip applicants who already got the email, and repeated rows for the same one,
+    # matching addresses case-insensitively like mark_email_sent()
+    flags = {
+        email_com['address']: email_com
+        for email_com in EmailCommunication.objects.annotate(address=Lower('email_address')).filter(
+            address__in={entry.email_address.lower() for entry in outbox}
+        ).values('address', *EMAIL_TYPE_FLAGS.values())
+    }
+    pending = {}
+    for entry in outbox:
+        address = entry.email_address.lower()
+        sent = flags.get(address, {}).get(EMAIL_TYPE_FLAGS[entry.email_type], False)
+        if not sent:
+            pending.setdefault((entry.email_type, address), entry)
+
+    messages = [
+        build_email(entry.first_name, entry.email_address, **AUTOMATIC_EMAILS[entry.email_type])
+        for entry in pending.values()
+    ]
+    if messages:
+        try:
+            with mail.get_connection() as connection:
+                connection.send_messages(messages)
+        except Exception: # pylint:disable=broad-except
+            EmailOutbox.objects.filter(id__in=claimed_ids).update(claimed_at=None)
+            logger.exception('Could not send outbox emails, they will be retried')
+            return
+
+    with transaction.atomic():
+        for entry in pending.values():
+            mark_email_sent(entry.email_address, entry.email_type)
+        EmailOutbox.objects.filter(id__in=claimed_ids).delete()
+
+    if len(outbox) == settings.EMAIL_BATCH_SIZE:
+        # More may be waiting, send them after the interval to stay under provider rate limits
+        try:
+            send_outbox_emails.apply_async(countdown=settings.EMAIL_BATCH_INTERVAL)
+        except Exception: # pylint:disable=broad-except
+            logger.exception('Could not queue send_outbox_emails')
+
+def queue_document_processing(document_ids):
+    """Processes new documents in the background once the current transaction commits"""
+    # Documents are still usable if this is lost, only larger and without a thumbnail
+    queue_on_commit(process_documents, document_ids)
+
+@shared_task
+def process_documents(document_ids):
+    """Downscales uploaded document images and saves their admin thumbnails"""
+    for doc in Document.objects.filter(id__in=document_ids, thumbnail='').exclude(doc_file=''):
+        try:
+            images.processDocument(doc)
+        except Exception: # pylint:disable=broad-except
+            logger.exception('Could not process document %s', doc.id)
+
+def queue_thumbnails(document_ids):
+    """Saves the thumbnails of existing documents in the background once the current transaction commits"""
+    # The admin shows no preview until the next time the page is opened if this is lost
+    queue_on_commit(save_thumbnails, document_ids)
+
+@shared_task
+def save_thumbnails(document_ids):
+    """Saves admin thumbnails of document images without changing the documents"""
+    for doc in Document.objects.filter(id__in=document_ids, thumbnail='').exclude(doc_file=''):
+        try:
+            images.saveThumbnail(doc)
+        except Exception: # pylint:disable=broad-except
+            logger.exception('Could not save the thumbnail of document %s', doc.id)
+
+@shared_task
+def clear_expired_sessions():
+    """Deletes expired sessions from the configured session store
+
+    Signed cookie sessions are not stored on the server, so there is nothing to delete.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    try:
+        engine.SessionStore.clear_expired()
+    except NotImplementedError:
+        pass
@@ -0,0 +1,10 @@
+from django import template
+
+from pathways import helpers
+
+register = template.Library()
+
+@register.filter
+def currency(amount):
+    """Writes an amount as whole dollars in the active language, see helpers.formatCurrency()"""
+    return helpers.formatCurrency(amount)
@@ -0,0 +1,13 @@
+from pathways.models import Application
+
+# Fields of a complete discount application, shared by the tests
+APPLICATION_FIELDS = dict(
+    household_size=1, has_household_benefits=True, first_name='Test', last_name='User',
+    rent_or_own='own', street_address='123 Main St', zip_code='14202', phone_number='716-555-5555',
+    account_holder='me', account_first='Test', account_last='User', legal_agreement=True,
+    signature='Test User',
+)
+
+def createApplication(**fields):
+    """Creates an Application from APPLICATION_FIELDS, updated with the given fields"""
+    return Application.objects.create(**dict(APPLICATION_FIELDS, **fields))
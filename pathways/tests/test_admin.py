@@ -0,0 +1,180 @@
+import csv
+from unittest import mock
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from pathways import images
+from pathways.admin import ApplicationAdmin, DocumentInline, ForgivenessApplicationAdmin
+from pathways.models import Application, Document, ForgivenessApplication
+from pathways.tests import createApplication
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class ApplicationAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.app_1 = createApplication(has_household_benefits=False, annual_income=10000, rent_or_own='rent')
+        cls.app_1.status = 'in_progress'
+        cls.app_1.save()
+        Document.objects.create(application=cls.app_1, doc_type='residence')
+        Document.objects.create(application=cls.app_1, doc_type='income')
+        cls.app_2 = createApplication(
+            household_size=2, first_name='Other', street_address='456 Main St', phone_number='716-555-5556',
+            account_first='Other', signature='Other User'
+            )
+        Document.objects.create(application=cls.app_2, doc_type='benefits')
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.model_admin = ApplicationAdmin(Application, AdminSite())
+
+    def test_list_columns_read_annotations(self):
+        queryset = self.model_admin.get_queryset(self.request).order_by('id')
+        with self.assertNumQueries(1):
+            rows = [
+                (self.model_admin.date_created(app), self.model_admin.has_residence_docs(app),
+                 self.model_admin.has_eligible_docs(app), app.discount_amount)
+                for app in queryset
+            ]
+        self.assertEqual(rows[0][0], self.app_1.created_at)
+        self.assertEqual(rows[0][1:], (True, True, 90))
+        self.assertEqual(rows[1][1:], (False, True, 90))
+
+    def test_search_with_one_match_opens_application(self):
+        request = RequestFactory().get('/', {'q': 'Other'})
+        request.user = self.request.user
+        response = self.model_admin.changelist_view(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('admin:pathways_application_change', args=[self.app_2.id]))
+
+    def test_changelist_filters_by_discount_tier(self):
+        Application.objects.filter(pk=self.app_2.pk).update(annual_income=60000)
+        request = RequestFactory().get('/', {'discount_tier': '60'})
+        request.user = self.request.user
+        response = self.model_admin.changelist_view(request)
+        self.assertEqual([app.id for app in response.context_data['cl'].result_list], [self.app_2.id])
+
+    def test_changelist_ignores_unknown_discount_tier(self):
+        request = RequestFactory().get('/', {'discount_tier': 'x'})
+        request.user = self.request.user
+        response = self.model_admin.changelist_view(request)
+        # The admin redirects to the unfiltered list, flagged with ?e=1
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.endswith('?e=1'))
+
+    def test_changelist_sortable_by_created_at(self):
+        queryset = self.model_admin.get_queryset(self.request).order_by('-created_at')
+        self.assertEqual([app.id for app in queryset], [self.app_2.id, self.app_1.id])
+
+    def test_enroll_action_locks_rows_without_grouping(self):
+        select_for_update = QuerySet.select_for_update
+        locked_querysets = []
+        def recordLock(queryset, *args, **kwargs):
+            locked_querysets.append(queryset)
+            return select_for_update(queryset, *args, **kwargs)
+
+        queryset = self.model_admin.get_queryset(self.request)
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=recordLock):
+            self.model_admin.make_enrolled(self.request, queryset)
+        self.assertEqual(set(Application.objects.values_list('status', flat=True)), {'enrolled'})
+        # Postgres rejects FOR UPDATE with GROUP BY, which SQLite does not check
+        self.assertEqual(len(locked_querysets), 1)
+        self.assertIsNone(locked_querysets[0].query.group_by)
+        self.assertNotIn('GROUP BY', str(locked_querysets[0].query).split('IN (SELECT')[0])
+
+    def test_export_csv_streams_selected_applications(self):
+        queryset = self.model_admin.get_queryset(self.request).filter(pk=self.app_1.pk)
+        response = self.model_admin.export_csv(self.request, queryset)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="application-', response['Content-Disposition'])
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], str(self.app_1.id))
+        self.assertEqual(rows[0]['discount_tier'], '90')
+        self.assertEqual(rows[0]['document_count'], '2')
+        self.assertEqual(sorted(rows[0]['document_types'].split(';')), ['income', 'residence'])
+        self.assertNotIn('lookup_key', rows[0])
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class ForgivenessApplicationAdminTest(TestCase):
+    def test_date_created_reads_column(self):
+        app = ForgivenessApplication.objects.create(
+            first_name='Test', last_name='User', street_address='123 Main St', zip_code='14202',
+            phone_number='716-555-5555'
+            )
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        model_admin = ForgivenessApplicationAdmin(ForgivenessApplication, AdminSite())
+        with self.assertNumQueries(1):
+            row = model_admin.get_queryset(request).get()
+            date_created = model_admin.date_created(row)
+        self.assertEqual(date_created, app.created_at)
+
+    def test_export_csv_streams_selected_applications(self):
+        app = ForgivenessApplication.objects.create(
+            first_name='Test', last_name='User', street_address='123 Main St', zip_code='14202',
+            phone_number='716-555-5555'
+            )
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        model_admin = ForgivenessApplicationAdmin(ForgivenessApplication, AdminSite())
+        response = model_admin.export_csv(request, model_admin.get_queryset(request))
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([(row['id'], row['last_name']) for row in rows], [(str(app.id), 'User')])
+        self.assertNotIn('document_count', rows[0])
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True,
+                   DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_URL='/media/')
+class DocumentInlineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = createApplication()
+        cls.photo = Document.objects.create(application=cls.app, doc_type='income',
+            doc_file='documents/a.jpg', thumbnail='thumbnails/1.jpg')
+        cls.scan = Document.objects.create(application=cls.app, doc_type='benefits', doc_file='documents/b.png')
+        cls.pdf = Document.objects.create(application=cls.app, doc_type='residence', doc_file='documents/c.pdf')
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.inline = DocumentInline(Application, AdminSite())
+
+    def test_urls_signed_once_for_whole_inline(self):
+        signed = {
+            'documents/a.jpg': 'https://signed/a', 'documents/b.png': 'https://signed/b',
+            'documents/c.pdf': 'https://signed/c', 'thumbnails/1.jpg': 'https://signed/thumb',
+        }
+        with mock.patch('pathways.admin.uploads.getSignedUrls', return_value=signed) as getSignedUrls, \
+                mock.patch('pathways.admin.tasks.queue_thumbnails'):
+            formset = self.inline.get_formset(self.request, self.app)(instance=self.app)
+            rendered = ''.join(form['doc_file'].as_widget() for form in formset)
+            previews = [self.inline.preview(form.instance) for form in formset]
+        getSignedUrls.assert_called_once()
+        for url in ['https://signed/a', 'https://signed/b', 'https://signed/c']:
+            self.assertIn(url, rendered)
+        self.assertIn('https://signed/thumb', ''.join(previews))
+        self.assertEqual(previews.count('-'), 2)
+
+    def test_missing_image_thumbnails_queued(self):
+        with mock.patch('pathways.admin.tasks.queue_thumbnails') as queue_thumbnails:
+            self.inline.get_formset(self.request, self.app)
+        queue_thumbnails.assert_called_once_with([self.scan.id])
+
+    def test_undecodable_images_not_queued_again(self):
+        Document.objects.filter(id=self.scan.id).update(thumbnail=images.NO_THUMBNAIL)
+        with mock.patch('pathways.admin.uploads.getSignedUrls', return_value={}) as getSignedUrls, \
+                mock.patch('pathways.admin.tasks.queue_thumbnails') as queue_thumbnails:
+            self.inline.get_formset(self.request, self.app)
+        queue_thumbnails.assert_not_called()
+        self.assertNotIn(images.NO_THUMBNAIL, getSignedUrls.call_args[0][0])
+        self.scan.refresh_from_db()
+        self.assertEqual(self.inline.preview(self.scan), '-')
+
+    def test_new_application_has_nothing_to_sign(self):
+        with mock.patch('pathways.admin.uploads.getSignedUrls') as getSignedUrls:
+            self.inline.get_formset(self.request, None)
+        getSignedUrls.assert_not_called()
@@ -0,0 +1,169 @@
+import csv
+import os
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+from storages.backends.s3boto3 import S3Boto3Storage
+from pathways import exports
+from pathways.management.commands.purge_unused_docs import delete_stored_files
+from pathways.models import Application, Document
+from pathways.tests import createApplication
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True,
+                   DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+class PurgeUnusedDocsTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.docs = {}
+        for status in ['new', 'in_progress', 'enrolled', 'denied']:
+            app = createApplication(last_name=status, status=status)
+            for doc_type in ['benefits', 'residence']:
+                doc = Document(application=app, doc_type=doc_type)
+                doc.doc_file.save(f'{status}-{doc_type}.pdf', ContentFile(b'%PDF-1.4'), save=True)
+                self.docs.setdefault(status, []).append(doc)
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+        call_command('purge_unused_docs', '--dry-run', stdout=out)
+        self.assertIn('4 documents would be purged', out.getvalue())
+        self.assertEqual(Document.objects.count(), 8)
+
+    def test_purges_documents_of_reviewed_applications(self):
+        out = StringIO()
+        call_command('purge_unused_docs', '--chunk-size=3', '--workers=2', stdout=out)
+        self.assertIn('Purged 3 of 4 documents', out.getvalue())
+        self.assertIn('Purged 4 of 4 documents', out.getvalue())
+
+        self.assertEqual(set(Document.objects.values_list('application__status', flat=True)), {'new', 'in_progress'})
+        for status, docs in self.docs.items():
+            for doc in docs:
+                self.assertEqual(os.path.exists(doc.doc_file.path), status in ['new', 'in_progress'])
+                if status in ['enrolled', 'denied']:
+                    self.assertEqual(Document.history.filter(id=doc.id).latest().history_type, '-')
+
+    def test_documents_kept_when_files_not_deleted(self):
+        failed_name = self.docs['enrolled'][0].doc_file.name
+        with mock.patch('pathways.management.commands.purge_unused_docs.delete_stored_files',
+                        return_value={failed_name}):
+            call_command('purge_unused_docs', stdout=StringIO())
+        self.assertEqual(
+            list(Document.objects.exclude(application__status__in=['new', 'in_progress']).values_list('id', flat=True)),
+            [self.docs['enrolled'][0].id]
+        )
+
+
+class DeleteStoredFilesTest(TestCase):
+    def test_s3_files_deleted_with_one_request(self):
+        storage = S3Boto3Storage(bucket_name='documents')
+        connection = mock.MagicMock()
+        with mock.patch.object(S3Boto3Storage, 'connection', new_callable=mock.PropertyMock, return_value=connection):
+            delete_stored_files(storage, ['documents/1.pdf', 'documents/2.png'])
+            delete_stored_files(storage, [])
+        connection.meta.client.delete_objects.assert_called_once_with(
+            Bucket='documents',
+            Delete={'Objects': [{'Key': 'documents/1.pdf'}, {'Key': 'documents/2.png'}], 'Quiet': True}
+        )
+
+    def test_s3_errors_reported(self):
+        storage = S3Boto3Storage(bucket_name='documents')
+        connection = mock.MagicMock()
+        connection.meta.client.delete_objects.return_value = {
+            'Errors': [{'Key': 'documents/2.png', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]
+        }
+        with mock.patch.object(S3Boto3Storage, 'connection', new_callable=mock.PropertyMock, return_value=connection):
+            failed = delete_stored_files(storage, ['documents/1.pdf', 'documents/2.png'])
+        self.assertEqual(failed, {'documents/2.png'})
+
+    def test_s3_deletes_split_at_request_limit(self):
+        storage = S3Boto3Storage(bucket_name='documents')
+        connection = mock.MagicMock()
+        with mock.patch.object(S3Boto3Storage, 'connection', new_callable=mock.PropertyMock, return_value=connection):
+            delete_stored_files(storage, [f'documents/{i}.pdf' for i in range(1500)])
+        calls = connection.meta.client.delete_objects.call_args_list
+        self.assertEqual([len(call[1]['Delete']['Objects']) for call in calls], [1000, 500])
+
+
+class BenchmarkSessionsTest(TestCase):
+    def test_queries_counted_for_each_store(self):
+        out = StringIO()
+        call_command('benchmark_sessions', stdout=out)
+        counts = {}
+        for line in out.getvalue().splitlines():
+            store, session_queries = line.split(': ')[0], int(line.split(': ')[1].split()[0])
+            counts[store] = session_queries
+
+        self.assertEqual(list(counts), ['db', 'cached_db', 'signed_cookies'])
+        self.assertEqual(counts['signed_cookies'], 0)
+        self.assertLess(counts['cached_db'], counts['db'])
+        self.assertEqual(Application.objects.count(), 0)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class ExportApplicationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.apps = []
+        for index in range(3):
+            app = createApplication(last_name=f'User {index}')
+            cls.apps.append(app)
+        Document.objects.create(application=cls.apps[0], doc_type='residence', doc_file='documents/a.pdf')
+        Document.objects.create(application=cls.apps[2], doc_type='benefits', doc_file='documents/b.pdf')
+        Document.objects.create(application=cls.apps[2], doc_type='income', doc_file='documents/c.pdf')
+
+    def test_csv_merges_documents_across_chunks(self):
+        out = StringIO()
+        call_command('export_applications', '--chunk-size', '1', stdout=out)
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual([row['id'] for row in rows], [str(app.id) for app in self.apps])
+        self.assertEqual([row['document_count'] for row in rows], ['1', '0', '2'])
+        self.assertEqual(rows[2]['document_files'], 'documents/b.pdf;documents/c.pdf')
+
+    def test_csv_escapes_formulas(self):
+        Application.objects.filter(pk=self.apps[1].pk).update(
+            first_name='=HYPERLINK("http://example.com")', last_name='-2+3', notes='@SUM(A1)'
+        )
+        out = StringIO()
+        call_command('export_applications', stdout=out)
+        row = list(csv.DictReader(out.getvalue().splitlines()))[1]
+        self.assertEqual(row['first_name'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(row['last_name'], "'-2+3")
+        self.assertEqual(row['notes'], "'@SUM(A1)")
+        self.assertEqual(row['street_address'], '123 Main St')
+
+    def test_csv_written_to_output_file(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        path = os.path.join(output_dir.name, 'applications.csv')
+        call_command('export_applications', '--output', path)
+        with open(path, newline='', encoding='utf-8') as output:
+            rows = list(csv.DictReader(output))
+        self.assertEqual(len(rows), 3)
+
+    def test_parquet_needs_pyarrow(self):
+        with mock.patch('pathways.exports.pyarrow', None), self.assertRaises(CommandError):
+            call_command('export_applications', '--format', 'parquet', '--output', 'applications.parquet')
+
+    @unittest.skipUnless(exports.pyarrow, 'pyarrow is not installed')
+    def test_parquet_written_in_chunks(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        path = os.path.join(output_dir.name, 'applications.parquet')
+        call_command('export_applications', '--format', 'parquet', '--output', path, '--chunk-size', '2')
+
+        parquet_file = exports.pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet_file.num_row_groups, 2)
+        table = parquet_file.read()
+        self.assertEqual(table.schema.names, exports.getExportColumns(Application))
+        self.assertEqual(table.column('id').to_pylist(), [app.id for app in self.apps])
+        self.assertEqual(table.column('document_count').to_pylist(), [1, 0, 2])
+        self.assertEqual(table.column('has_household_benefits').to_pylist(), [True] * 3)
+        self.assertEqual(table.column('document_files').to_pylist()[2], 'documents/b.pdf;documents/c.pdf')
@@ -0,0 +1,83 @@
+import datetime
+from django.test import TestCase, override_settings
+from pathways import eligibility
+from pathways.models import Application, ThresholdSchedule, IncomeThreshold
+
+def createLaterSchedule():
+    """Adds a schedule with higher limits, in force from 2021 on"""
+    schedule = ThresholdSchedule.objects.create(version='2', effective_date=datetime.date(2021, 1, 1))
+    IncomeThreshold.objects.bulk_create([
+        IncomeThreshold(schedule=schedule, household_size=size,
+                        income_limit=50000 + 1000 * size, very_low_income_limit=30000 + 1000 * size)
+        for size in range(1, 9)
+    ])
+    # bulk_create sends no post_save signals
+    eligibility.clearThresholdCache()
+    return schedule
+
+
+class ThresholdTableTest(TestCase):
+    def setUp(self):
+        self.addCleanup(eligibility.clearThresholdCache)
+
+    def test_table_in_force_on_date(self):
+        createLaterSchedule()
+        self.assertEqual(eligibility.getThresholdTable(datetime.date(2018, 6, 1)).version, '1')
+        self.assertEqual(eligibility.getThresholdTable(datetime.date(2020, 12, 31)).version, '1')
+        self.assertEqual(eligibility.getThresholdTable(datetime.date(2021, 1, 1)).version, '2')
+
+    def test_cached_until_schedule_saved(self):
+        eligibility.getThresholdTable()
+        with self.assertNumQueries(0):
+            eligibility.getThresholdTable()
+
+        threshold = IncomeThreshold.objects.get(schedule__version='1', household_size=1)
+        threshold.income_limit = 42000
+        threshold.save()
+        self.assertEqual(eligibility.getThresholdTable().income[1], 42000)
+
+    def test_incomplete_schedule_skipped(self):
+        schedule = createLaterSchedule()
+        IncomeThreshold.objects.filter(schedule=schedule, household_size=8).delete()
+        self.assertEqual(eligibility.getThresholdTable(datetime.date(2021, 6, 1)).version, '1')
+
+    def test_discount_tier_at_limit(self):
+        self.assertEqual(eligibility.getDiscountTier(2, 29900), eligibility.VERY_LOW_INCOME_DISCOUNT)
+        self.assertEqual(eligibility.getDiscountTier(2, 29901), eligibility.LOW_INCOME_DISCOUNT)
+        self.assertTrue(eligibility.isIncomeEligible(1, 41850))
+        self.assertFalse(eligibility.isIncomeEligible(1, 41851))
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class DiscountTierAnnotationTest(TestCase):
+    def setUp(self):
+        self.addCleanup(eligibility.clearThresholdCache)
+
+    def createApplication(self, household_size, annual_income, created_at):
+        app = Application.objects.create(
+            household_size=household_size, has_household_benefits=False, annual_income=annual_income,
+            first_name='Test', last_name='User', rent_or_own='own', street_address='123 Main St',
+            zip_code='14202', phone_number='716-555-5555', account_holder='me', account_first='Test',
+            account_last='User', legal_agreement=True, signature='Test User'
+            )
+        Application.objects.filter(pk=app.pk).update(created_at=created_at)
+        return Application.objects.get(pk=app.pk)
+
+    def test_annotation_matches_discount_amount(self):
+        before = datetime.datetime(2020, 6, 1, 12, tzinfo=datetime.timezone.utc)
+        after = datetime.datetime(2021, 6, 1, 12, tzinfo=datetime.timezone.utc)
+        createLaterSchedule()
+        apps = [
+            self.createApplication(household_size, annual_income, created_at)
+            for household_size in (1, 4)
+            for annual_income in (26150, 31000, 40000)
+            for created_at in (before, after)
+        ]
+        tiers = dict(eligibility.annotateDiscountTier(Application.objects.all())
+                     .values_list('id', 'discount_tier'))
+        self.assertEqual(tiers, {app.id: app.discount_amount for app in apps})
+        # Same income and household, tiered by the schedule in force when it was made
+        self.assertEqual(
+            [app.discount_amount for app in apps if app.household_size == 1 and app.annual_income == 31000],
+            [eligibility.LOW_INCOME_DISCOUNT, eligibility.VERY_LOW_INCOME_DISCOUNT]
+        )
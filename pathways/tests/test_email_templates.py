@@ -0,0 +1,46 @@
+import os
+import tempfile
+from django.test import TestCase, override_settings
+from django.utils.translation import override
+from pathways import email_templates
+
+class EmailTemplateCacheTest(TestCase):
+    def setUp(self):
+        email_templates.clearEmailCache()
+        self.template_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.template_dir.cleanup)
+        self.path = os.path.join(self.template_dir.name, 'greeting.html')
+        self.write_template('<p>Hello {{ first_name }}</p>', mtime=1000)
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [self.template_dir.name],
+        }]
+        settings_override = override_settings(TEMPLATES=templates)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_template(self, source, mtime):
+        with open(self.path, 'w', encoding='utf-8') as template_file:
+            template_file.write(source)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_first_name_substituted_per_recipient(self):
+        self.assertEqual(email_templates.renderEmail('greeting.html', 'Alex'), ('Hello Alex', '<p>Hello Alex</p>'))
+        self.assertEqual(email_templates.renderEmail('greeting.html', '<Sam>'),
+                         ('Hello &lt;Sam&gt;', '<p>Hello &lt;Sam&gt;</p>'))
+
+    def test_cached_by_template_and_language(self):
+        with override('en'):
+            email_templates.renderEmail('greeting.html', 'Alex')
+        with override('es'):
+            email_templates.renderEmail('greeting.html', 'Alex')
+        self.assertEqual(set(email_templates._skeleton_cache), {('greeting.html', 'en'), ('greeting.html', 'es')})
+
+    def test_invalidated_when_template_file_changes(self):
+        email_templates.renderEmail('greeting.html', 'Alex')
+        self.write_template('<p>Hi {{ first_name }}</p>', mtime=1000)
+        # Same modification time, so the cached version is still used
+        self.assertEqual(email_templates.renderEmail('greeting.html', 'Alex')[0], 'Hello Alex')
+
+        os.utime(self.path, (2000, 2000))
+        self.assertEqual(email_templates.renderEmail('greeting.html', 'Alex')[0], 'Hi Alex')
@@ -0,0 +1,64 @@
+from django.test import TestCase, override_settings
+from django.utils.translation import override
+from pathways import helpers
+from pathways.models import Application
+
+class GetLookupKeyTest(TestCase):
+    def test_names_and_numbers_normalized(self):
+        self.assertEqual(
+            helpers.getLookupKey(' Mary  Ann ', "O'Brien", '14202', '1 (716) 555-5555'),
+            "o'brien|mary ann|14202|7165555555"
+        )
+
+
+class FormatCurrencyTest(TestCase):
+    def test_whole_dollars_grouped(self):
+        with override('en'):
+            self.assertEqual(helpers.formatCurrency(41850), '$41,850')
+            self.assertEqual(helpers.formatCurrency(31200.6), '$31,201')
+
+    def test_unanswered_amount_is_zero(self):
+        self.assertEqual(helpers.formatCurrency('', language='en'), '$0')
+        self.assertEqual(helpers.formatCurrency(None, language='en'), '$0')
+
+    def test_separator_follows_language(self):
+        self.assertEqual(helpers.formatCurrency(1234567, language='de'), '$1.234.567')
+
+
+class GetFingerprintTest(TestCase):
+    def test_session_strings_hash_like_typed_values(self):
+        fields = ('household_size', 'has_household_benefits', 'first_name')
+        from_session = Application(household_size='2', has_household_benefits='True', first_name='Test')
+        from_database = Application(household_size=2, has_household_benefits=True, first_name='Test')
+        self.assertEqual(helpers.getFingerprint(from_session, fields), helpers.getFingerprint(from_database, fields))
+        self.assertNotEqual(
+            helpers.getFingerprint(from_session, fields),
+            helpers.getFingerprint(Application(household_size=2, has_household_benefits=False, first_name='Test'), fields)
+        )
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class MatchApplicationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for last_name in ['User', 'User', 'Other']:
+            Application.objects.create(
+                household_size=1, has_household_benefits=True, first_name='Test', last_name=last_name,
+                rent_or_own='own', street_address='123 Main St', zip_code='14202', phone_number='716-555-5555',
+                account_holder='me', account_first='Test', account_last=last_name, legal_agreement=True,
+                signature='Test User'
+                )
+
+    def test_no_match(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(helpers.matchApplications(Application.objects.filter(last_name='None')), (0, None))
+
+    def test_single_match(self):
+        other = Application.objects.get(last_name='Other')
+        with self.assertNumQueries(1):
+            self.assertEqual(helpers.matchApplications(Application.objects.filter(last_name='Other')), (1, other.id))
+
+    def test_many_matches(self):
+        with self.assertNumQueries(1):
+            match_count, app_id = helpers.matchApplications(Application.objects.all())
+        self.assertEqual((match_count, app_id), (helpers.MANY_MATCHES, None))
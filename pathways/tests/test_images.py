@@ -0,0 +1,169 @@
+import tempfile
+from io import BytesIO
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from pathways import images
+from pathways.models import Document
+from pathways.tasks import process_documents, queue_document_processing, queue_thumbnails, save_thumbnails
+from pathways.tests import createApplication
+
+def makeImageBytes(image_format, size=(3000, 1500), frames=1):
+    pages = [Image.new('RGB', size, color=(255, 255 - 40 * i, 255)) for i in range(frames)]
+    buffer = BytesIO()
+    if frames > 1:
+        pages[0].save(buffer, image_format, save_all=True, append_images=pages[1:])
+    else:
+        pages[0].save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class NormalizeImageTest(TestCase):
+    def test_large_jpeg_downscaled(self):
+        content, extension = images.normalizeImage(images.openImage(BytesIO(makeImageBytes('JPEG'))))
+        self.assertEqual(extension, 'jpg')
+        self.assertEqual(Image.open(content).size, (2000, 1000))
+
+    def test_small_png_kept_as_png(self):
+        content, extension = images.normalizeImage(images.openImage(BytesIO(makeImageBytes('PNG', size=(300, 200)))))
+        self.assertEqual(extension, 'png')
+        self.assertEqual(Image.open(content).size, (300, 200))
+
+    def test_tiff_converted_to_jpeg(self):
+        content, extension = images.normalizeImage(images.openImage(BytesIO(makeImageBytes('TIFF'))))
+        self.assertEqual(extension, 'jpg')
+        self.assertEqual(Image.open(content).format, 'JPEG')
+
+    def test_multi_page_tiff_converted_to_pdf(self):
+        content, extension = images.normalizeImage(images.openImage(BytesIO(makeImageBytes('TIFF', frames=3))))
+        self.assertEqual(extension, 'pdf')
+        self.assertTrue(content.read().startswith(b'%PDF'))
+
+    def test_thumbnail_fits_bounding_box(self):
+        thumbnail = images.makeThumbnail(images.openImage(BytesIO(makeImageBytes('PNG'))))
+        self.assertEqual(Image.open(thumbnail).size, (200, 100))
+
+    def test_pdf_not_opened(self):
+        self.assertIsNone(images.openImage(BytesIO(b'%PDF-1.4 not an image')))
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True,
+                   DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+class ProcessDocumentsTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.app = createApplication()
+
+    def createDocument(self, filename, content):
+        doc = Document(application=self.app, doc_type='income')
+        doc.doc_file.save(filename, ContentFile(content), save=True)
+        return doc
+
+    def test_tiff_replaced_and_thumbnail_saved(self):
+        doc = self.createDocument('scan.tiff', makeImageBytes('TIFF'))
+        original_name = doc.doc_file.name
+
+        process_documents([doc.id])
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.doc_file.name, f'documents/{doc.pk}.jpg')
+        self.assertEqual(doc.thumbnail.name, f'thumbnails/{doc.pk}.jpg')
+        self.assertFalse(doc.doc_file.storage.exists(original_name))
+        with doc.thumbnail.open('rb') as f:
+            self.assertEqual(Image.open(f).size, (200, 100))
+
+    def test_lazy_thumbnail_keeps_original(self):
+        doc = self.createDocument('scan.tiff', makeImageBytes('TIFF'))
+        original_name = doc.doc_file.name
+
+        save_thumbnails([doc.id])
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.doc_file.name, original_name)
+        self.assertTrue(doc.doc_file.storage.exists(original_name))
+        self.assertEqual(doc.thumbnail.name, f'thumbnails/{doc.pk}.jpg')
+
+    def test_undecodable_image_not_retried(self):
+        doc = self.createDocument('photo.png', makeImageBytes('PNG')[:200])
+
+        save_thumbnails([doc.id])
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.thumbnail.name, images.NO_THUMBNAIL)
+        with mock.patch('pathways.tasks.images.saveThumbnail') as saveThumbnail:
+            save_thumbnails([doc.id])
+        saveThumbnail.assert_not_called()
+
+    def test_thumbnail_failure_does_not_stop_other_documents(self):
+        broken = self.createDocument('broken.png', makeImageBytes('PNG'))
+        doc = self.createDocument('photo.png', makeImageBytes('PNG'))
+        original_save = images.saveThumbnail
+
+        def saveThumbnail(document):
+            if document.id == broken.id:
+                raise IOError('storage unavailable')
+            return original_save(document)
+
+        with mock.patch('pathways.tasks.images.saveThumbnail', side_effect=saveThumbnail), \
+                self.assertLogs('django', 'ERROR'):
+            save_thumbnails([broken.id, doc.id])
+
+        broken.refresh_from_db()
+        doc.refresh_from_db()
+        self.assertFalse(broken.thumbnail)
+        self.assertEqual(doc.thumbnail.name, f'thumbnails/{doc.pk}.jpg')
+
+    def test_pdf_left_unchanged(self):
+        doc = self.createDocument('stub.pdf', b'%PDF-1.4 page')
+        original_name = doc.doc_file.name
+
+        process_documents([doc.id])
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.doc_file.name, original_name)
+        self.assertFalse(doc.thumbnail)
+
+    def test_failure_does_not_stop_other_documents(self):
+        broken = self.createDocument('broken.png', makeImageBytes('PNG'))
+        doc = self.createDocument('photo.png', makeImageBytes('PNG'))
+        original_process = images.processDocument
+
+        def processDocument(document):
+            if document.id == broken.id:
+                raise OSError('truncated')
+            return original_process(document)
+
+        with mock.patch('pathways.tasks.images.processDocument', side_effect=processDocument):
+            process_documents([broken.id, doc.id])
+
+        doc.refresh_from_db()
+        self.assertTrue(doc.thumbnail)
+
+    def test_queued_after_commit(self):
+        with mock.patch('pathways.tasks.transaction.on_commit') as on_commit, \
+                mock.patch('pathways.tasks.process_documents.delay') as delay:
+            queue_document_processing([1, 2])
+            delay.assert_not_called()
+            on_commit.call_args[0][0]()
+        delay.assert_called_once_with([1, 2])
+
+    def test_thumbnails_queued_after_commit(self):
+        with mock.patch('pathways.tasks.transaction.on_commit') as on_commit, \
+                mock.patch('pathways.tasks.save_thumbnails.delay') as delay:
+            queue_thumbnails([1, 2])
+            delay.assert_not_called()
+            on_commit.call_args[0][0]()
+        delay.assert_called_once_with([1, 2])
+
+    def test_thumbnails_not_queued_without_broker(self):
+        with mock.patch('pathways.tasks.transaction.on_commit') as on_commit, \
+                mock.patch('pathways.tasks.save_thumbnails.delay', side_effect=OSError('broker down')), \
+                self.assertLogs('django', 'ERROR'):
+            queue_thumbnails([1])
+            on_commit.call_args[0][0]()
@@ -0,0 +1,51 @@
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from pathways import income
+from pathways.models import Application
+from pathways.tests import createApplication
+
+class GetAnnualIncomeTest(TestCase):
+    def test_pay_periods(self):
+        self.assertEqual(income.getAnnualIncome([income.makeIncomeSource('exact', 1000, 'biweekly')]),
+                         Decimal('26000.00'))
+        self.assertEqual(income.getAnnualIncome([income.makeIncomeSource('estimate', 2000, 'semimonthly')]),
+                         Decimal('48000.00'))
+
+    def test_hourly_and_non_job_sources_added(self):
+        sources = [income.makeIncomeSource('hourly', 15.5, 40), income.makeNonJobIncomeSource(100.1)]
+        self.assertEqual(income.getAnnualIncome(sources), Decimal('33441.20'))
+
+    def test_no_float_rounding_error(self):
+        sources = [income.makeNonJobIncomeSource(0.1) for _ in range(3)]
+        self.assertEqual(income.getAnnualIncome(sources), Decimal('3.60'))
+
+    def test_no_sources(self):
+        self.assertEqual(income.getAnnualIncome([]), Decimal('0.00'))
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class RecomputeAnnualIncomesTest(TestCase):
+    def setUp(self):
+        self.apps = []
+        for income_sources, annual_income in [
+                ([income.makeIncomeSource('exact', 1000, 'biweekly')], 25000),
+                ([income.makeIncomeSource('exact', 500, 'weekly')], 26000),
+                ([], 12000)]:
+            self.apps.append(createApplication(
+                has_household_benefits=False, income_sources=income_sources, annual_income=annual_income
+                ))
+
+    def test_changed_incomes_saved_with_history(self):
+        self.assertEqual(income.recomputeAnnualIncomes(Application.objects.all(), batch_size=1), 1)
+        incomes = [Application.objects.get(pk=app.pk).annual_income for app in self.apps]
+        self.assertEqual(incomes, [Decimal('26000.00'), Decimal('26000.00'), Decimal('12000.00')])
+        self.assertEqual(self.apps[0].history.first().history_change_reason,
+                         'Recomputed annual income from income sources')
+
+    def test_command_dry_run_saves_nothing(self):
+        out = StringIO()
+        call_command('recompute_annual_income', '--dry-run', stdout=out)
+        self.assertIn('1 applications would change', out.getvalue())
+        self.assertEqual(Application.objects.get(pk=self.apps[0].pk).annual_income, Decimal('25000.00'))
@@ -0,0 +1,130 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from pathways.models import ForgivenessApplication, ProgramMetricsSnapshot, Referral
+from pathways import metrics
+from pathways.tests import createApplication
+
+class ReferralCountsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Referral.objects.create(program='Discount', facebook=True, google=True)
+        Referral.objects.create(program='Discount', facebook=True, custom_referral='Church')
+        Referral.objects.create(program='Discount', custom_referral='Church')
+        Referral.objects.create(program='Discount', custom_referral='Library')
+        Referral.objects.create(program='Amnesty', bill=True)
+
+    def test_counts_computed_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = metrics.getReferralCounts()
+        self.assertEqual(counts['Discount']['facebook'], 2)
+        self.assertEqual(counts['Discount']['google'], 1)
+        self.assertEqual(counts['Discount']['bill'], 0)
+        self.assertEqual(counts['Discount']['custom_referral_total'], 3)
+        self.assertEqual(counts['Amnesty']['bill'], 1)
+        self.assertEqual(counts['Amnesty']['custom_referral_total'], 0)
+
+    def test_programs_without_referrals_are_zero(self):
+        Referral.objects.filter(program='Amnesty').delete()
+        counts = metrics.getReferralCounts()
+        self.assertEqual(counts['Amnesty'], {key: 0 for key in counts['Discount']})
+
+    def test_custom_referrals_grouped_by_frequency(self):
+        custom_referrals = list(metrics.iterCustomReferrals('Discount'))
+        self.assertEqual(custom_referrals, [('Church', 2), ('Library', 1)])
+        self.assertEqual(list(metrics.iterCustomReferrals('Amnesty')), [])
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class ProgramMetricsSnapshotTest(TestCase):
+    def create_application(self):
+        return createApplication()
+
+    def test_snapshot_tracks_applications(self):
+        app = self.create_application()
+        ForgivenessApplication.objects.create(
+            first_name='Test', last_name='User', street_address='123 Main St', zip_code='14202',
+            phone_number='716-555-5555'
+            )
+        counts = metrics.getSnapshotCounts()
+        self.assertEqual(counts['Discount']['application_total'], 1)
+        self.assertEqual(counts['Amnesty']['application_total'], 1)
+
+        app.delete()
+        self.assertEqual(metrics.getSnapshotCounts()['Discount']['application_total'], 0)
+
+    def test_snapshot_tracks_referrals(self):
+        ref = Referral.objects.create(program='Discount', facebook=True, custom_referral='Church')
+        Referral.objects.create(program='Discount', google=True)
+        counts = metrics.getSnapshotCounts()['Discount']
+        self.assertEqual(counts['referral_total'], 2)
+        self.assertEqual(counts['facebook'], 1)
+        self.assertEqual(counts['google'], 1)
+        self.assertEqual(counts['custom_referral_total'], 1)
+
+        ref.delete()
+        counts = metrics.getSnapshotCounts()['Discount']
+        self.assertEqual(counts['referral_total'], 1)
+        self.assertEqual(counts['facebook'], 0)
+        self.assertEqual(counts['custom_referral_total'], 0)
+
+    def test_edited_referral_is_recounted(self):
+        ref = Referral.objects.create(program='Amnesty', facebook=True)
+        ref.facebook = False
+        ref.twitter = True
+        ref.save()
+        counts = metrics.getSnapshotCounts()['Amnesty']
+        self.assertEqual(counts['referral_total'], 1)
+        self.assertEqual(counts['facebook'], 0)
+        self.assertEqual(counts['twitter'], 1)
+
+    def test_edited_referral_counted_without_rebuild(self):
+        Referral.objects.create(program='Discount', google=True)
+        ref = Referral.objects.create(program='Amnesty', facebook=True)
+        ref.program = 'Discount'
+        ref.custom_referral = 'Church'
+        with mock.patch('pathways.metrics.rebuildSnapshots') as rebuildSnapshots:
+            ref.save()
+        rebuildSnapshots.assert_not_called()
+        counts = metrics.getSnapshotCounts()
+        self.assertEqual(counts['Amnesty']['referral_total'], 0)
+        self.assertEqual(counts['Amnesty']['facebook'], 0)
+        self.assertEqual(counts['Discount']['referral_total'], 2)
+        self.assertEqual(counts['Discount']['facebook'], 1)
+        self.assertEqual(counts['Discount']['custom_referral_total'], 1)
+
+    def test_saving_unchanged_referral_writes_nothing(self):
+        ref = Referral.objects.create(program='Discount', bill=True)
+        with self.assertNumQueries(2):
+            # The previous row is read, then the referral itself is saved
+            ref.save()
+        self.assertEqual(metrics.getSnapshotCounts()['Discount']['referral_total'], 1)
+
+    def test_bulk_created_referrals_are_counted(self):
+        metrics.bulkCreateReferrals([
+            Referral(program='Discount', bill=True),
+            Referral(program='Discount', bill=True, ad=True),
+            Referral(program='Amnesty', pamphlet=True),
+        ])
+        counts = metrics.getSnapshotCounts()
+        self.assertEqual(counts['Discount']['referral_total'], 2)
+        self.assertEqual(counts['Discount']['bill'], 2)
+        self.assertEqual(counts['Discount']['ad'], 1)
+        self.assertEqual(counts['Amnesty']['pamphlet'], 1)
+
+    def test_rebuild_command_matches_source_tables(self):
+        self.create_application()
+        Referral.objects.create(program='Discount', facebook=True)
+        ProgramMetricsSnapshot.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_metrics_snapshot', stdout=out)
+        self.assertIn('Discount: 1 applications, 1 referrals', out.getvalue())
+        self.assertEqual(metrics.getSnapshotCounts(), {
+            'Discount': dict(metrics.getReferralCounts()['Discount'], application_total=1),
+            'Amnesty': dict(metrics.getReferralCounts()['Amnesty'], application_total=0),
+        })
+
+    def test_snapshot_read_in_one_query(self):
+        with self.assertNumQueries(1):
+            metrics.getSnapshotCounts()
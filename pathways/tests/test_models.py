@@ -3,7 +3,10 @@ from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from django.urls import reverse
 from django.utils.translation import activate
 from django.utils.translation import ugettext_lazy as _
-from pathways.models import Application
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from pathways.models import Application, Document, ACCEPTED_FILE_VALIDATOR, MIME_SNIFF_BYTES
 
 # model tests
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
@@ -40,3 +43,55 @@ class ApplicationModelTest(TestCase):
     def test_application_self_string(self):
         expected = '1 - Doe at 123 Main St'
         self.assertEqual(self.app_1.__str__(), expected, msg=f'app_1 self string expected {expected} but got {self.app_1.__str__()}')
+
+    def test_application_lookup_key(self):
+        self.assertEqual(self.app_1.lookup_key, 'doe|john|14202|7163334444')
+        self.app_1.first_name = ' Jon '
+        self.app_1.phone_number = '(716) 333-5555'
+        self.app_1.save(update_fields=['first_name', 'phone_number'])
+        self.app_1.refresh_from_db()
+        self.assertEqual(self.app_1.lookup_key, 'doe|jon|14202|7163335555')
+
+    def test_application_timestamps(self):
+        self.assertIsNotNone(self.app_1.created_at)
+        self.assertGreaterEqual(self.app_1.updated_at, self.app_1.created_at)
+        created_at = self.app_1.created_at
+        self.app_1.status = 'in_progress'
+        self.app_1.save()
+        self.app_1.refresh_from_db()
+        self.assertEqual(self.app_1.created_at, created_at)
+        self.assertGreater(self.app_1.updated_at, created_at)
+
+class FileValidatorTest(TestCase):
+    pdf_content = b'%PDF-1.4\n' + b'0' * 10000
+
+    def test_accepts_supported_content_type(self):
+        upload = SimpleUploadedFile('bill.pdf', self.pdf_content)
+        ACCEPTED_FILE_VALIDATOR(upload)
+        self.assertEqual(upload.sniffed_content_type, 'application/pdf')
+        self.assertEqual(upload.tell(), 0)
+
+    def test_rejects_unsupported_content_type(self):
+        upload = SimpleUploadedFile('bill.pdf', b'#!/bin/sh\necho hello\n')
+        with self.assertRaises(ValidationError) as error:
+            ACCEPTED_FILE_VALIDATOR(upload)
+        self.assertEqual(error.exception.code, 'content_type')
+
+    def test_only_header_bytes_are_read(self):
+        upload = TemporaryUploadedFile('bill.pdf', 'application/pdf', len(self.pdf_content), None)
+        upload.write(self.pdf_content)
+        upload.seek(0)
+        with mock.patch.object(upload.file, 'read', wraps=upload.file.read) as read:
+            ACCEPTED_FILE_VALIDATOR(upload)
+        read.assert_called_once_with(MIME_SNIFF_BYTES)
+        upload.close()
+
+    def test_verdict_reused_by_model_field_validation(self):
+        upload = SimpleUploadedFile('bill.pdf', self.pdf_content)
+        ACCEPTED_FILE_VALIDATOR(upload)
+
+        doc = Document(doc_type='income')
+        doc.doc_file = upload
+        with mock.patch('pathways.models.magic.from_buffer') as from_buffer:
+            ACCEPTED_FILE_VALIDATOR(doc.doc_file)
+        from_buffer.assert_not_called()
@@ -1,4 +1,4 @@
-from django.test import TestCase, override_settings
+from django.test import TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils.translation import activate
 from django.utils.translation import ugettext_lazy as _
@@ -6,7 +6,7 @@ from pathways.models import Application, ForgivenessApplication, EmailCommunicat
 from django.core import mail
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
-class DiscountEmailSignalTest(TestCase):
+class DiscountEmailSignalTest(TransactionTestCase):
     def setUp(self):
         activate('en')
 
@@ -53,7 +53,7 @@ class DiscountEmailSignalTest(TestCase):
         self.assertIn('Water Affordability Program has been approved', mail.outbox[1].body)
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
-class AmnestyEmailSignalTest(TestCase):
+class AmnestyEmailSignalTest(TransactionTestCase):
     def setUp(self):
         activate('en')
 
@@ -1,8 +1,17 @@
-from django.test import TestCase
+import datetime
+from contextlib import contextmanager
+from unittest import mock
+from django.test import TestCase, override_settings
 from django.urls import reverse
-from pathways.tasks import send_email
+from pathways.tasks import send_email, mark_email_sent, queue_automatic_email, send_outbox_emails, clear_expired_sessions
+from pathways.models import EmailCommunication, EmailOutbox
+from pathways import tasks
+from pathways import email_templates
 from django.core import mail
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.html import strip_tags
 from affordable_water.celery import debug_task
 
@@ -27,4 +36,208 @@ class SendEmailTests(TestCase):
         self.assertEqual(mail.outbox[0].to, ['to@example.com'])
 
         # Verify that the template is correct
-        self.assertIn('We have successfully received your application for the Buffalo Water Amnesty Program.', mail.outbox[0].body)
\ No newline at end of file
+        self.assertIn('We have successfully received your application for the Buffalo Water Amnesty Program.', mail.outbox[0].body)
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, EMAIL_BATCH_SIZE=2)
+class SendEmailBatchTests(TestCase):
+    recipient_list = [
+        ('Alex', 'alex@example.com'),
+        ('Sam', 'sam@example.com'),
+        ('Alex', 'alex.two@example.com'),
+    ]
+    template_name = 'pathways/emails/discount_enrolled.html'
+
+    def test_all_recipients_sent_in_batches(self):
+        with mock.patch('pathways.tasks.mail.get_connection', wraps=mail.get_connection) as get_connection:
+            send_email(subject='Subject', recipient_list=self.recipient_list, template_name=self.template_name)
+
+        # One connection per batch of EMAIL_BATCH_SIZE
+        self.assertEqual(get_connection.call_count, 2)
+        self.assertEqual([msg.to for msg in mail.outbox],
+                         [['alex@example.com'], ['sam@example.com'], ['alex.two@example.com']])
+
+    @override_settings(EMAIL_BATCH_SIZE=50)
+    def test_template_rendered_once_per_batch(self):
+        email_templates.clearEmailCache()
+        with mock.patch('pathways.email_templates.strip_tags', wraps=strip_tags) as strip:
+            send_email(subject='Subject', recipient_list=self.recipient_list, template_name=self.template_name)
+            send_email(subject='Subject', recipient_list=self.recipient_list, template_name=self.template_name)
+        self.assertEqual(strip.call_count, 1)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(mail.outbox[0].body, mail.outbox[5].body)
+
+
+class MarkEmailSentTests(TestCase):
+    def test_new_address_is_created(self):
+        self.assertTrue(mark_email_sent('to@example.com', 'discount_receive'))
+        email_com = EmailCommunication.objects.get(email_address='to@example.com')
+        self.assertTrue(email_com.discount_application_received)
+        self.assertFalse(email_com.enrolled_in_discount_program)
+        self.assertEqual(email_com.history.count(), 1)
+
+    def test_flag_set_on_existing_address(self):
+        EmailCommunication.objects.create(email_address='to@example.com', discount_application_received=True)
+        with self.assertNumQueries(3):
+            self.assertTrue(mark_email_sent('to@example.com', 'discount_enroll'))
+        email_com = EmailCommunication.objects.get(email_address='to@example.com')
+        self.assertTrue(email_com.discount_application_received)
+        self.assertTrue(email_com.enrolled_in_discount_program)
+        self.assertEqual(email_com.history.count(), 2)
+
+    def test_already_sent_is_reported(self):
+        self.assertTrue(mark_email_sent('to@example.com', 'amnesty_enroll'))
+        self.assertFalse(mark_email_sent('to@example.com', 'amnesty_enroll'))
+        self.assertTrue(mark_email_sent('to@example.com', 'amnesty_receive'))
+        self.assertEqual(EmailCommunication.objects.count(), 1)
+
+    def test_address_matched_case_insensitively(self):
+        EmailCommunication.objects.create(email_address='To@Example.com', discount_application_received=True)
+        self.assertFalse(mark_email_sent('to@example.com', 'discount_receive'))
+        self.assertTrue(mark_email_sent('TO@example.COM', 'discount_enroll'))
+        email_com = EmailCommunication.objects.get()
+        self.assertEqual(email_com.email_address, 'To@Example.com')
+        self.assertTrue(email_com.enrolled_in_discount_program)
+
+    def test_row_inserted_concurrently_for_other_type(self):
+        set_email_flag = tasks._set_email_flag
+        calls = []
+        def setFlagThenRace(email_address, email_type):
+            updated = set_email_flag(email_address, email_type)
+            if not calls:
+                # Another transaction inserts the row for the amnesty confirmation in between
+                EmailCommunication.objects.create(email_address=email_address, amnesty_application_received=True)
+            calls.append(email_type)
+            return updated
+
+        with mock.patch('pathways.tasks._set_email_flag', side_effect=setFlagThenRace):
+            self.assertTrue(mark_email_sent('to@example.com', 'discount_enroll'))
+        self.assertEqual(len(calls), 2)
+        email_com = EmailCommunication.objects.get(email_address='to@example.com')
+        self.assertTrue(email_com.amnesty_application_received)
+        self.assertTrue(email_com.enrolled_in_discount_program)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class EmailOutboxTests(TestCase):
+    def test_email_queued_until_commit(self):
+        with self.captureOnCommit() as callbacks:
+            queue_automatic_email('discount_receive', 'Test', 'to@example.com')
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'We received your application for the Buffalo Water Affordability Program')
+
+    def test_outbox_sends_once_per_applicant_and_type(self):
+        with self.captureOnCommit():
+            for _ in range(2):
+                queue_automatic_email('amnesty_enroll', 'Test', 'to@example.com')
+            queue_automatic_email('amnesty_enroll', 'Other', 'other@example.com')
+        send_outbox_emails()
+        self.assertEqual(sorted(msg.to[0] for msg in mail.outbox), ['other@example.com', 'to@example.com'])
+        self.assertTrue(EmailCommunication.objects.get(email_address='to@example.com').enrolled_in_amnesty_program)
+
+        send_outbox_emails()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_outbox_matches_addresses_case_insensitively(self):
+        EmailCommunication.objects.create(email_address='To@Example.com', amnesty_application_received=True)
+        with self.captureOnCommit():
+            queue_automatic_email('amnesty_receive', 'Test', 'to@example.com')
+            queue_automatic_email('amnesty_enroll', 'Test', 'to@example.com')
+            queue_automatic_email('amnesty_enroll', 'Test', 'TO@EXAMPLE.COM')
+        send_outbox_emails()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(EmailCommunication.objects.count(), 1)
+        self.assertTrue(EmailCommunication.objects.get().enrolled_in_amnesty_program)
+
+    def test_empty_outbox_opens_no_connection(self):
+        with mock.patch('pathways.tasks.mail.get_connection') as get_connection:
+            send_outbox_emails()
+        get_connection.assert_not_called()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_already_sent_emails_cleared_without_connection(self):
+        EmailCommunication.objects.create(email_address='to@example.com', discount_application_received=True)
+        with self.captureOnCommit():
+            queue_automatic_email('discount_receive', 'Test', 'to@example.com')
+        with mock.patch('pathways.tasks.mail.get_connection') as get_connection:
+            send_outbox_emails()
+        get_connection.assert_not_called()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+    def test_broker_failure_leaves_email_in_outbox(self):
+        with self.captureOnCommit() as callbacks:
+            queue_automatic_email('discount_enroll', 'Test', 'to@example.com')
+        with mock.patch('pathways.tasks.send_outbox_emails.delay', side_effect=OSError):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+        # Scheduled run
+        send_outbox_emails()
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_send_failure_keeps_email_in_outbox(self):
+        with self.captureOnCommit():
+            queue_automatic_email('discount_enroll', 'Test', 'to@example.com')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            send_outbox_emails()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertIsNone(EmailOutbox.objects.get().claimed_at)
+        self.assertFalse(EmailCommunication.objects.filter(enrolled_in_discount_program=True).exists())
+
+        send_outbox_emails()
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(EmailCommunication.objects.get(email_address='to@example.com').enrolled_in_discount_program)
+
+    def test_claimed_emails_skipped_until_stale(self):
+        with self.captureOnCommit():
+            queue_automatic_email('discount_enroll', 'Test', 'to@example.com')
+        EmailOutbox.objects.update(claimed_at=timezone.now())
+        send_outbox_emails()
+        self.assertEqual(len(mail.outbox), 0)
+
+        EmailOutbox.objects.update(claimed_at=timezone.now() - datetime.timedelta(hours=1))
+        send_outbox_emails()
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_BATCH_SIZE=2, EMAIL_BATCH_INTERVAL=60)
+    def test_full_batch_sends_rest_later(self):
+        with self.captureOnCommit():
+            for index in range(3):
+                queue_automatic_email('discount_enroll', 'Test', f'to{index}@example.com')
+        with mock.patch('pathways.tasks.send_outbox_emails.apply_async') as apply_async:
+            send_outbox_emails()
+        self.assertEqual(len(mail.outbox), 2)
+        apply_async.assert_called_once_with(countdown=60)
+
+    @contextmanager
+    def captureOnCommit(self):
+        """Collects on_commit callbacks, which never run inside TestCase's transaction"""
+        callbacks = []
+        with mock.patch('pathways.tasks.transaction.on_commit', side_effect=callbacks.append):
+            yield callbacks
+
+
+class ClearExpiredSessionsTests(TestCase):
+    def test_expired_sessions_deleted(self):
+        for expiry in [-60, 60]:
+            session = SessionStore()
+            session['active_app'] = True
+            session.set_expiry(expiry)
+            session.save()
+
+        clear_expired_sessions()
+
+        self.assertEqual(Session.objects.count(), 1)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_nothing_to_clear_for_signed_cookies(self):
+        clear_expired_sessions()
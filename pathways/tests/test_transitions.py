@@ -0,0 +1,86 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase, override_settings
+from pathways.models import Application, EmailCommunication, EmailOutbox, ForgivenessApplication
+from pathways.transitions import transitionStatus
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class TransitionStatusTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            Application.objects.create(
+                household_size=1, has_household_benefits=True, first_name=f'Test{i}', last_name='User',
+                rent_or_own='own', street_address=f'{i} Main St', zip_code='14202', phone_number='716-555-5555',
+                email_address=f'test{i}@example.com' if i < 2 else '', account_holder='me',
+                account_first='Test', account_last='User', legal_agreement=True, signature='Test User'
+                )
+        # Drop the confirmation emails queued by creating the applications
+        EmailOutbox.objects.all().delete()
+        mail.outbox = []
+
+    def test_enroll_updates_statuses_and_history(self):
+        user = User.objects.create_user(username='staff', password='password')
+        with self.assertNumQueries(6):
+            changed = transitionStatus(Application.objects.all(), 'enrolled', user=user)
+        self.assertEqual(changed, 3)
+        self.assertEqual(Application.objects.filter(status='enrolled').count(), 3)
+        for app in Application.objects.all():
+            latest = app.history.latest()
+            self.assertEqual(latest.status, 'enrolled')
+            self.assertEqual(latest.history_type, '~')
+            self.assertEqual(latest.history_user, user)
+
+    def test_enroll_emails_once_per_applicant(self):
+        self.transitionAndCommit(Application.objects.all(), 'enrolled')
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ['test0@example.com', 'test1@example.com'])
+        self.assertTrue(EmailCommunication.objects.get(email_address='test0@example.com').enrolled_in_discount_program)
+
+        # Already enrolled applications are skipped and no email is resent
+        Application.objects.update(status='new')
+        self.transitionAndCommit(Application.objects.all(), 'enrolled')
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_emails_wait_for_commit(self):
+        callbacks = []
+        with mock.patch('pathways.tasks.transaction.on_commit', side_effect=callbacks.append):
+            transitionStatus(Application.objects.all(), 'enrolled')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+        # A rolled back transition never runs its callbacks, and the rows go with it
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_deny_sends_no_email(self):
+        changed = transitionStatus(Application.objects.filter(first_name='Test0'), 'denied')
+        self.assertEqual(changed, 1)
+        self.assertEqual(Application.objects.get(first_name='Test0').status, 'denied')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_unchanged_applications_are_skipped(self):
+        transitionStatus(Application.objects.all(), 'denied')
+        with self.assertNumQueries(3):
+            changed = transitionStatus(Application.objects.all(), 'denied')
+        self.assertEqual(changed, 0)
+
+    def test_enroll_amnesty_applications(self):
+        ForgivenessApplication.objects.create(
+            first_name='Test', last_name='User', street_address='123 Main St', zip_code='14202',
+            phone_number='716-555-5555', email_address='amnesty@example.com'
+            )
+        EmailOutbox.objects.all().delete()
+        self.transitionAndCommit(ForgivenessApplication.objects.all(), 'enrolled')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'You have been successfully enrolled in the Buffalo Water Amnesty Program')
+        self.assertTrue(EmailCommunication.objects.get(email_address='amnesty@example.com').enrolled_in_amnesty_program)
+
+    @staticmethod
+    def transitionAndCommit(queryset, status):
+        """Runs transitionStatus() and then its on_commit callbacks, which TestCase never runs"""
+        callbacks = []
+        with mock.patch('pathways.tasks.transaction.on_commit', side_effect=callbacks.append):
+            transitionStatus(queryset, status)
+        for callback in callbacks:
+            callback()
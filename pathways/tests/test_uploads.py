@@ -0,0 +1,188 @@
+import base64
+import json
+import unittest
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.translation import activate
+from pathways.models import Document
+from pathways import uploads
+from pathways.tests import createApplication
+
+try:
+    import boto3
+    try:
+        from moto import mock_aws
+    except ImportError:
+        # moto before 5.0, the last versions supporting Python 3.7
+        from moto import mock_s3 as mock_aws
+except ImportError:
+    mock_aws = None
+
+BUCKET = 'test-documents'
+PNG_BYTES = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00'
+             b'\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18\xd8N'
+             b'\x00\x00\x00\x00IEND\xaeB`\x82')
+
+@unittest.skipUnless(mock_aws, 'moto is not installed')
+@override_settings(DEFAULT_FILE_STORAGE='storages.backends.s3boto3.S3Boto3Storage',
+                   AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+                   AWS_STORAGE_BUCKET_NAME=BUCKET, AWS_S3_REGION_NAME='us-east-1',
+                   DOCUMENT_DIRECT_UPLOAD=True)
+class DirectUploadTestCase(TestCase):
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=BUCKET)
+
+        self.app = createApplication()
+
+    def upload(self, body):
+        """Stores body like a browser using a presigned POST would"""
+        name = uploads.createPresignedUpload(self.app.id, 'image/png')['name']
+        self.s3.put_object(Bucket=BUCKET, Key=name, Body=body)
+        return name
+
+    def getKeys(self):
+        return [obj['Key'] for obj in self.s3.list_objects_v2(Bucket=BUCKET).get('Contents', [])]
+
+
+class UploadsTest(DirectUploadTestCase):
+    def test_direct_upload_enabled_for_s3_bucket(self):
+        self.assertTrue(uploads.isDirectUploadEnabled())
+        with self.settings(DOCUMENT_DIRECT_UPLOAD=False):
+            self.assertFalse(uploads.isDirectUploadEnabled())
+
+    def test_signed_urls_for_many_files(self):
+        urls = uploads.getSignedUrls(['documents/1.png', '', 'thumbnails/1.jpg'])
+        self.assertEqual(list(urls), ['documents/1.png', 'thumbnails/1.jpg'])
+        self.assertIn('/documents/1.png?', urls['documents/1.png'])
+        self.assertIn('Signature=', urls['thumbnails/1.jpg'])
+
+    def test_presigned_upload_limits_size_type_and_key(self):
+        upload = uploads.createPresignedUpload(self.app.id, 'application/pdf')
+        self.assertTrue(upload['name'].startswith(f'{uploads.PENDING_UPLOAD_PREFIX}/{self.app.id}/'))
+        self.assertEqual(upload['fields']['key'], upload['name'])
+        self.assertEqual(upload['fields']['Content-Type'], 'application/pdf')
+        self.assertIn(BUCKET, upload['url'])
+
+        conditions = json.loads(base64.b64decode(upload['fields']['policy']))['conditions']
+        self.assertIn({'key': upload['name']}, conditions)
+        self.assertIn(['starts-with', '$key', f'{uploads.PENDING_UPLOAD_PREFIX}/{self.app.id}/'], conditions)
+        self.assertIn(['eq', '$Content-Type', 'application/pdf'], conditions)
+        self.assertIn(['content-length-range', 1, 1024 * 4000], conditions)
+
+    def test_pending_upload_moved_to_document_key(self):
+        name = self.upload(PNG_BYTES)
+        etag, content_type = uploads.validatePendingUpload(self.app, name)
+        self.assertEqual(content_type, 'image/png')
+        docs = uploads.createDocuments(self.app, 'income', pending=[(name, etag, content_type)])
+
+        doc = Document.objects.get()
+        self.assertEqual(doc.doc_file.name, docs[0].doc_file.name)
+        self.assertRegex(doc.doc_file.name, r'^documents/[0-9a-f]{32}\.png$')
+        self.assertEqual(self.getKeys(), [doc.doc_file.name])
+        self.assertEqual(Document.history.count(), 1)
+
+    def test_rejects_upload_overwritten_after_validation(self):
+        name = self.upload(PNG_BYTES)
+        etag, content_type = uploads.validatePendingUpload(self.app, name)
+        self.s3.put_object(Bucket=BUCKET, Key=name, Body=b'<html><script>alert(1)</script></html>')
+        with self.assertRaises(ValidationError) as cm:
+            uploads.createDocuments(self.app, 'income', pending=[(name, etag, content_type)])
+        self.assertEqual(cm.exception.code, 'changed')
+        self.assertEqual(Document.objects.count(), 0)
+        self.assertEqual(self.getKeys(), [name])
+
+    def test_overwritten_upload_copies_cleaned_up(self):
+        names = [self.upload(PNG_BYTES), self.upload(PNG_BYTES)]
+        pending = [(name,) + uploads.validatePendingUpload(self.app, name) for name in names]
+        self.s3.put_object(Bucket=BUCKET, Key=names[1], Body=PNG_BYTES + b'changed')
+        with self.assertRaises(ValidationError):
+            uploads.createDocuments(self.app, 'income', pending=pending)
+        self.assertCountEqual(self.getKeys(), names)
+
+    def test_rejects_unsupported_content(self):
+        name = self.upload(b'#!/bin/sh\necho not an image\n')
+        with self.assertRaises(ValidationError) as cm:
+            uploads.validatePendingUpload(self.app, name)
+        self.assertEqual(cm.exception.code, 'content_type')
+        self.assertEqual(self.getKeys(), [])
+
+    def test_rejects_oversized_file(self):
+        name = self.upload(PNG_BYTES + bytes(4096001))
+        with self.assertRaises(ValidationError) as cm:
+            uploads.validatePendingUpload(self.app, name)
+        self.assertEqual(cm.exception.code, 'max_size')
+
+    def test_rejects_another_applications_upload(self):
+        name = f'{uploads.PENDING_UPLOAD_PREFIX}/{self.app.id + 1}/abc'
+        self.s3.put_object(Bucket=BUCKET, Key=name, Body=PNG_BYTES)
+        with self.assertRaises(ValidationError) as cm:
+            uploads.validatePendingUpload(self.app, name)
+        self.assertEqual(cm.exception.code, 'invalid')
+
+    def test_rejects_missing_upload(self):
+        with self.assertRaises(ValidationError) as cm:
+            uploads.validatePendingUpload(self.app, f'{uploads.PENDING_UPLOAD_PREFIX}/{self.app.id}/x')
+        self.assertEqual(cm.exception.code, 'missing')
+
+
+class DocumentUploadViewTest(DirectUploadTestCase):
+    def setUp(self):
+        super().setUp()
+        activate('en')
+        session = self.client.session
+        session['active_app'] = True
+        session['app_id'] = self.app.id
+        session.save()
+
+    def test_presigned_upload_requires_application(self):
+        self.client.cookies.clear()
+        response = self.client.post(reverse('pathways-apply-documents-upload'), secure=True)
+        self.assertEqual(response.status_code, 403)
+
+    def test_presigned_upload_returned(self):
+        response = self.client.post(reverse('pathways-apply-documents-upload'),
+                                    data={'content_type': 'application/pdf'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        upload = response.json()
+        self.assertTrue(upload['name'].startswith(f'{uploads.PENDING_UPLOAD_PREFIX}/{self.app.id}/'))
+        self.assertEqual(upload['fields']['Content-Type'], 'application/pdf')
+
+    def test_presigned_upload_rejects_other_content_types(self):
+        response = self.client.post(reverse('pathways-apply-documents-upload'),
+                                    data={'content_type': 'text/html'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_form_offers_direct_upload(self):
+        response = self.client.get(reverse('pathways-apply-documents-income'), secure=True)
+        self.assertEqual(response.context['direct_upload_url'], reverse('pathways-apply-documents-upload'))
+
+    def test_uploaded_names_submitted_instead_of_files(self):
+        names = [self.upload(PNG_BYTES), self.upload(PNG_BYTES)]
+        response = self.client.post(reverse('pathways-apply-documents-income'),
+            data={'uploaded_name': names, 'uploaded_filename': ['page1.png', 'page2.png']}, secure=True)
+        self.assertRedirects(response, '/apply/documents-residence/', fetch_redirect_response=False)
+        docs = Document.objects.all()
+        self.assertEqual(len(docs), 2)
+        for doc in docs:
+            self.assertEqual((doc.application, doc.doc_type), (self.app, 'benefits'))
+        self.assertCountEqual(self.getKeys(), [doc.doc_file.name for doc in docs])
+
+    def test_document_key_extension_follows_content(self):
+        name = self.upload(PNG_BYTES)
+        response = self.client.post(reverse('pathways-apply-documents-income'),
+            data={'uploaded_name': name, 'uploaded_filename': 'stub.html'}, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertRegex(Document.objects.get().doc_file.name, r'^documents/[0-9a-f]{32}\.png$')
+
+    def test_rejected_upload_shows_form_error(self):
+        name = self.upload(b'plain text')
+        response = self.client.post(reverse('pathways-apply-documents-income'),
+            data={'uploaded_name': name, 'uploaded_filename': 'stub.png'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('doc', 'content_type'))
+        self.assertEqual(Document.objects.count(), 0)
@@ -1,8 +1,14 @@
-from django.test import TestCase, override_settings
+import tempfile
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils.translation import activate
 from django.utils.translation import ugettext_lazy as _
-from pathways.models import ForgivenessApplication, EmailCommunication
+from django.contrib.auth.models import User
+from pathways.models import Application, Document, ForgivenessApplication, EmailCommunication, Referral
+from pathways.wizard import WizardState
+from pathways.tests import createApplication
 from django.core import mail
 
 # view tests
@@ -178,7 +184,7 @@ class ForgiveResidentInfoViewTest(TestCase):
         self.assertRedirects(response, reverse('pathways-forgive-overview'), fetch_redirect_response=False)
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
-class ForgiveReviewApplicationViewTest(TestCase):
+class ForgiveReviewApplicationViewTest(TransactionTestCase):
     def setUp(self):
         activate('en')
 
@@ -258,6 +264,26 @@ class ForgiveReviewApplicationViewTest(TestCase):
         self.assertTrue({'forgive_step', 'first_name', 'last_name', 'middle_initial', 'street_address', 'zip_code', 'phone_number', 'email_address'}.issubset(self.client.session.keys()))
         self.assertTrue(ForgivenessApplication.objects.filter(email_address__iexact='testing@getwaterwisebuffalo.org', street_address='123 Main St').exists())
 
+    def test_forgiveness_resubmission_updates_existing_application(self):
+        session = self.client.session
+        session['forgive_step'] = 'filled_application'
+        session['first_name'] = 'Test'
+        session['last_name'] = 'User'
+        session['street_address'] = '123 Main St'
+        session['zip_code'] = '14202'
+        session['phone_number'] = '716-555-5555'
+        session['email_address'] = ''
+        session.save()
+        self.client.post(reverse('pathways-forgive-review-application'), data={'submit_application': True}, secure=True)
+
+        session = self.client.session
+        session['email_address'] = 'testing@getwaterwisebuffalo.org'
+        session.save()
+        self.client.post(reverse('pathways-forgive-review-application'), data={'submit_application': True}, secure=True)
+
+        app = ForgivenessApplication.objects.get()
+        self.assertEqual(app.email_address, 'testing@getwaterwisebuffalo.org')
+
     def test_email_sent_after_forgiveness_application_created(self):
         session = self.client.session
         session['forgive_step'] = 'filled_application'
@@ -398,8 +424,8 @@ class HouseholdSizeViewTest(TestCase):
     def test_session_saved_on_submit(self):
         response = self.client.post(reverse('pathways-apply-household-size'), data={'household_size': 1}, follow=True, secure=True)
         self.assertIn('active_app', self.client.session.keys())
-        self.assertIn('household_size', self.client.session.keys())
-        self.assertEqual(self.client.session['household_size'], '1')
+        self.assertIn('household_size', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['household_size'], 1)
 
 class HouseholdBenefitsViewTest(TestCase):
     def setUp(self):
@@ -428,8 +454,8 @@ class HouseholdBenefitsViewTest(TestCase):
     def test_session_saved_on_submit(self):
         for has_household_benefits in [True, False]:
             response = self.client.post(reverse('pathways-apply-household-benefits'), data={'has_household_benefits': has_household_benefits}, follow=True, secure=True)
-            self.assertIn('has_household_benefits', self.client.session.keys())
-            self.assertEqual(self.client.session['has_household_benefits'], str(has_household_benefits))
+            self.assertIn('has_household_benefits', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['has_household_benefits'], has_household_benefits)
 
 class DispatchViewTest(TestCase):
     def setUp(self):
@@ -467,11 +493,11 @@ class HouseholdContributorsViewTest(TestCase):
     def test_session_saved_on_submit(self):
         for household_contributors in [1,2,3,4]:
             response = self.client.post(reverse('pathways-apply-household-contributors'), data={'household_contributors': household_contributors}, follow=True, secure=True)
-            self.assertIn('household_contributors', self.client.session.keys())
-            self.assertEqual(self.client.session['household_contributors'], str(household_contributors))
+            self.assertIn('household_contributors', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['household_contributors'], household_contributors)
             if household_contributors > 1:
-                self.assertIn('income_method', self.client.session.keys())
-                self.assertEqual(self.client.session['income_method'], 'estimate')
+                self.assertIn('income_method', WizardState(self.client.session))
+                self.assertEqual(WizardState(self.client.session)['income_method'], 'estimate')
 
 class JobStatusViewTest(TestCase):
     def setUp(self):
@@ -500,8 +526,8 @@ class JobStatusViewTest(TestCase):
         for has_job in [True, False]:
             response = self.client.post(reverse('pathways-apply-job-status'), data={'has_job': str(has_job)}, follow=True, secure=True)
             self.assertEqual(response.status_code, 200)
-            self.assertIn('has_job', self.client.session.keys())
-            self.assertEqual(self.client.session['has_job'], str(has_job))
+            self.assertIn('has_job', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['has_job'], has_job)
 
 class SelfEmploymentViewTest(TestCase):
     def setUp(self):
@@ -540,8 +566,8 @@ class SelfEmploymentViewTest(TestCase):
         for is_self_employed in [True, False]:
             response = self.client.post(reverse('pathways-apply-self-employment'), data={'is_self_employed': str(is_self_employed)}, follow=True, secure=True)
             self.assertEqual(response.status_code, 200)
-            self.assertIn('is_self_employed', self.client.session.keys())
-            self.assertEqual(self.client.session['is_self_employed'], str(is_self_employed))
+            self.assertIn('is_self_employed', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['is_self_employed'], is_self_employed)
 
 class OtherIncomeSourcesViewTest(TestCase):
     def setUp(self):
@@ -571,8 +597,8 @@ class OtherIncomeSourcesViewTest(TestCase):
         for has_other_income in [True, False]:
             response = self.client.post(reverse('pathways-apply-other-income-sources'), data={'has_other_income': has_other_income}, follow=True, secure=True)
             self.assertEqual(response.status_code, 200)
-            self.assertIn('has_other_income', self.client.session.keys())
-            self.assertEqual(self.client.session['has_other_income'], str(has_other_income))
+            self.assertIn('has_other_income', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['has_other_income'], has_other_income)
 
 class NumberOfJobsViewTest(TestCase):
     def setUp(self):
@@ -600,11 +626,11 @@ class NumberOfJobsViewTest(TestCase):
     def test_session_saved_on_submit(self):
         for number_of_jobs in range(1,9):
             response = self.client.post(reverse('pathways-apply-number-of-jobs'), data={'number_of_jobs': number_of_jobs}, follow=True, secure=True)
-            self.assertIn('number_of_jobs', self.client.session.keys())
-            self.assertEqual(self.client.session['number_of_jobs'], str(number_of_jobs))
+            self.assertIn('number_of_jobs', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['number_of_jobs'], number_of_jobs)
             if number_of_jobs > 1:
-                self.assertIn('income_method', self.client.session.keys())
-                self.assertEqual(self.client.session['income_method'], 'estimate')
+                self.assertIn('income_method', WizardState(self.client.session))
+                self.assertEqual(WizardState(self.client.session)['income_method'], 'estimate')
 
 class NonJobIncomeViewTest(TestCase):
     def setUp(self):
@@ -631,8 +657,28 @@ class NonJobIncomeViewTest(TestCase):
 
     def test_session_saved_on_submit(self):
         response = self.client.post(reverse('pathways-apply-non-job-income'), data={'non_job_income': 15}, follow=True, secure=True)
-        self.assertIn('non_job_income', self.client.session.keys())
-        self.assertEqual(self.client.session['non_job_income'], 15)
+        self.assertIn('non_job_income', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['non_job_income'], 15)
+
+    def test_non_job_income_added_once_to_job_income(self):
+        session = self.client.session
+        answers = WizardState(session)
+        answers['income_method'] = 'exact'
+        answers['income_sources'] = [{'type': 'exact', 'amount': '500', 'pay_period': 'weekly'}]
+        session.save()
+        for _ in range(2):
+            self.client.post(reverse('pathways-apply-non-job-income'), data={'non_job_income': 15}, secure=True)
+        self.assertEqual(WizardState(self.client.session)['annual_income'], 26180)
+        self.assertEqual(len(WizardState(self.client.session)['income_sources']), 2)
+
+    def test_non_job_income_annualized_without_job(self):
+        session = self.client.session
+        del session['annual_income']
+        session.save()
+        self.client.post(reverse('pathways-apply-non-job-income'), data={'non_job_income': 1500}, secure=True)
+        # The monthly amount counts 12 times, it used to be taken as the annual income
+        self.assertEqual(WizardState(self.client.session)['annual_income'], 18000)
+        self.assertEqual(WizardState(self.client.session)['income_sources'], [{'type': 'non_job', 'amount': '1500.0'}])
 
 class IncomeMethodsViewTest(TestCase):
     def setUp(self):
@@ -661,8 +707,8 @@ class IncomeMethodsViewTest(TestCase):
     def test_session_saved_on_submit(self):
         for income_method in ['exact', 'hourly', 'estimate']:
             response = self.client.post(reverse('pathways-apply-income-methods'), data={'income_method': income_method}, follow=True, secure=True)
-            self.assertIn('income_method', self.client.session.keys())
-            self.assertEqual(self.client.session['income_method'], income_method)
+            self.assertIn('income_method', WizardState(self.client.session))
+            self.assertEqual(WizardState(self.client.session)['income_method'], income_method)
 
 class IncomeViewTest(TestCase):
     def setUp(self):
@@ -717,34 +763,34 @@ class IncomeViewTest(TestCase):
         session['income_method'] = 'exact'
         session.save()
         response = self.client.post(reverse('pathways-apply-income'), data={'income': 500, 'pay_period': 'weekly'}, follow=True, secure=True)
-        self.assertIn('income', self.client.session.keys())
-        self.assertIn('pay_period', self.client.session.keys())
-        self.assertIn('annual_income', self.client.session.keys())
-        self.assertEqual(self.client.session['income'], 500)
-        self.assertEqual(self.client.session['pay_period'], 'weekly')
-        self.assertEqual(self.client.session['annual_income'], 26000)
+        self.assertIn('income', WizardState(self.client.session))
+        self.assertIn('pay_period', WizardState(self.client.session))
+        self.assertIn('annual_income', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['income'], 500)
+        self.assertEqual(WizardState(self.client.session)['pay_period'], 'weekly')
+        self.assertEqual(WizardState(self.client.session)['annual_income'], 26000)
 
         # hourly
         session['income_method'] = 'hourly'
         session.save()
         response = self.client.post(reverse('pathways-apply-income'), data={'income': 15, 'pay_period': 40}, follow=True, secure=True)
-        self.assertIn('income', self.client.session.keys())
-        self.assertIn('pay_period', self.client.session.keys())
-        self.assertIn('annual_income', self.client.session.keys())
-        self.assertEqual(self.client.session['income'], 15)
-        self.assertEqual(self.client.session['pay_period'], 40)
-        self.assertEqual(self.client.session['annual_income'], 31200)
+        self.assertIn('income', WizardState(self.client.session))
+        self.assertIn('pay_period', WizardState(self.client.session))
+        self.assertIn('annual_income', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['income'], 15)
+        self.assertEqual(WizardState(self.client.session)['pay_period'], 40)
+        self.assertEqual(WizardState(self.client.session)['annual_income'], 31200)
 
         # estimate
         session['income_method'] = 'estimate'
         session.save()
         response = self.client.post(reverse('pathways-apply-income'), data={'income': 2000, 'pay_period': 'semimonthly'}, follow=True, secure=True)
-        self.assertIn('income', self.client.session.keys())
-        self.assertIn('pay_period', self.client.session.keys())
-        self.assertIn('annual_income', self.client.session.keys())
-        self.assertEqual(self.client.session['income'], 2000)
-        self.assertEqual(self.client.session['pay_period'], 'semimonthly')
-        self.assertEqual(self.client.session['annual_income'], 48000)
+        self.assertIn('income', WizardState(self.client.session))
+        self.assertIn('pay_period', WizardState(self.client.session))
+        self.assertIn('annual_income', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['income'], 2000)
+        self.assertEqual(WizardState(self.client.session)['pay_period'], 'semimonthly')
+        self.assertEqual(WizardState(self.client.session)['annual_income'], 48000)
 
 class ReviewEligibilityViewTest(TestCase):
     def setUp(self):
@@ -793,6 +839,10 @@ class EligibilityViewTest(TestCase):
         response = self.client.get(reverse('pathways-apply-eligibility'), follow=True, secure=True)
         self.assertTemplateUsed(response, 'pathways/apply/eligibility.html')
 
+    def test_income_limit_shown_as_currency(self):
+        response = self.client.get(reverse('pathways-apply-eligibility'), secure=True)
+        self.assertContains(response, '<strong>$47,800</strong>')
+
 class AdditionalQuestionsViewTest(TestCase):
     def setUp(self):
         activate('en')
@@ -841,16 +891,16 @@ class ResidentInfoViewTest(TestCase):
             'first_name': 'Test', 'last_name': 'User', 'middle_initial': 'R', 
             'rent_or_own': 'rent', 'account_holder': 'landlord',
             }, follow=True, secure=True)
-        self.assertIn('first_name', self.client.session.keys())
-        self.assertEqual(self.client.session['first_name'], 'Test')
-        self.assertIn('last_name', self.client.session.keys())
-        self.assertEqual(self.client.session['last_name'], 'User')
-        self.assertIn('middle_initial', self.client.session.keys())
-        self.assertEqual(self.client.session['middle_initial'], 'R')
-        self.assertIn('rent_or_own', self.client.session.keys())
-        self.assertEqual(self.client.session['rent_or_own'], 'rent')
-        self.assertIn('account_holder', self.client.session.keys())
-        self.assertEqual(self.client.session['account_holder'], 'landlord')
+        self.assertIn('first_name', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['first_name'], 'Test')
+        self.assertIn('last_name', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['last_name'], 'User')
+        self.assertIn('middle_initial', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['middle_initial'], 'R')
+        self.assertIn('rent_or_own', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['rent_or_own'], 'rent')
+        self.assertIn('account_holder', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['account_holder'], 'landlord')
 
 class AccountHolderViewTest(TestCase):
     def setUp(self):
@@ -879,12 +929,12 @@ class AccountHolderViewTest(TestCase):
         data={
             'account_first': 'Land', 'account_last': 'Lord', 'account_middle': 'O',
             }, follow=True, secure=True)
-        self.assertIn('account_first', self.client.session.keys())
-        self.assertEqual(self.client.session['account_first'], 'Land')
-        self.assertIn('account_last', self.client.session.keys())
-        self.assertEqual(self.client.session['account_last'], 'Lord')
-        self.assertIn('account_middle', self.client.session.keys())
-        self.assertEqual(self.client.session['account_middle'], 'O')
+        self.assertIn('account_first', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['account_first'], 'Land')
+        self.assertIn('account_last', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['account_last'], 'Lord')
+        self.assertIn('account_middle', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['account_middle'], 'O')
 
 class AddressViewTest(TestCase):
     def setUp(self):
@@ -913,12 +963,12 @@ class AddressViewTest(TestCase):
         data={
             'street_address': '123 Main St', 'apartment_unit': 'Upper', 'zip_code': '14202',
             }, follow=True, secure=True)
-        self.assertIn('street_address', self.client.session.keys())
-        self.assertEqual(self.client.session['street_address'], '123 Main St')
-        self.assertIn('apartment_unit', self.client.session.keys())
-        self.assertEqual(self.client.session['apartment_unit'], 'Upper')
-        self.assertIn('zip_code', self.client.session.keys())
-        self.assertEqual(self.client.session['zip_code'], '14202')
+        self.assertIn('street_address', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['street_address'], '123 Main St')
+        self.assertIn('apartment_unit', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['apartment_unit'], 'Upper')
+        self.assertIn('zip_code', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['zip_code'], '14202')
 
 class ContactInfoViewTest(TestCase):
     def setUp(self):
@@ -947,10 +997,10 @@ class ContactInfoViewTest(TestCase):
         data={
             'phone_number': '716-555-5555', 'email_address': 'example@example.com',
             }, follow=True, secure=True)
-        self.assertIn('phone_number', self.client.session.keys())
-        self.assertEqual(self.client.session['phone_number'], '716-555-5555')
-        self.assertIn('email_address', self.client.session.keys())
-        self.assertEqual(self.client.session['email_address'], 'example@example.com')
+        self.assertIn('phone_number', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['phone_number'], '716-555-5555')
+        self.assertIn('email_address', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['email_address'], 'example@example.com')
 
 class AccountNumberViewTest(TestCase):
     def setUp(self):
@@ -988,13 +1038,13 @@ class AccountNumberViewTest(TestCase):
     def test_session_saved_on_submit(self):
         response = self.client.post(reverse('pathways-apply-account-number'), 
         data={'account_number': '123456789'}, follow=True, secure=True)
-        self.assertIn('account_number', self.client.session.keys())
-        self.assertEqual(self.client.session['account_number'], '123456789')
+        self.assertIn('account_number', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['account_number'], '123456789')
 
         response = self.client.post(reverse('pathways-apply-account-number'), 
         data={'has_account_number': False}, follow=True, secure=True)
-        self.assertIn('has_account_number', self.client.session.keys())
-        self.assertEqual(self.client.session['has_account_number'], False)
+        self.assertIn('has_account_number', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['has_account_number'], False)
 
 class ReviewApplicationViewTest(TestCase):
     def setUp(self):
@@ -1052,11 +1102,11 @@ class LegalViewTest(TestCase):
     def test_session_saved_on_submit(self):
         response = self.client.post(reverse('pathways-apply-legal'), 
         data={'legal_agreement': True}, follow=True, secure=True)
-        self.assertIn('legal_agreement', self.client.session.keys())
-        self.assertEqual(self.client.session['legal_agreement'], True)
+        self.assertIn('legal_agreement', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['legal_agreement'], True)
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
-class SignatureViewTest(TestCase):
+class SignatureViewTest(TransactionTestCase):
     def setUp(self):
         activate('en')
         session = self.client.session
@@ -1102,10 +1152,37 @@ class SignatureViewTest(TestCase):
     def test_session_saved_on_submit(self):
         response = self.client.post(reverse('pathways-apply-signature'), 
         data={'signature': 'Test User'}, follow=True, secure=True)
-        self.assertIn('signature', self.client.session.keys())
-        self.assertEqual(self.client.session['signature'], 'Test User')
+        self.assertIn('signature', WizardState(self.client.session))
+        self.assertEqual(WizardState(self.client.session)['signature'], 'Test User')
         self.assertIn('app_id', self.client.session.keys())
 
+    def test_income_sources_stored_with_application(self):
+        session = self.client.session
+        WizardState(session)['income_sources'] = [{'type': 'hourly', 'amount': '15.1', 'hours_per_week': 40}]
+        session.save()
+        self.client.post(reverse('pathways-apply-signature'), data={'signature': 'Test User'}, secure=True)
+        app = Application.objects.get()
+        self.assertEqual(app.income_sources, [{'type': 'hourly', 'amount': '15.1', 'hours_per_week': 40}])
+        self.assertEqual(str(app.annual_income), '31408.00')
+
+    def test_resubmission_updates_oldest_duplicate(self):
+        self.client.post(reverse('pathways-apply-signature'), data={'signature': 'Test User'}, secure=True)
+        first = Application.objects.get()
+        # A duplicate left from before fingerprints were checked
+        duplicate = Application.objects.get(pk=first.pk)
+        duplicate.pk = None
+        duplicate.save()
+
+        session = self.client.session
+        WizardState(session)['apartment_unit'] = '2B'
+        session.save()
+        response = self.client.post(reverse('pathways-apply-signature'), data={'signature': 'Test User'}, secure=True)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Application.objects.count(), 2)
+        self.assertEqual(self.client.session['app_id'], first.id)
+        self.assertEqual(Application.objects.get(pk=first.pk).apartment_unit, '2B')
+
     def test_email_confirmation_sent_on_submit(self):
         # Verify pre-post state
         self.assertEqual(EmailCommunication.objects.all().count(), 0)
@@ -1131,4 +1208,114 @@ class SignatureViewTest(TestCase):
         self.assertIn('you can submit your documents', mail.outbox[0].body)
 
         # Verify email communication has been sent
-        self.assertTrue(EmailCommunication.objects.filter(email_address__iexact='example@example.com', discount_application_received=True).exists())
\ No newline at end of file
+        self.assertTrue(EmailCommunication.objects.filter(email_address__iexact='example@example.com', discount_application_received=True).exists())
+class ProgramMetricsViewTest(TestCase):
+    def setUp(self):
+        activate('en')
+        user = User.objects.create_user(username='staff', password='password')
+        self.client.force_login(user)
+        Referral.objects.create(program='Discount', facebook=True, custom_referral='Church')
+        Referral.objects.create(program='Discount', custom_referral='Church')
+        Referral.objects.create(program='Amnesty', pamphlet=True)
+
+    def test_view_redirects_without_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('pathways-metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_view_shows_referral_counts(self):
+        response = self.client.get(reverse('pathways-metrics'))
+        self.assertTemplateUsed(response, 'pathways/metrics.html')
+        self.assertEqual(response.context['discount_referral_facebook'], 1)
+        self.assertEqual(response.context['discount_referral_custom_referral_total'], 2)
+        self.assertEqual(response.context['amnesty_referral_pamphlet'], 1)
+        self.assertContains(response, 'Church (2)')
+
+@override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+class DocumentIncomeViewTest(TestCase):
+    def setUp(self):
+        activate('en')
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.app = createApplication(has_household_benefits=False)
+        session = self.client.session
+        session['active_app'] = True
+        session['app_id'] = self.app.id
+        session.save()
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('pathways-apply-documents-income'), secure=True)
+        self.assertTemplateUsed(response, 'pathways/docs/upload-form.html')
+        self.assertNotIn('direct_upload_url', response.context)
+
+    def test_multiple_files_saved_with_one_write_each(self):
+        pages = [SimpleUploadedFile(f'page{i}.pdf', b'%PDF-1.4 page', content_type='application/pdf') for i in range(3)]
+        with mock.patch('pathways.uploads.tasks.queue_document_processing') as queue_document_processing:
+            response = self.client.post(reverse('pathways-apply-documents-income'), data={'doc': pages}, secure=True)
+        self.assertRedirects(response, '/apply/documents-residence/', fetch_redirect_response=False)
+
+        docs = Document.objects.filter(application=self.app, doc_type='income')
+        self.assertEqual(len(docs), 3)
+        queue_document_processing.assert_called_once()
+        self.assertCountEqual(queue_document_processing.call_args[0][0], [doc.id for doc in docs])
+        self.assertEqual(len({doc.doc_file.name for doc in docs}), 3)
+        for doc in docs:
+            self.assertEqual(doc.doc_file.read(), b'%PDF-1.4 page')
+            doc.doc_file.close()
+            self.assertEqual(Document.history.filter(id=doc.id).count(), 1)
+
+    def test_invalid_file_rejects_whole_post(self):
+        pages = [
+            SimpleUploadedFile('page1.pdf', b'%PDF-1.4 page', content_type='application/pdf'),
+            SimpleUploadedFile('notes.txt', b'just some text', content_type='text/plain'),
+        ]
+        response = self.client.post(reverse('pathways-apply-documents-income'), data={'doc': pages}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('doc', 'content_type'))
+        self.assertFalse(Document.objects.exists())
+
+    def test_nothing_to_submit(self):
+        response = self.client.post(reverse('pathways-apply-documents-income'), data={}, secure=True)
+        self.assertRedirects(response, '/apply/documents-residence/', fetch_redirect_response=False)
+        self.assertFalse(Document.objects.exists())
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class LaterDocumentsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = createApplication(household_size=2, rent_or_own='rent')
+        createApplication(household_size=2, rent_or_own='rent', first_name='Other', phone_number='716-555-1234')
+
+    def setUp(self):
+        activate('en')
+
+    def post(self, **data):
+        form = {'first_name': 'TEST ', 'last_name': 'user', 'middle_initial': '', 'zip_code': '14202',
+                'phone_number': '(716) 555-5555', 'email_address': ''}
+        form.update(data)
+        return self.client.post(reverse('pathways-later-documents'), data=form, secure=True)
+
+    def test_match_ignores_case_and_phone_format(self):
+        response = self.post()
+        self.assertRedirects(response, '/apply/documents-overview/', fetch_redirect_response=False)
+        self.assertEqual(self.client.session['app_id'], self.app.id)
+
+    def test_no_match(self):
+        response = self.post(phone_number='716-555-0000')
+        self.assertRedirects(response, '/later-documents/no-match-found/', fetch_redirect_response=False)
+        self.assertNotIn('app_id', self.client.session)
+
+    def test_more_info_narrows_duplicates(self):
+        createApplication(household_size=3, rent_or_own='rent', street_address='9 Elm St', phone_number='7165555555')
+        response = self.post()
+        self.assertRedirects(response, '/later-documents/more-info-needed/', fetch_redirect_response=False)
+
+        response = self.client.post(reverse('pathways-later-documents-more-info'), data={
+            'rent_or_own': 'rent', 'apartment_unit': '', 'street_address': '123 main', 'household_size': 2,
+            }, secure=True)
+        self.assertRedirects(response, '/apply/documents-overview/', fetch_redirect_response=False)
+        self.assertEqual(self.client.session['app_id'], self.app.id)
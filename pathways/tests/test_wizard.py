@@ -0,0 +1,38 @@
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import TestCase
+from pathways.wizard import WizardState, WIZARD_SESSION_KEY, WIZARD_STATE_VERSION
+
+class WizardStateTest(TestCase):
+    def test_posted_strings_stored_typed(self):
+        session = SessionStore()
+        WizardState(session).update({'household_size': '3', 'has_household_benefits': 'False', 'income': 500})
+        self.assertEqual(session[WIZARD_SESSION_KEY], {
+            'v': WIZARD_STATE_VERSION,
+            'd': {'household_size': 3, 'has_household_benefits': False, 'income': 500.0},
+        })
+
+    def test_unchanged_answers_leave_session_unmodified(self):
+        session = SessionStore()
+        WizardState(session)['household_size'] = '2'
+        session.modified = False
+
+        state = WizardState(session)
+        state['household_size'] = 2
+        self.assertEqual(state['household_size'], 2)
+        self.assertFalse(session.modified)
+
+    def test_not_loaded_until_used(self):
+        session = SessionStore()
+        WizardState(session)
+        self.assertFalse(session.accessed)
+
+    def test_flat_session_keys_converted(self):
+        session = SessionStore()
+        session['household_size'] = '4'
+        session['has_job'] = 'True'
+        session['active_app'] = True
+
+        state = WizardState(session)
+        self.assertEqual(dict(state), {'household_size': 4, 'has_job': True})
+        state['has_job'] = False
+        self.assertEqual(session[WIZARD_SESSION_KEY]['d'], {'household_size': 4, 'has_job': False})
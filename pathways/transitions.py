@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.utils import timezone
+
+from pathways.models import Application, ForgivenessApplication
+from pathways.tasks import queue_automatic_emails
+
+# Email type sent when applications of each model are enrolled
+ENROLLED_EMAIL_TYPES = {
+    Application: 'discount_enroll',
+    ForgivenessApplication: 'amnesty_enroll',
+}
+
+def transitionStatus(queryset, status, user=None):
+    """Changes the status of every application in a queryset without calling save()
+
+    Statuses change with one UPDATE, the historical records are written with one
+    bulk insert, and emails to enrolled applicants are added to the outbox, so they
+    are only sent once the change commits. Applications already in the requested
+    status are left untouched.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Application or ForgivenessApplication queryset
+    status : str
+        new status, one of the model's status choices
+    user : User
+        optional user recorded as the history_user of the change
+
+    Returns
+    -------
+    int
+        number of applications whose status changed
+    """
+    model = queryset.model
+    with transaction.atomic():
+        # Locked by id, since Postgres cannot lock the grouped rows of an annotated admin queryset
+        locked = model.objects.filter(pk__in=queryset.values('pk'))
+        apps = list(locked.exclude(status=status).select_for_update())
+        if not apps:
+            return 0
+
+        now = timezone.now()
+        model.objects.filter(pk__in=[app.pk for app in apps]).update(status=status, updated_at=now)
+        for app in apps:
+            app.status = status
+            app.updated_at = now
+        model.history.bulk_history_create(apps, update=True, default_user=user, default_date=now)
+
+        if status == 'enrolled':
+            recipient_list = [(app.first_name, app.email_address) for app in apps]
+            queue_automatic_emails(ENROLLED_EMAIL_TYPES[model], recipient_list)
+    return len(apps)
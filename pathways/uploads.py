@@ -0,0 +1,250 @@
+import uuid
+from io import BytesIO
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+from simple_history.utils import bulk_create_with_history
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from pathways.models import Document, ACCEPTED_FILE_VALIDATOR, MIME_SNIFF_BYTES
+from pathways import tasks
+
+# Browsers upload documents under this prefix until the upload is finalized.
+# The bucket should expire objects under it, since abandoned uploads are never finalized.
+PENDING_UPLOAD_PREFIX = 'uploads/pending'
+
+# Extension of a finalized upload's document key for each accepted content type.
+# It comes from the sniffed content, never from the name of the applicant's file.
+UPLOAD_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'application/pdf': 'pdf',
+    'image/tiff': 'tif',
+}
+
+class StoredUploadHeader(BytesIO):
+    """The header bytes of an object in storage, sized like the whole object
+
+    Lets ACCEPTED_FILE_VALIDATOR check a stored upload without downloading all of it.
+    """
+    def __init__(self, header, size):
+        super().__init__(header)
+        self.size = size
+
+def getDocumentStorage():
+    """Returns the storage backend of Document.doc_file"""
+    return Document._meta.get_field('doc_file').storage
+
+def isDirectUploadEnabled():
+    """Returns whether browsers should upload documents straight to the S3 bucket"""
+    storage = getDocumentStorage()
+    return (settings.DOCUMENT_DIRECT_UPLOAD
+            and isinstance(storage, S3Boto3Storage)
+            and bool(storage.bucket_name))
+
+def _getKey(storage, name):
+    # pylint:disable=protected-access
+    return storage._normalize_name(storage._clean_name(name))
+
+def getSignedUrls(names):
+    """Returns URLs for many files in document storage, signed in one pass
+
+    storage.url() goes through the storage's bucket resource for every file.
+    On S3 every URL here is signed locally by one client instead.
+
+    Parameters
+    ----------
+    names : list
+        names of stored files, empty names are skipped
+
+    Returns
+    -------
+    dict
+        maps each name to its URL
+    """
+    storage = getDocumentStorage()
+    names = [name for name in names if name]
+    if not isinstance(storage, S3Boto3Storage) or not storage.querystring_auth or storage.custom_domain:
+        return {name: storage.url(name) for name in names}
+
+    client = storage.connection.meta.client
+    return {
+        name: client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': storage.bucket_name, 'Key': _getKey(storage, name)},
+            ExpiresIn=storage.querystring_expire,
+        )
+        for name in names
+    }
+
+def createPresignedUpload(app_id, content_type):
+    """Creates a presigned POST the browser can upload one document with
+
+    The policy only accepts the one key it was made for, under the application's
+    pending prefix, with the given content type and at most the accepted size.
+
+    Parameters
+    ----------
+    app_id : int
+        id of the Application in the applicant's session
+    content_type : str
+        MIME type of the file, one of ACCEPTED_FILE_VALIDATOR.content_types
+
+    Returns
+    -------
+    dict
+        'name' of the pending upload in storage, to pass to validatePendingUpload()
+        and createDocuments(), and the 'url' and form 'fields' to POST the file to
+    """
+    storage = getDocumentStorage()
+    name = f'{PENDING_UPLOAD_PREFIX}/{app_id}/{uuid.uuid4().hex}'
+    post = storage.connection.meta.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=_getKey(storage, name),
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            # boto3 adds a condition on the exact key as well
+            ['starts-with', '$key', _getKey(storage, f'{PENDING_UPLOAD_PREFIX}/{app_id}/')],
+            ['eq', '$Content-Type', content_type],
+            ['content-length-range', 1, ACCEPTED_FILE_VALIDATOR.max_size],
+        ],
+        ExpiresIn=settings.DOCUMENT_UPLOAD_EXPIRES,
+    )
+    return {'name': name, 'url': post['url'], 'fields': post['fields']}
+
+def validatePendingUpload(application, name):
+    """Checks a file the browser uploaded with createPresignedUpload()
+
+    The size comes from the stored object's metadata and the content type from
+    its first MIME_SNIFF_BYTES, so the object is never downloaded in full.
+    Uploads that fail ACCEPTED_FILE_VALIDATOR are deleted.
+
+    Parameters
+    ----------
+    application : Application instance
+        application in the applicant's session
+    name : str
+        name of the pending upload returned by createPresignedUpload()
+
+    Returns
+    -------
+    tuple
+        (etag, content_type) of the checked object, for createDocuments()
+
+    Raises
+    ------
+    ValidationError
+        if the upload is missing, belongs to another application, or fails ACCEPTED_FILE_VALIDATOR
+    """
+    if not name.startswith(f'{PENDING_UPLOAD_PREFIX}/{application.id}/') or '..' in name:
+        raise ValidationError(_("This upload does not belong to your application."), code='invalid')
+
+    storage = getDocumentStorage()
+    client = storage.connection.meta.client
+    pending_key = _getKey(storage, name)
+
+    try:
+        head = client.head_object(Bucket=storage.bucket_name, Key=pending_key)
+    except ClientError:
+        raise ValidationError(_("Your file could not be found. Please try uploading it again."), code='missing')
+
+    size = head['ContentLength']
+    header = b''
+    if size:
+        header = client.get_object(
+            Bucket=storage.bucket_name, Key=pending_key, Range=f'bytes=0-{MIME_SNIFF_BYTES - 1}'
+        )['Body'].read()
+
+    stored = StoredUploadHeader(header, size)
+    try:
+        ACCEPTED_FILE_VALIDATOR(stored)
+    except ValidationError:
+        client.delete_object(Bucket=storage.bucket_name, Key=pending_key)
+        raise
+    return head['ETag'], stored.sniffed_content_type
+
+def _copyUnchanged(client, bucket, source, key, etag):
+    """Copies an object only if it still has the ETag validatePendingUpload() returned"""
+    try:
+        copy = client.copy_object(
+            Bucket=bucket, Key=key, CopySource={'Bucket': bucket, 'Key': source}, CopySourceIfMatch=etag,
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', '412'):
+            raise
+        copy = None
+    # Presigned POSTs are single part uploads, so a copy keeps the ETag of its source.
+    # Checked as well for S3 compatible stores that ignore CopySourceIfMatch.
+    if copy is None or copy['CopyObjectResult']['ETag'] != etag:
+        raise ValidationError(
+            _("Your file changed while it was being saved. Please try uploading it again."), code='changed')
+
+def createDocuments(application, doc_type, files=(), pending=()):
+    """Creates an application's documents with one INSERT for all of them
+
+    Every document's storage key comes from path_and_rename() before its row exists,
+    so each document is written once and gets a single historical record.
+    Images are then downscaled by the process_documents task.
+
+    Parameters
+    ----------
+    application : Application instance
+        application the documents belong to
+    doc_type : str
+        type of the documents
+    files : list
+        validated files uploaded through the site
+    pending : list
+        (name, etag, content_type) tuples of uploads checked with validatePendingUpload()
+
+    Returns
+    -------
+    list
+        the new Document instances
+
+    Raises
+    ------
+    ValidationError
+        if a pending upload changed after it was checked, no document is created then
+    """
+    docs = [Document(application=application, doc_type=doc_type, doc_file=upload) for upload in files]
+
+    pending_keys, copied_keys = [], []
+    if pending:
+        storage = getDocumentStorage()
+        client = storage.connection.meta.client
+        for name, etag, content_type in pending:
+            doc = Document(application=application, doc_type=doc_type)
+            doc.doc_file.name = doc.doc_file.field.generate_filename(
+                doc, f'upload.{UPLOAD_EXTENSIONS[content_type]}')
+            pending_keys.append(_getKey(storage, name))
+            copied_keys.append(_getKey(storage, doc.doc_file.name))
+            try:
+                _copyUnchanged(client, storage.bucket_name, pending_keys[-1], copied_keys[-1], etag)
+            except (ClientError, ValidationError):
+                client.delete_objects(
+                    Bucket=storage.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in copied_keys], 'Quiet': True},
+                )
+                raise
+            docs.append(doc)
+
+    with transaction.atomic():
+        docs = bulk_create_with_history(docs, Document)
+        document_ids = [doc.pk for doc in docs if doc.pk]
+        if len(document_ids) < len(docs):
+            # Only some databases set primary keys on bulk created objects
+            document_ids = list(Document.objects.filter(
+                doc_file__in=[doc.doc_file.name for doc in docs]
+            ).values_list('id', flat=True))
+        tasks.queue_document_processing(document_ids)
+
+    if pending_keys:
+        client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in pending_keys], 'Quiet': True},
+        )
+    return docs
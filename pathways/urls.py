@@ -87,6 +87,8 @@ urlpatterns = [
         name='pathways-apply-documents-income'),
     path('apply/documents-residence/', views.DocumentResidenceView.as_view(),
         name='pathways-apply-documents-residence'),
+    path('apply/documents-upload/', views.DocumentUploadView.as_view(),
+        name='pathways-apply-documents-upload'),
     path('apply/confirmation/', views.ConfirmationView.as_view(),
         name='pathways-apply-confirmation'),
     path('later-documents/', views.LaterDocumentsView.as_view(),
@@ -1,15 +1,23 @@
-import locale
 import datetime
 
 from django.shortcuts import render, redirect
+from django.http import JsonResponse
+from django.urls import reverse
 from django.views.generic.edit import FormView
-from django.views.generic import TemplateView
-from django.core.exceptions import ObjectDoesNotExist
+from django.views.generic import TemplateView, View
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils import timezone
 
-from pathways.models import Application, Document, ForgivenessApplication, Referral
+from pathways.models import Application, ForgivenessApplication, Referral, ACCEPTED_FILE_VALIDATOR
 from pathways import forms
+from pathways import eligibility
 from pathways import helpers
+from pathways import income
+from pathways import metrics
+from pathways import uploads
+from pathways import wizard
 
 def handler404(request, exception):
     del exception # unused
@@ -42,6 +50,13 @@ class FormToSessionView(FormView):
             self.request.session[field.name] = form.cleaned_data[field.name]
         return super().form_valid(form)
 
+class FormToWizardView(FormView):
+    """Saves a discount application step's answers to the applicant's WizardState"""
+    def form_valid(self, form):
+        answers = wizard.getWizardState(self.request)
+        answers.update({field.name: form.cleaned_data[field.name] for field in form})
+        return super().form_valid(form)
+
 class ClearSessionView(TemplateView):
     def dispatch(self, request, *args, **kwargs):
         for key in list(request.session.keys()):
@@ -49,6 +64,61 @@ class ClearSessionView(TemplateView):
         return super(ClearSessionView, self).dispatch(request, *args, **kwargs)
     
 
+def getResubmittedApplication(model, answers):
+    """Loads an applicant's answers into the application they resubmit, or into a new one
+
+    A resubmission has the same model.FINGERPRINT_FIELDS answers as an earlier
+    application, found with one probe of the indexed fingerprint column.
+    Duplicates left from before the fingerprint existed resolve to the oldest.
+
+    Parameters
+    ----------
+    model : Application or ForgivenessApplication
+    answers : WizardState or SessionBase
+        the applicant's answers, read from the session
+
+    Returns
+    -------
+    model instance
+        unsaved changes of the application to save
+    """
+    submitted = model()
+    for field in model._meta.get_fields():
+        if field.name in answers:
+            setattr(submitted, field.name, answers[field.name])
+
+    fingerprint = helpers.getFingerprint(submitted, model.FINGERPRINT_FIELDS)
+    app = model.objects.filter(fingerprint=fingerprint).order_by('id').first()
+    if app is None:
+        return submitted
+
+    for field in model._meta.get_fields():
+        if field.name == 'email_address' and app.email_address != '':
+            continue
+        if field.name in answers:
+            setattr(app, field.name, answers[field.name])
+    return app
+
+def setIncomeSources(answers, income_sources):
+    """Saves an applicant's income sources and the annual income they add up to
+
+    Parameters
+    ----------
+    answers : WizardState
+    income_sources : list
+        income source dicts from pathways/income.py
+    """
+    answers.update({'income_sources': income_sources, 'annual_income': income.getAnnualIncome(income_sources)})
+
+def getIncomeSources(answers):
+    """Returns the income sources an applicant entered so far"""
+    if 'income_sources' in answers:
+        return list(answers['income_sources'])
+    if 'annual_income' in answers:
+        # Sessions started before income sources were kept only have the total
+        return [income.makeIncomeSource('estimate', answers['annual_income'], 'annually')]
+    return []
+
 # Create your views here.
 class HomeView(ExtraContextView):
     template_name = 'pathways/home.html'
@@ -165,28 +235,11 @@ class ForgiveReviewApplicationView(FormView):
 
     def form_valid(self, form):
         # Get or create Forgiveness application, load data from session, and save
-        app = None
-        try:
-            app = ForgivenessApplication.objects.get(
-                first_name=self.request.session['first_name'],
-                last_name=self.request.session['last_name'],
-                street_address=self.request.session['street_address'],
-                zip_code=self.request.session['zip_code'],
-                phone_number=self.request.session['phone_number'],
-            )
-            for field in ForgivenessApplication._meta.get_fields():
-                if field.name == 'email_address' and app.email_address != '':
-                    continue
-                if field.name in self.request.session:
-                    setattr(app, field.name, self.request.session[field.name])
-                    
-        except ObjectDoesNotExist:
-            app = ForgivenessApplication()
-            for field in ForgivenessApplication._meta.get_fields():
-                if field.name in self.request.session:
-                    setattr(app, field.name, self.request.session[field.name])
-
-        app.save()
+        app = getResubmittedApplication(ForgivenessApplication, self.request.session)
+
+        # Outbox emails are written in the same transaction and dispatched on commit
+        with transaction.atomic():
+            app.save()
         self.request.session['forgive_step'] = 'submit_application'
         return super().form_valid(form)
 
@@ -204,7 +257,7 @@ class ForgiveConfirmationView(ExtraContextView):
 class NonResidentView(ExtraContextView):
     template_name = 'pathways/apply/non-resident.html'
 
-class HouseholdSizeView(FormToSessionView):
+class HouseholdSizeView(FormToWizardView):
     template_name = 'pathways/apply/household-size.html'
     form_class = forms.HouseholdSizeForm
     success_url = '/apply/household-benefits/'
@@ -214,7 +267,7 @@ class HouseholdSizeView(FormToSessionView):
         return super().form_valid(form)
 
 
-class HouseholdBenefitsView(DispatchView, FormToSessionView):
+class HouseholdBenefitsView(DispatchView, FormToWizardView):
     template_name = 'pathways/apply/household-benefits.html'
     form_class = forms.HouseholdBenefitsForm
     success_url = '/apply/household-contributors/'
@@ -225,7 +278,7 @@ class HouseholdBenefitsView(DispatchView, FormToSessionView):
         return super().form_valid(form)
 
 
-class HouseholdContributorsView(DispatchView, FormToSessionView):
+class HouseholdContributorsView(DispatchView, FormToWizardView):
     template_name = 'pathways/apply/household-contributors.html'
     form_class = forms.HouseholdContributorsForm
     success_url = '/apply/income/'
@@ -234,25 +287,25 @@ class HouseholdContributorsView(DispatchView, FormToSessionView):
         if (int(form.cleaned_data['household_contributors']) == 1):
             self.success_url = '/apply/job-status/'
         else:
-            self.request.session['income_method'] = 'estimate'
+            wizard.getWizardState(self.request)['income_method'] = 'estimate'
         return super().form_valid(form)
 
-class JobStatusView(DispatchView, FormToSessionView):
+class JobStatusView(DispatchView, FormToWizardView):
     template_name = 'pathways/apply/job-status.html'
     form_class = forms.JobStatusForm
     success_url = '/apply/self-employment/'
 
-class SelfEmploymentView(DispatchView, FormToSessionView):
+class SelfEmploymentView(DispatchView, FormToWizardView):
     template_name = 'pathways/apply/self-employment.html'
     form_class = forms.SelfEmploymentForm
     success_url = '/apply/other-income-sources/'
 
     def form_valid(self, form):
-        if self.request.session['has_job'] == 'True' or form.cleaned_data['is_self_employed'] == 'True':
+        if wizard.getWizardState(self.request)['has_job'] or form.cleaned_data['is_self_employed'] == 'True':
             self.success_url = '/apply/number-of-jobs/'
         return super().form_valid(form)
 
-class NumberOfJobsView(FormToSessionView, DispatchView):
+class NumberOfJobsView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/number-of-jobs.html'
     form_class = forms.NumberOfJobsForm
     success_url = '/apply/income/'
@@ -261,15 +314,15 @@ class NumberOfJobsView(FormToSessionView, DispatchView):
         if (int(form.cleaned_data['number_of_jobs']) == 1):
             self.success_url = '/apply/income-methods/'
         else:
-            self.request.session['income_method'] = 'estimate'
+            wizard.getWizardState(self.request)['income_method'] = 'estimate'
         return super().form_valid(form)
 
-class IncomeMethodsView(FormToSessionView, DispatchView):
+class IncomeMethodsView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/income-methods.html'
     form_class = forms.IncomeMethodsForm
     success_url = '/apply/income/'
 
-class IncomeView(FormToSessionView, DispatchView):
+class IncomeView(FormToWizardView, DispatchView):
     success_url = '/apply/other-income-sources/'
 
     def get_form_class(self):
@@ -279,44 +332,27 @@ class IncomeView(FormToSessionView, DispatchView):
             'hourly': forms.HourlyIncomeForm,
             'estimate': forms.EstimateIncomeForm
         }
-        return income_forms[self.request.session['income_method']]
+        return income_forms[wizard.getWizardState(self.request)['income_method']]
 
     def get_template_names(self):
         """Returns template_name based income method"""
-        income_method = self.request.session['income_method']
+        income_method = wizard.getWizardState(self.request)['income_method']
         self.template_name = f'pathways/apply/{income_method}-income.html'
         
         return super().get_template_names()
 
     def form_valid(self, form):
-        """Calculates annual income based on income and pay_period"""
-        income = form.cleaned_data['income']
-        pay_period = form.cleaned_data['pay_period']
-
-        annual_pay_multipliers = {
-            'weekly': 52, 
-            'biweekly': 25, 
-            'semimonthly': 24,
-            'monthly': 12,
-            'annually': 1
-        }
+        """Replaces the applicant's job income with the one entered"""
+        answers = wizard.getWizardState(self.request)
+        job_income = income.makeIncomeSource(
+            answers['income_method'], form.cleaned_data['income'], form.cleaned_data['pay_period']
+        )
+        setIncomeSources(answers, [job_income])
 
-        if pay_period in annual_pay_multipliers:
-            # Not hourly
-            annual_income = income * annual_pay_multipliers[pay_period]
-        else:
-            # Hourly, therefore pay_period is int
-            # hourly wage * hours per week * 52 weeks
-            annual_income = income * pay_period * 52
-        
-        self.request.session['income'] = income
-        self.request.session['pay_period'] = pay_period
-        self.request.session['annual_income'] = annual_income
-        
         return super().form_valid(form) 
 
 
-class OtherIncomeSourcesView(DispatchView, FormToSessionView):
+class OtherIncomeSourcesView(DispatchView, FormToWizardView):
     template_name = 'pathways/apply/other-income-sources.html'
     form_class = forms.OtherIncomeSourcesForm
     success_url = '/apply/review-eligibility/'
@@ -324,71 +360,57 @@ class OtherIncomeSourcesView(DispatchView, FormToSessionView):
     def form_valid(self, form):
         if form.cleaned_data['has_other_income'] == 'True':
             self.success_url = '/apply/non-job-income/'
+        else:
+            answers = wizard.getWizardState(self.request)
+            income_sources = getIncomeSources(answers)
+            if any(source['type'] == 'non_job' for source in income_sources):
+                setIncomeSources(answers, [source for source in income_sources if source['type'] != 'non_job'])
         return super().form_valid(form)
 
 
-class NonJobIncomeView(FormToSessionView, DispatchView):
+class NonJobIncomeView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/non-job-income.html'
     form_class = forms.NonJobIncomeForm
     success_url = '/apply/review-eligibility/'
 
     def form_valid(self, form):
-        if 'annual_income' in self.request.session.keys():
-            # Applicant has already entered job-based income
-            # Their (monthly) non_job_income will be added to their existing annual income
-            annual_income = self.request.session['annual_income']
-            non_job_income = form.cleaned_data['non_job_income']
-            self.request.session['annual_income'] = annual_income + (12 * non_job_income)
-        else:
-            # Applicant does NOT have job-based income, therefore only income is non-job-based
-            self.request.session['annual_income'] = form.cleaned_data['non_job_income']
+        # Monthly non-job income is added to any job income, replacing what was entered before.
+        # Applicants without a job are assessed on 12 months of it, like those with one.
+        answers = wizard.getWizardState(self.request)
+        income_sources = [source for source in getIncomeSources(answers) if source['type'] != 'non_job']
+        income_sources.append(income.makeNonJobIncomeSource(form.cleaned_data['non_job_income']))
+        setIncomeSources(answers, income_sources)
         return super().form_valid(form)
 
 
-class ReviewEligibilityView(DispatchView):
-    template_name = 'pathways/apply/review-eligibility.html'
+class WizardContextView(DispatchView):
+    """Shows the applicant's WizardState answers as `wizard` in the template
 
+    Amounts are written with the currency template filter.
+    """
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        locale.setlocale( locale.LC_ALL, '' )
-        
-        # Income
-        context['income_formatted'] = '$0'
-        if 'income' in self.request.session.keys():
-            context['income_formatted'] = '${:,.0f}'.format(self.request.session['income'])
-            
-        
-        # Non job income
-        context['non_job_income_formatted'] = '$0'
-        if 'non_job_income' in self.request.session.keys():
-            context['non_job_income_formatted'] = '${:,.0f}'.format(self.request.session['non_job_income'])
+        context['wizard'] = wizard.getWizardState(self.request)
+        return context
 
-        # Annual income
-        context['annual_income_formatted'] = '$0'
-        if 'annual_income' in self.request.session.keys():
-            context['annual_income_formatted'] = '${:,.0f}'.format(self.request.session['annual_income'])            
+class ReviewEligibilityView(WizardContextView):
+    template_name = 'pathways/apply/review-eligibility.html'
 
-        return context
-        
 # Step 6
-class EligibilityView(DispatchView):
+class EligibilityView(WizardContextView):
     template_name = 'pathways/apply/eligibility.html'
     
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        income_thresholds = helpers.getIncomeThresholds()
+        answers = context['wizard']
 
-        if self.request.session['has_household_benefits'] == 'True':
+        if answers['has_household_benefits']:
             context['is_eligible'] = True
         else:
-            if 'annual_income' in self.request.session:
-                annual_income = int(self.request.session['annual_income'])
-            else:
-                annual_income = 0
-            max_income = income_thresholds[int(self.request.session['household_size'])]
-            context['is_eligible'] = annual_income <= max_income
-            locale.setlocale( locale.LC_ALL, '' )
-            context['max_income'] = '${:,.0f}'.format(max_income)
+            annual_income = int(answers.get('annual_income', 0))
+            household_size = answers['household_size']
+            context['is_eligible'] = eligibility.isIncomeEligible(household_size, annual_income)
+            context['max_income'] = eligibility.getThresholdTable().income[household_size]
         return context
 
 # Step 7
@@ -396,7 +418,7 @@ class AdditionalQuestionsView(DispatchView):
     template_name = 'pathways/apply/additional-questions.html'
 
 # Step 8
-class ResidentInfoView(FormToSessionView, DispatchView):
+class ResidentInfoView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/resident-info.html'
     form_class = forms.ResidentInfoForm
     success_url = '/apply/address/'
@@ -406,61 +428,42 @@ class ResidentInfoView(FormToSessionView, DispatchView):
         if form.cleaned_data['account_holder'] in ['landlord', 'other']:
             self.success_url = '/apply/account-holder/'
         else:
-            self.request.session['account_first'] = form.cleaned_data['first_name']
-            self.request.session['account_last'] = form.cleaned_data['last_name']
-            self.request.session['account_middle'] = form.cleaned_data['middle_initial']
+            wizard.getWizardState(self.request).update({
+                'account_first': form.cleaned_data['first_name'],
+                'account_last': form.cleaned_data['last_name'],
+                'account_middle': form.cleaned_data['middle_initial'],
+            })
         return super().form_valid(form)
 
 # Step 9
-class AccountHolderView(FormToSessionView, DispatchView):
+class AccountHolderView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/info-form.html'
     form_class = forms.AccountHolderForm
     success_url = '/apply/address/'
     extra_context = {'card_title': form_class.card_title}
 
-class AddressView(FormToSessionView, DispatchView):
+class AddressView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/info-form.html'
     form_class = forms.AddressForm
     success_url = '/apply/contact-info/'
     extra_context = {'card_title': form_class.card_title}
 
-class ContactInfoView(FormToSessionView, DispatchView):
+class ContactInfoView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/info-form.html'
     form_class = forms.ContactInfoForm
     success_url = '/apply/review-application/'
     extra_context = {'card_title': form_class.card_title}
 
-class AccountNumberView(FormToSessionView, DispatchView):
+class AccountNumberView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/info-form.html'
     form_class = forms.AccountNumberForm
     success_url = '/apply/review-application/'
     extra_context = {'card_title': form_class.card_title, 'isAccountNumberView':True}
 
-class ReviewApplicationView(DispatchView):
+class ReviewApplicationView(WizardContextView):
     template_name = 'pathways/apply/review-application.html'
 
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(**kwargs)
-        locale.setlocale( locale.LC_ALL, '' )
-        # Income
-        context['income_formatted'] = '$0'
-        if 'income' in self.request.session.keys():
-            context['income_formatted'] = '${:,.0f}'.format(self.request.session['income'])
-            
-        
-        # Non job income
-        context['non_job_income_formatted'] = '$0'
-        if 'non_job_income' in self.request.session.keys():
-            context['non_job_income_formatted'] = '${:,.0f}'.format(self.request.session['non_job_income'])
-
-        # Annual income
-        context['annual_income_formatted'] = '$0'
-        if 'annual_income' in self.request.session.keys():
-            context['annual_income_formatted'] = '${:,.0f}'.format(self.request.session['annual_income'])  
-
-        return context
-
-class LegalView(FormToSessionView, DispatchView):
+class LegalView(FormToWizardView, DispatchView):
     template_name = 'pathways/apply/legal.html'
     form_class = forms.LegalForm
     success_url = '/apply/refer/'
@@ -485,40 +488,19 @@ class SignatureView(FormView, DispatchView):
     success_url = '/apply/documents-overview/'
 
     def form_valid(self, form):
-        self.request.session['signature'] = form.cleaned_data['signature']
+        answers = wizard.getWizardState(self.request)
         # Removed option of providing account number so people don't think it is absolutely required
-        self.request.session['has_account_number'] = 'False'
+        answers.update({'signature': form.cleaned_data['signature'], 'has_account_number': False})
 
         # Create new application, load data from session, and save
-        app = None
-        try:
-            app = Application.objects.get(
-                household_size=self.request.session['household_size'],
-                has_household_benefits=self.request.session['has_household_benefits'],
-                first_name=self.request.session['first_name'],
-                last_name=self.request.session['last_name'],
-                rent_or_own=self.request.session['rent_or_own'],
-                street_address=self.request.session['street_address'],
-                zip_code=self.request.session['zip_code'],
-                phone_number=self.request.session['phone_number'],
-                account_holder=self.request.session['account_holder'],
-                account_first=self.request.session['account_first'],
-                account_last=self.request.session['account_last'],
-                legal_agreement=self.request.session['legal_agreement']
-            )
-            for field in Application._meta.get_fields():
-                if field.name == 'email_address' and app.email_address != '':
-                    continue
-                if field.name in self.request.session:
-                    setattr(app, field.name, self.request.session[field.name])
-
-        except ObjectDoesNotExist:
-            app = Application()
-            for field in Application._meta.get_fields():
-                if field.name in self.request.session:
-                    setattr(app, field.name, self.request.session[field.name])
-        
-        app.save()
+        app = getResubmittedApplication(Application, answers)
+        if app.income_sources:
+            # The session holds a float, the stored amount is computed exactly from its sources
+            app.annual_income = income.getAnnualIncome(app.income_sources)
+
+        # Outbox emails are written in the same transaction and dispatched on commit
+        with transaction.atomic():
+            app.save()
         self.request.session['app_id'] = app.id
 
         return super().form_valid(form)
@@ -537,18 +519,41 @@ class FormToDocumentView(FormView):
     form_class = forms.DocumentForm
     template_name = 'pathways/docs/upload-form.html'
     
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if uploads.isDirectUploadEnabled():
+            context['direct_upload_url'] = reverse('pathways-apply-documents-upload')
+        return context
+
     def form_valid(self, form):
-        """Creates new Document object using form data and attaches to current Application"""
-        if form.cleaned_data['doc']:
-            app = Application.objects.filter(id = self.request.session['app_id'])[0]
-            doc = Document()
-            doc.application = app
-            doc.doc_type = self.doc_type
-            doc.save()
-            setattr(doc, 'doc_file', form.cleaned_data['doc'])
-            doc.save()
+        """Creates new Document objects using form data and attaches them to current Application
+
+        Files uploaded straight to storage with a presigned POST are checked first.
+        All documents of the post are then created with a single INSERT.
+        """
+        if form.cleaned_data['doc'] or form.cleaned_data['uploads']:
+            app = Application(id = self.request.session['app_id'])
+            try:
+                pending = [(name,) + uploads.validatePendingUpload(app, name)
+                           for name, _ in form.cleaned_data['uploads']]
+                uploads.createDocuments(app, self.doc_type, files=form.cleaned_data['doc'], pending=pending)
+            except ValidationError as e:
+                form.add_error('doc', e)
+                return self.form_invalid(form)
         return super().form_valid(form)
-        
+
+class DocumentUploadView(View):
+    """Returns a presigned POST for uploading a document straight to storage"""
+    def post(self, request):
+        if 'active_app' not in request.session or 'app_id' not in request.session \
+                or not uploads.isDirectUploadEnabled():
+            return JsonResponse({}, status=403)
+        content_type = request.POST.get('content_type', '')
+        if content_type not in ACCEPTED_FILE_VALIDATOR.content_types:
+            # The browser uploads the file through the site instead, where it gets a form error
+            return JsonResponse({}, status=400)
+        return JsonResponse(uploads.createPresignedUpload(request.session['app_id'], content_type))
+
 
 class DocumentIncomeView(FormToDocumentView, DispatchView):
     success_url = '/apply/documents-residence/'
@@ -591,13 +596,13 @@ class LaterDocumentsView(FormView, ClearSessionView):
     def form_valid(self, form):
         self.request.session['is_later_docs'] = True
 
-        # Get list of possible application
-        app_list = Application.objects.filter(
-                first_name__iexact = form.cleaned_data['first_name'],
-                last_name__iexact = form.cleaned_data['last_name'],
-                zip_code = form.cleaned_data['zip_code'],
-                phone_number = form.cleaned_data['phone_number']
-                )
+        # Get list of possible application through the indexed lookup key
+        app_list = Application.objects.filter(lookup_key = helpers.getLookupKey(
+                form.cleaned_data['first_name'],
+                form.cleaned_data['last_name'],
+                form.cleaned_data['zip_code'],
+                form.cleaned_data['phone_number']
+                ))
                 
         if form.cleaned_data['middle_initial'] != '':
             app_list = app_list.filter(middle_initial__iexact = form.cleaned_data['middle_initial'])
@@ -605,14 +610,15 @@ class LaterDocumentsView(FormView, ClearSessionView):
         if form.cleaned_data['email_address'] != '':
             app_list = app_list.filter(email_address__iexact = form.cleaned_data['email_address'])
 
-        if len(app_list) == 0:
+        match_count, app_id = helpers.matchApplications(app_list)
+
+        if match_count == 0:
             # No matching application found
             self.success_url = '/later-documents/no-match-found/'
 
-        elif len(app_list) == 1:
+        elif match_count == 1:
             # Matching application successfully found
-            app = app_list[0]
-            self.request.session['app_id'] = app.id
+            self.request.session['app_id'] = app_id
             self.request.session['active_app'] = True
 
         else:
@@ -645,10 +651,12 @@ class MoreDocumentInfoRequiredView(FormView):
     def form_valid(self, form):
         # Get list of possible application
         app_list = Application.objects.filter(
-                first_name__iexact = self.request.session['first_name'],
-                last_name__iexact = self.request.session['last_name'],
-                zip_code = self.request.session['zip_code'],
-                phone_number = self.request.session['phone_number'],
+                lookup_key = helpers.getLookupKey(
+                    self.request.session['first_name'],
+                    self.request.session['last_name'],
+                    self.request.session['zip_code'],
+                    self.request.session['phone_number']
+                    ),
                 rent_or_own = form.cleaned_data['rent_or_own'],
                 street_address__icontains = form.cleaned_data['street_address'],
                 household_size = form.cleaned_data['household_size']
@@ -657,10 +665,11 @@ class MoreDocumentInfoRequiredView(FormView):
         if form.cleaned_data['apartment_unit'] != '':
             app_list = app_list.filter(apartment_unit__iexact = form.cleaned_data['apartment_unit'])
 
-        if len(app_list) == 1:
+        match_count, app_id = helpers.matchApplications(app_list)
+
+        if match_count == 1:
             # Matching application successfully found
-            app = app_list[0]
-            self.request.session['app_id'] = app.id
+            self.request.session['app_id'] = app_id
             self.request.session['active_app'] = True
         else:
             # No matching application found
@@ -673,41 +682,19 @@ class ProgramMetricsView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Application Totals
-        context['total_discount'] = Application.objects.count()
-        context['total_amnesty'] = ForgivenessApplication.objects.count()
-
-        # Discount Referrals 
-        discount_referrals = Referral.objects.filter(program='Discount')
-        context['discount_referral_facebook'] = discount_referrals.filter(facebook=True).count()
-        context['discount_referral_google'] = discount_referrals.filter(google=True).count()
-        context['discount_referral_twitter'] = discount_referrals.filter(twitter=True).count()
-        context['discount_referral_linkedin'] = discount_referrals.filter(linkedin=True).count()
-        context['discount_referral_bill'] = discount_referrals.filter(bill=True).count()
-        context['discount_referral_ad'] = discount_referrals.filter(ad=True).count()
-        context['discount_referral_pamphlet'] = discount_referrals.filter(pamphlet=True).count()
-        context['discount_referral_word_of_mouth'] = discount_referrals.filter(word_of_mouth=True).count()
-        context['discount_referral_custom_referral_total'] = discount_referrals.exclude(custom_referral='').count()
-        discount_custom_referral_objects = list(discount_referrals.exclude(custom_referral=''))
-        discount_custom_referral_strings = []
-        for ref in discount_custom_referral_objects:
-            discount_custom_referral_strings.append(ref.custom_referral)
-        context['discount_referral_custom_referrals'] = discount_custom_referral_strings
-
-        # Amnesty Referrals
-        amnesty_referrals = Referral.objects.filter(program='Amnesty')
-        context['amnesty_referral_facebook'] = amnesty_referrals.filter(facebook=True).count()
-        context['amnesty_referral_google'] = amnesty_referrals.filter(google=True).count()
-        context['amnesty_referral_twitter'] = amnesty_referrals.filter(twitter=True).count()
-        context['amnesty_referral_linkedin'] = amnesty_referrals.filter(linkedin=True).count()
-        context['amnesty_referral_bill'] = amnesty_referrals.filter(bill=True).count()
-        context['amnesty_referral_ad'] = amnesty_referrals.filter(ad=True).count()
-        context['amnesty_referral_pamphlet'] = amnesty_referrals.filter(pamphlet=True).count()
-        context['amnesty_referral_word_of_mouth'] = amnesty_referrals.filter(word_of_mouth=True).count()
-        context['amnesty_referral_custom_referral_total'] = amnesty_referrals.exclude(custom_referral='').count()
-        amnesty_custom_referral_objects = list(amnesty_referrals.exclude(custom_referral=''))
-        amnesty_custom_referral_strings = []
-        for ref in amnesty_custom_referral_objects:
-            amnesty_custom_referral_strings.append(ref.custom_referral)
-        context['amnesty_referral_custom_referrals'] = amnesty_custom_referral_strings
+        # Application and referral totals are precomputed in ProgramMetricsSnapshot
+        snapshot_counts = metrics.getSnapshotCounts()
+        context['total_discount'] = snapshot_counts['Discount']['application_total']
+        context['total_amnesty'] = snapshot_counts['Amnesty']['application_total']
+
+        # Recent applications use the indexed created_at column
+        recent_since = timezone.now() - datetime.timedelta(days=30)
+        context['recent_discount'] = Application.objects.filter(created_at__gte=recent_since).count()
+        context['recent_amnesty'] = ForgivenessApplication.objects.filter(created_at__gte=recent_since).count()
+
+        for program in metrics.REFERRAL_PROGRAMS:
+            prefix = program.lower()
+            for key in metrics.REFERRAL_CHANNELS + ['custom_referral_total']:
+                context[f'{prefix}_referral_{key}'] = snapshot_counts[program][key]
+            context[f'{prefix}_referral_custom_referrals'] = metrics.iterCustomReferrals(program)
         return context
\ No newline at end of file
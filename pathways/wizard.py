@@ -0,0 +1,128 @@
+from collections.abc import Mapping
+
+# Session key holding the discount application wizard's answers
+WIZARD_SESSION_KEY = 'wizard'
+
+# Bump when the stored layout changes, older states are converted by WizardState._load()
+WIZARD_STATE_VERSION = 1
+
+# Answers of the discount application wizard, with the type each is stored as.
+# Choice fields post strings, so their values are converted once when saved.
+FIELD_TYPES = {
+    'household_size': int,
+    'has_household_benefits': bool,
+    'household_contributors': int,
+    'has_job': bool,
+    'is_self_employed': bool,
+    'number_of_jobs': int,
+    'income_method': str,
+    'income': float,
+    'pay_period': None,
+    'annual_income': float,
+    'income_sources': list,
+    'has_other_income': bool,
+    'non_job_income': float,
+    'first_name': str,
+    'last_name': str,
+    'middle_initial': str,
+    'rent_or_own': str,
+    'account_holder': str,
+    'account_first': str,
+    'account_last': str,
+    'account_middle': str,
+    'street_address': str,
+    'apartment_unit': str,
+    'zip_code': str,
+    'phone_number': str,
+    'email_address': str,
+    'account_number': str,
+    'has_account_number': bool,
+    'legal_agreement': bool,
+    'signature': str,
+}
+
+def toPython(name, value):
+    """Converts a posted answer to the type in FIELD_TYPES
+
+    Parameters
+    ----------
+    name : str
+        field name in FIELD_TYPES
+    value
+        cleaned form value, or a value stored by an earlier version
+
+    Returns
+    -------
+    int, float, bool, str or None
+        pay_period is kept as given, since it is an int for hourly income
+        and a string otherwise
+    """
+    field_type = FIELD_TYPES[name]
+    if value is None or field_type is None or isinstance(value, field_type):
+        return value
+    if field_type is bool:
+        return value in (True, 'True', 'true', 'on', '1')
+    return field_type(value)
+
+class WizardState(Mapping):
+    """Typed answers of the discount application wizard
+
+    All answers live in one dict under WIZARD_SESSION_KEY rather than one session
+    key each. The dict is read from the session the first time an answer is used
+    and only put back when an answer changes, so a step that changes nothing
+    leaves the session unmodified.
+
+    Sessions started before the state existed kept every answer as its own string
+    key. They are read as version 0 and converted on the first change.
+    """
+    def __init__(self, session):
+        self._session = session
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            stored = self._session.get(WIZARD_SESSION_KEY)
+            if stored and stored.get('v') == WIZARD_STATE_VERSION:
+                self._data = stored['d']
+            else:
+                self._data = {
+                    name: toPython(name, self._session[name])
+                    for name in FIELD_TYPES if name in self._session
+                }
+        return self._data
+
+    def __getitem__(self, name):
+        return self._load()[name]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def update(self, answers):
+        """Saves answers, writing the session only if one of them changed
+
+        Parameters
+        ----------
+        answers : dict
+            maps names in FIELD_TYPES to their values
+        """
+        data = self._load()
+        changed = False
+        for name, value in answers.items():
+            value = toPython(name, value)
+            if name not in data or data[name] != value:
+                data[name] = value
+                changed = True
+        if changed:
+            self._session[WIZARD_SESSION_KEY] = {'v': WIZARD_STATE_VERSION, 'd': data}
+
+    def __setitem__(self, name, value):
+        self.update({name: value})
+
+def getWizardState(request):
+    """Returns the request's WizardState, created on first use"""
+    if not hasattr(request, 'wizard_state'):
+        request.wizard_state = WizardState(request.session)
+    return request.wizard_state